@@ -159,6 +159,96 @@ LOGGING = {
 }
 
 REPORT_TEMPLATE_PATH = os.path.join(BASE_DIR, '2016_Template.docx')
+
+# Additional named report templates, e.g. {'customer-a': os.path.join(BASE_DIR, 'templates', 'customer_a.docx')},
+# and which one each business area (by name) uses; everything else uses REPORT_TEMPLATE_PATH ('default').
+# Templates are parsed once per process and re-read when the file changes.
+REPORT_TEMPLATES = {}
+REPORT_TEMPLATE_BY_BUSINESS_AREA = {}
+
+# Report jobs
+#
+# Reports and supporting data packages are built as queued jobs so long builds don't tie up request workers.
+# By default jobs run on REPORT_JOB_WORKERS in-process threads; set REPORT_JOB_RUNNER to 'external' to only
+# queue them and run `python manage.py process_report_jobs` as a separate worker process instead.
+REPORT_JOB_RUNNER = 'thread'
+REPORT_JOB_WORKERS = 2
+REPORT_JOB_OUTPUT_DIR = os.path.join(BASE_DIR, 'data', 'report_jobs')
+REPORT_JOB_RETENTION_HOURS = 24  # Finished jobs and their output are removed after this many hours
+REPORT_JOB_STALE_SECONDS = 300  # Unfinished jobs whose process sends no heartbeat this long are failed or taken over
+
+# Rendered test case fragments are cached on disk so regenerating a report only re-renders the test cases that
+# changed since the last run.
+REPORT_FRAGMENT_CACHE_ENABLED = True
+REPORT_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # In seconds
+
+# Finished reports and supporting data packages are kept on disk and served again until the mission changes.
+REPORT_ARTIFACT_CACHE_DIR = os.path.join(BASE_DIR, 'data', 'cache', 'report_artifacts')
+REPORT_ARTIFACT_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used artifacts are evicted above this size
+
+# At most REPORT_BUILD_CONCURRENCY reports and data packages are built at once (across all processes on the host;
+# 0 for no limit), the rest wait their turn. Concurrent requests for the same output share a single build. Both
+# are coordinated through lock files in REPORT_BUILD_LOCK_DIR. Reports downloaded directly (rather than queued as
+# jobs) wait at most REPORT_BUILD_WAIT_TIMEOUT seconds for a slot; past that they get a 503 asking to retry. Only
+# the wait is limited: supporting data packages start downloading as soon as their build starts.
+REPORT_BUILD_CONCURRENCY = 2
+REPORT_BUILD_WAIT_TIMEOUT = 30
+REPORT_BUILD_LOCK_DIR = os.path.join(BASE_DIR, 'data', 'cache', 'report_locks')
+
+# Supporting data packages: files that compress well are deflated in blocks on this many threads (None: one per CPU);
+# already compressed files (screenshots, gzip'd pcaps, archives) are stored as-is.
+REPORT_ZIP_WORKERS = None
+REPORT_ZIP_COMPRESSION_LEVEL = 6
+
+# Screenshots are embedded in reports at this width. Uploads wider than the width at REPORT_IMAGE_EMBED_DPI (and
+# BMP/TIFF images) get a downscaled PNG/JPEG copy which is embedded instead; the original is kept for download.
+# Run `python manage.py create_report_renditions` after changing these.
+REPORT_IMAGE_EMBED_WIDTH_INCHES = 5
+REPORT_IMAGE_EMBED_DPI = 150
+REPORT_IMAGE_JPEG_QUALITY = 85
+
+# Screenshots are read ahead on this many threads while earlier test cases are laid out, holding at most
+# REPORT_PREFETCH_MAX_BYTES of file contents in memory at once. Set REPORT_PREFETCH_WORKERS = 0 to read inline.
+REPORT_PREFETCH_WORKERS = 4
+REPORT_PREFETCH_MAX_BYTES = 64 * 1024 * 1024
+
+# Large reports: when at least REPORT_SHARD_MIN_TESTS test cases need rendering, they are rendered in chunks of
+# REPORT_SHARD_CHUNK_SIZE by REPORT_SHARD_WORKERS worker processes per report (None: the CPUs divided between the
+# REPORT_BUILD_CONCURRENCY builds that may run at once; 0 or 1 turns this off) and merged into the report in order.
+REPORT_SHARD_WORKERS = None
+REPORT_SHARD_MIN_TESTS = 200
+REPORT_SHARD_CHUNK_SIZE = 50
+
+# Every report and data package build is recorded (phase timings, queries, bytes read, images, output size) in a
+# per-mission history of the last REPORT_RUN_HISTORY_LENGTH runs. REPORT_RUN_TRACE_MEMORY also records peak Python
+# memory use with tracemalloc, which slows report generation down considerably (roughly 40%) while it's on.
+REPORT_RUN_HISTORY_LENGTH = 50
+REPORT_RUN_TRACE_MEMORY = False
+
+# The portfolio page rolls up every mission's statistics, refreshing from those updated since its last read (going
+# back PORTFOLIO_REFRESH_OVERLAP seconds to catch late commits) and rebuilding every PORTFOLIO_ROLLUP_MAX_AGE seconds.
+# It shows test cases executed in the last PORTFOLIO_THROUGHPUT_WEEKS weeks with executions.
+PORTFOLIO_ROLLUP_MAX_AGE = 3600
+PORTFOLIO_REFRESH_OVERLAP = 60
+PORTFOLIO_THROUGHPUT_WEEKS = 52
+
+# Generated reports are written to a temporary file which stays in memory up to REPORT_SPOOL_MAX_MEMORY bytes and
+# then moves to disk, in REPORT_SPOOL_DIR (None: the system temporary directory).
+REPORT_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+REPORT_SPOOL_DIR = None
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'report_fragments': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'data', 'cache', 'report_fragments'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField' 
 
 # Require an interstitial message to be displayed
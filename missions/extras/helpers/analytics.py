@@ -13,11 +13,16 @@
 # limitations under the License.
 #
 
-from collections import Counter, defaultdict
-
+from collections import Counter
+from datetime import date, timedelta
+import json
 import logging
+import threading
+
+from django.conf import settings
+from django.utils import timezone
 
-from missions.models import TestDetail
+from missions.models import BusinessArea, Mission, MissionStatistics, TestDetail
 
 logger = logging.getLogger(__name__)
 
@@ -27,27 +32,45 @@ class MissionAnalytics(object):
     def __init__(self, mission_id):
         self.mission_id = mission_id
 
-        # All analytics exclude hidden test cases so we don't report
-        # numbers of tests greater than what the customer ultimately sees
-        self.testcases = TestDetail.objects.filter(mission=self.mission_id).exclude(test_case_include_flag=False)
+        # Kept up to date as test cases change, so the figures below come from a single primary key lookup. Like
+        # all analytics they exclude hidden test cases so we don't report numbers of tests greater than what the
+        # customer ultimately sees
+        self.statistics = MissionStatistics.get_for_mission(self.mission_id)
+        self._counts = None
 
+        self.execution_matrix = self.statistics.get_execution_matrix()
         self.test_case_types_by_mission_week = self._count_of_test_case_types_by_mission_week()
 
+    def get_counts(self):
+        """
+        Every scalar metric, read from the mission's statistics; the count_of_* methods and percentages all read
+        from it.
+        :return: {'test_cases': n, 'executed': n, 'approved': n, 'findings': n,
+                  'by_result': {execution status: n} for each of TestDetail.EXECUTION_STATUS_OPTIONS}
+        """
+        if self._counts is None:
+            by_result = self.statistics.get_counter('by_result')
+            self._counts = {
+                'test_cases': self.statistics.test_cases,
+                'executed': self.statistics.test_cases - by_result.get('N', 0),
+                'approved': self.statistics.get_counter('by_status').get('FINAL', 0),
+                'findings': self.statistics.test_cases_with_findings,
+                'by_result': dict((status, by_result.get(status, 0))
+                                  for status, _ in TestDetail.EXECUTION_STATUS_OPTIONS),
+            }
+        return self._counts
+
     def count_of_findings(self):
-        count = self.testcases.exclude(findings='').count()
-        return count
+        return self.get_counts()['findings']
 
     def count_of_test_cases(self):
-        count = self.testcases.count()
-        return count
+        return self.get_counts()['test_cases']
 
     def count_of_executed_test_cases(self):
-        count = self.testcases.exclude(execution_status='N').count()
-        return count
+        return self.get_counts()['executed']
 
     def count_of_test_cases_approved(self):
-        count = self.testcases.filter(test_case_status='FINAL').count()
-        return count
+        return self.get_counts()['approved']
 
     def mission_execution_percentage(self):
 
@@ -75,22 +98,27 @@ class MissionAnalytics(object):
                     - an identical length list of integer quantities of TCs which have the corresponding result
         """
 
-        # Get the test result type tuple & convert to list
-        output_list = [[], [], []]  # Lookup value list, Display text list, Count list
-
-        def nested_tuple_to_shallow_list(tup):
-            output_list[0].append(tup[0])
-            output_list[1].append(tup[1])
-            output_list[2].append(0)
-
-        for result in TestDetail.EXECUTION_STATUS_OPTIONS:
-            nested_tuple_to_shallow_list(result)
+        by_result = self.get_counts()['by_result']
+        return [
+            [text for status, text in TestDetail.EXECUTION_STATUS_OPTIONS],
+            [by_result[status] for status, text in TestDetail.EXECUTION_STATUS_OPTIONS],
+        ]
 
-        for tc_result in self.testcases.values('execution_status'):
-            index = output_list[0].index(tc_result['execution_status'])
-            output_list[2][index] += 1
+    def get_execution_matrix(self, period='week'):
+        """
+        Executed test cases counted per attack phase and week (or day) of the attack date, in the shape of
+        MissionStatistics.get_matrix. The weeks are the mission's stored statistics; the days are bucketed by the
+        database on each call (see MissionStatistics.count_executed).
+        :param period: 'week' or 'day'
+        """
+        if period == 'week':
+            return self.execution_matrix
+        return MissionStatistics.get_matrix(MissionStatistics.count_executed(self.mission_id, period),
+                                            timedelta(days=1))
 
-        return output_list[1:]  # No need to return the lookup values list
+    def execution_weeks(self):
+        """ :return: The date each week of the mission's execution starts """
+        return self.execution_matrix['periods']
 
     def count_of_test_cases_by_mission_week(self):
         """
@@ -101,27 +129,7 @@ class MissionAnalytics(object):
         if self.count_of_executed_test_cases() == 0:
             return [0]
 
-        # Get the execution date for each test case in the mission
-        tc_dates = self.testcases.exclude(execution_status='N').values('attack_time_date')
-
-        # Create a hashmap of the count of TCs per iso calendar week
-        weekly_count = Counter()
-        for tc_date in tc_dates:
-            isocalendar_week = tc_date['attack_time_date'].isocalendar()[1]  # Grab the isocalendar Week #
-            weekly_count[isocalendar_week] += 1
-
-        # Get the lowest & highest key values - these are week 1 and the last week respectively
-        # This allows for skipped weeks (just in case)
-        first_week = min(weekly_count.keys())
-        last_week = max(weekly_count.keys())
-        week_delta = last_week - first_week + 1
-
-        # Build a hashmap of week # and the associated count
-        zero_indexed_weekly_count = [0] * week_delta
-        for week, count in list(weekly_count.items()):
-            zero_indexed_weekly_count[week - first_week] = count
-
-        return zero_indexed_weekly_count
+        return self.execution_matrix['totals']
 
     def _count_of_test_case_types_by_mission_week(self):
         """
@@ -136,49 +144,188 @@ class MissionAnalytics(object):
         if self.count_of_executed_test_cases() == 0:
             return [['No TCs have been executed yet!']]
 
-        # Get the execution date & type for each executed test case in the mission
-        tc_records = self.testcases.exclude(execution_status='N').values('attack_time_date', 'attack_phase')
-
-        # Create a hashmap of the count of TCs per iso calendar week
-        weekly_count = defaultdict(Counter)
+        matrix = self.execution_matrix
+        rows = [[phase] + counts for phase, counts in matrix['phases']]
+        rows.append(['TOTAL'] + matrix['totals'])
 
-        for tc_record in tc_records:
-            isocalendar_week = tc_record['attack_time_date'].isocalendar()[1]  # Grab the isocalendar Week #
-            attack_phase = tc_record['attack_phase']
-            weekly_count[isocalendar_week][attack_phase] += 1
+        logger.debug(rows)
 
-        # Get the lowest & highest key values - these are week 1 and the last week respectively
-        # This allows for skipped weeks (just in case)
-        first_week = min(weekly_count.keys())
-        last_week = max(weekly_count.keys())
-        week_delta = last_week - first_week + 1
+        return rows
 
-        # Build a hashmap of week # and the associated count
-        zero_indexed_phase_count_by_week = []
-
-        header_row = list()
-        header_row.append('')
-        header_row.extend(list(range(1, week_delta)))
+    def count_of_test_case_types_by_mission_week(self):
+        return self.test_case_types_by_mission_week
 
-        total_row = list()
-        total_row.append('TOTAL')
-        total_row.extend([0] * week_delta)
 
-        for phase_tuple in TestDetail.ATTACK_PHASES:
-            phase = phase_tuple[0]
-            phase_row = [0] * (week_delta + 1)
-            phase_row[0] = phase
-            for week, attack_phase_counter in list(weekly_count.items()):
-                column = week - first_week + 1
-                phase_row[column] = attack_phase_counter[phase]
-                total_row[column] += attack_phase_counter[phase]
-            zero_indexed_phase_count_by_week.append(phase_row)
+class PortfolioAnalytics(object):
+    """
+    Analytics across every mission: findings rate by business area, attack phase coverage, test cases executed per
+    week and mitigations per attack phase. Like MissionAnalytics, only test cases included in the report count.
 
-        zero_indexed_phase_count_by_week.append(total_row)
+    Built from the missions' MissionStatistics rather than their test cases, and rolled up incrementally: each
+    process keeps the rollup in memory along with what each mission contributed to it, and on every read only
+    folds in the statistics updated since the last one (re-reading the last PORTFOLIO_REFRESH_OVERLAP seconds, so
+    updates committed late aren't missed). The rollup is rebuilt from scratch every PORTFOLIO_ROLLUP_MAX_AGE
+    seconds. Missions without saved statistics (such as ones loaded from a fixture) are left out until
+    rebuild_mission_statistics builds theirs.
+    """
 
-        logger.debug(zero_indexed_phase_count_by_week)
+    _rollup = None  # {'built_at', 'as_of', 'missions': {mission id: (updated_at, Counter)}, 'totals': Counter}
+    _lock = threading.Lock()
 
-        return zero_indexed_phase_count_by_week
+    STATISTICS_FIELDS = ('mission_id', 'mission__business_area_id', 'updated_at', 'test_cases',
+                         'test_cases_with_findings', 'by_phase', 'findings_by_phase', 'mitigations_by_phase',
+                         'executed_by_week')
 
-    def count_of_test_case_types_by_mission_week(self):
-        return self.test_case_types_by_mission_week
+    @staticmethod
+    def contribution(row):
+        """
+        :param row: A mission's STATISTICS_FIELDS
+        :return: Counter of what the mission adds to the rollup, keyed by ('area', business area id, figure),
+                 ('phase', attack phase, figure) or ('week', date the week starts, attack phase)
+        """
+        area = row['mission__business_area_id']
+        counts = Counter({
+            ('area', area, 'missions'): 1,
+            ('area', area, 'test_cases'): row['test_cases'],
+            ('area', area, 'findings'): row['test_cases_with_findings'],
+        })
+        if row['test_cases']:
+            counts[('missions_with_test_cases',)] += 1
+
+        for field, figure in (('by_phase', 'test_cases'), ('findings_by_phase', 'findings'),
+                              ('mitigations_by_phase', 'mitigations')):
+            for phase, count in json.loads(row[field] or '{}').items():
+                counts[('phase', phase, figure)] += count
+                if figure == 'test_cases' and count:
+                    counts[('phase', phase, 'missions')] += 1
+
+        for week, phases in json.loads(row['executed_by_week'] or '{}').items():
+            for phase, count in phases.items():
+                counts[('week', week, phase)] += count
+                counts[('phase', phase, 'executed')] += count
+        return counts
+
+    @classmethod
+    def refresh(cls):
+        """
+        :return: The rollup, brought up to date with the missions' statistics. A rollup is never changed once
+                 returned (refreshing replaces it), so callers can read it without the lock.
+        """
+        max_age = timedelta(seconds=getattr(settings, 'PORTFOLIO_ROLLUP_MAX_AGE', 3600))
+        overlap = timedelta(seconds=getattr(settings, 'PORTFOLIO_REFRESH_OVERLAP', 60))
+        started_at = timezone.now()
+
+        with cls._lock:
+            rollup = cls._rollup
+            statistics = MissionStatistics.objects.all()
+            if rollup is None or started_at - rollup['built_at'] > max_age:
+                rollup = {'built_at': started_at, 'as_of': None, 'missions': {}, 'totals': Counter()}
+                missing = Mission.objects.filter(statistics=None).count()
+                if missing:
+                    logger.warning('The portfolio leaves out {count} missions without statistics; run '
+                                   'rebuild_mission_statistics to build them'.format(count=missing))
+            else:
+                rollup = dict(rollup, missions=dict(rollup['missions']), totals=Counter(rollup['totals']))
+                if rollup['as_of'] is not None:
+                    statistics = statistics.filter(updated_at__gte=rollup['as_of'] - overlap)
+
+            missions, totals = rollup['missions'], rollup['totals']
+            for row in statistics.values(*cls.STATISTICS_FIELDS).iterator():
+                previous = missions.get(row['mission_id'])
+                if previous is not None:
+                    if previous[0] == row['updated_at']:
+                        continue
+                    totals.subtract(previous[1])
+                counts = cls.contribution(row)
+                totals.update(counts)
+                missions[row['mission_id']] = (row['updated_at'], counts)
+                if rollup['as_of'] is None or row['updated_at'] > rollup['as_of']:
+                    rollup['as_of'] = row['updated_at']
+
+            # Deleted missions take their statistics with them
+            current = set(MissionStatistics.objects.values_list('pk', flat=True))
+            for mission_id in set(missions) - current:
+                totals.subtract(missions.pop(mission_id)[1])
+
+            cls._rollup = rollup
+            return rollup
+
+    @classmethod
+    def get_throughput(cls, totals):
+        """
+        :return: Test cases executed per week over the last PORTFOLIO_THROUGHPUT_WEEKS weeks with executions, in the
+                 shape of MissionStatistics.get_matrix
+        """
+        weeks = [date.fromisoformat(key[1]) for key, count in totals.items() if key[0] == 'week' and count]
+        periods = []
+        if weeks:
+            last = max(weeks)
+            first = max(min(weeks), last - timedelta(weeks=getattr(settings, 'PORTFOLIO_THROUGHPUT_WEEKS', 52) - 1))
+            periods = [first + timedelta(days=7 * i) for i in range((last - first).days // 7 + 1)]
+
+        phases = [(phase, [totals[('week', start.isoformat(), phase)] for start in periods])
+                  for phase, _ in TestDetail.ATTACK_PHASES]
+        period_totals = [sum(row[i] for phase, row in phases) for i in range(len(periods))]
+        return {'periods': periods, 'phases': phases, 'totals': period_totals}
+
+    @staticmethod
+    def get_rate(part, whole):
+        return part / whole if whole else 0
+
+    @classmethod
+    def get_portfolio(cls):
+        """
+        :return: {
+            'missions': n, 'missions_with_test_cases': n, 'test_cases': n, 'findings': n,
+            'findings_rate': findings / test cases,
+            'business_areas': [{'id', 'name', 'missions', 'test_cases', 'findings', 'findings_rate'}] by name,
+            'phases': [{'phase', 'name', 'missions', 'coverage', 'test_cases', 'executed', 'findings',
+                        'mitigations'}] for each of TestDetail.ATTACK_PHASES; coverage is the share of the missions
+                        with test cases that test the phase,
+            'throughput': see get_throughput,
+            'as_of': when the newest statistics included were updated,
+        }
+        """
+        rollup = cls.refresh()
+        totals = rollup['totals']
+
+        area_ids = set(key[1] for key, count in totals.items() if key[0] == 'area' and key[2] == 'missions' and count)
+        business_areas = []
+        for area_id, name in BusinessArea.objects.filter(pk__in=area_ids).order_by('name').values_list('pk', 'name'):
+            test_cases, findings = totals[('area', area_id, 'test_cases')], totals[('area', area_id, 'findings')]
+            business_areas.append({
+                'id': area_id,
+                'name': name,
+                'missions': totals[('area', area_id, 'missions')],
+                'test_cases': test_cases,
+                'findings': findings,
+                'findings_rate': cls.get_rate(findings, test_cases),
+            })
+
+        missions_with_test_cases = totals[('missions_with_test_cases',)]
+        phases = []
+        for phase, name in TestDetail.ATTACK_PHASES:
+            phases.append({
+                'phase': phase,
+                'name': name,
+                'missions': totals[('phase', phase, 'missions')],
+                'coverage': cls.get_rate(totals[('phase', phase, 'missions')], missions_with_test_cases),
+                'test_cases': totals[('phase', phase, 'test_cases')],
+                'executed': totals[('phase', phase, 'executed')],
+                'findings': totals[('phase', phase, 'findings')],
+                'mitigations': totals[('phase', phase, 'mitigations')],
+            })
+
+        test_cases = sum(area['test_cases'] for area in business_areas)
+        findings = sum(area['findings'] for area in business_areas)
+        return {
+            'missions': sum(area['missions'] for area in business_areas),
+            'missions_with_test_cases': missions_with_test_cases,
+            'test_cases': test_cases,
+            'findings': findings,
+            'findings_rate': cls.get_rate(findings, test_cases),
+            'business_areas': business_areas,
+            'phases': phases,
+            'throughput': cls.get_throughput(totals),
+            'as_of': rollup['as_of'],
+        }
@@ -0,0 +1,290 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import stat
+import struct
+import time
+import zlib
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from each source file at a time; also the unit of work handed to the deflate pool
+ZIP_STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Bytes of a file of unknown type test-compressed to decide whether deflating it is worth the CPU
+COMPRESSIBILITY_SAMPLE_SIZE = 64 * 1024
+
+# Files whose sample doesn't deflate to less than this fraction of its size are stored as-is
+COMPRESSIBILITY_THRESHOLD = 0.9
+
+# Leading bytes of formats which are already compressed; recompressing them costs CPU for next to no gain
+PRECOMPRESSED_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n',  # PNG
+    b'\xff\xd8\xff',  # JPEG
+    b'GIF87a',
+    b'GIF89a',
+    b'PK\x03\x04',  # zip, and zip based formats (docx, xlsx, jar, apk...)
+    b'\x1f\x8b',  # gzip (including gzip'd pcaps)
+    b'BZh',  # bzip2
+    b'\xfd7zXZ\x00',  # xz
+    b'7z\xbc\xaf\x27\x1c',  # 7-Zip
+    b'\x28\xb5\x2f\xfd',  # zstd
+    b'Rar!\x1a\x07',  # RAR
+)
+
+STORED = 0
+DEFLATED = 8
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+LOCAL_FILE_HEADER = struct.Struct('<IHHHHHIIIHH')
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+DATA_DESCRIPTOR64 = struct.Struct('<IIQQ')
+CENTRAL_DIRECTORY_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+END_OF_CENTRAL_DIRECTORY64 = struct.Struct('<IQHHIIQQQQ')
+END_OF_CENTRAL_DIRECTORY64_LOCATOR = struct.Struct('<IIQI')
+
+# General purpose flags: sizes & CRC follow the data (bit 3); file name is UTF-8 (bit 11)
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+# Sentinel queued after a deflated entry's blocks; replaced by the bytes that terminate its deflate stream
+END_OF_DEFLATE_STREAM = object()
+
+
+def choose_compression(path):
+    """
+    Picks STORED or DEFLATED for a file: known compressed formats are stored, anything else is deflated only if a
+    sample of it actually shrinks.
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(COMPRESSIBILITY_SAMPLE_SIZE)
+
+    if not sample or sample.startswith(PRECOMPRESSED_SIGNATURES):
+        return STORED
+
+    # Very fast level is enough to tell compressible data from noise
+    if len(zlib.compress(sample, 1)) > len(sample) * COMPRESSIBILITY_THRESHOLD:
+        return STORED
+
+    return DEFLATED
+
+
+def deflate_block(data, level):
+    """
+    Compresses one block of a file into a raw deflate fragment ending on a byte boundary (pigz style), so the
+    fragments for consecutive blocks can be compressed independently and concatenated into a single stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+# An empty final block; closes a deflate stream made of sync-flushed fragments
+DEFLATE_STREAM_END = zlib.compressobj(0, zlib.DEFLATED, -zlib.MAX_WBITS).flush(zlib.Z_FINISH)
+
+
+def get_dos_date_time(timestamp):
+    date_time = time.localtime(timestamp)
+    if date_time.tm_year < 1980:
+        return 0x21, 0  # 1980-01-01 00:00:00, the earliest a zip can record
+    dos_date = (date_time.tm_year - 1980) << 9 | date_time.tm_mon << 5 | date_time.tm_mday
+    dos_time = date_time.tm_hour << 11 | date_time.tm_min << 5 | date_time.tm_sec // 2
+    return dos_date, dos_time
+
+
+class _ZipEntry(object):
+    """ Bookkeeping for one file in the archive, filled in as its data is written """
+
+    def __init__(self, arcname, path, file_stat, compress_type):
+        self.arcname = arcname.encode('utf-8')
+        self.flags = FLAG_DATA_DESCRIPTOR | (0 if len(self.arcname) == len(arcname) else FLAG_UTF8)
+        self.path = path
+        self.compress_type = compress_type
+        self.date, self.time = get_dos_date_time(file_stat.st_mtime)
+        self.external_attr = (stat.S_IMODE(file_stat.st_mode) | stat.S_IFREG) << 16
+        # Decided up front from the size on disk (with headroom for deflate overhead), as zipfile does
+        self.zip64 = file_stat.st_size * 1.05 > ZIP64_LIMIT
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+        self.header_offset = 0
+
+    @property
+    def version_needed(self):
+        return 45 if self.zip64 else 20
+
+    def local_header(self):
+        if self.zip64:
+            # Both sizes live in the zip64 extra field (zero here; the data descriptor carries the real values)
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+            sizes = ZIP64_LIMIT
+        else:
+            extra = b''
+            sizes = 0
+        return LOCAL_FILE_HEADER.pack(
+            0x04034b50, self.version_needed, self.flags, self.compress_type, self.time, self.date,
+            0, sizes, sizes, len(self.arcname), len(extra)) + self.arcname + extra
+
+    def data_descriptor(self):
+        if self.zip64:
+            return DATA_DESCRIPTOR64.pack(0x08074b50, self.crc, self.compress_size, self.file_size)
+        return DATA_DESCRIPTOR.pack(0x08074b50, self.crc, self.compress_size, self.file_size)
+
+    def central_directory_header(self):
+        zip64_fields = []
+        file_size, compress_size, header_offset = self.file_size, self.compress_size, self.header_offset
+        if file_size >= ZIP64_LIMIT:
+            zip64_fields.append(file_size)
+            file_size = ZIP64_LIMIT
+        if compress_size >= ZIP64_LIMIT:
+            zip64_fields.append(compress_size)
+            compress_size = ZIP64_LIMIT
+        if header_offset >= ZIP64_LIMIT:
+            zip64_fields.append(header_offset)
+            header_offset = ZIP64_LIMIT
+
+        extra = b''
+        version_needed = self.version_needed
+        if zip64_fields:
+            extra = struct.pack('<HH{}Q'.format(len(zip64_fields)), 0x0001, 8 * len(zip64_fields), *zip64_fields)
+            version_needed = 45
+
+        return CENTRAL_DIRECTORY_HEADER.pack(
+            0x02014b50, 3 << 8 | version_needed, version_needed, self.flags, self.compress_type, self.time,
+            self.date, self.crc, compress_size, file_size, len(self.arcname), len(extra), 0, 0, 0,
+            self.external_attr, header_offset) + self.arcname + extra
+
+
+def get_deflate_workers():
+    return getattr(settings, 'REPORT_ZIP_WORKERS', None) or os.cpu_count() or 1
+
+
+def iter_zip(entries, progress=None):
+    """
+    Builds a zip archive on the fly, reading each file straight from disk, so memory use stays flat regardless of
+    archive size. Each file is stored or deflated according to choose_compression; deflating is split into blocks
+    compressed on a pool of REPORT_ZIP_WORKERS threads (zlib releases the GIL) and written back out in order.
+    ZIP64 records are used automatically for entries (and archives) over 4GB.
+    :param entries: List of (archive name, path of the file on disk) tuples
+    :param progress: Optional callable accepting (files written, total files)
+    :return: Generator of bytes chunks making up the archive
+    """
+    workers = get_deflate_workers()
+    level = getattr(settings, 'REPORT_ZIP_COMPRESSION_LEVEL', zlib.Z_DEFAULT_COMPRESSION)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dart-zip') if workers > 1 else None
+
+    # Blocks read ahead of the one being written; bounds memory to roughly this many ZIP_STREAM_CHUNK_SIZE blocks
+    max_pending = workers * 2
+
+    def plan():
+        """ Yields the archive's pieces in order: entries, deflate futures or raw blocks, and entry ends """
+        for arcname, path in entries:
+            try:
+                source = open(path, 'rb')
+                compress_type = choose_compression(path)
+            except OSError:
+                logger.warning('Unable to read {path} for {arcname}; leaving it out of the archive'.format(
+                    path=path, arcname=arcname))
+                continue
+
+            with source:
+                entry = _ZipEntry(arcname, path, os.fstat(source.fileno()), compress_type)
+                yield entry
+
+                while True:
+                    data = source.read(ZIP_STREAM_CHUNK_SIZE)
+                    if not data:
+                        break
+                    entry.crc = zlib.crc32(data, entry.crc)
+                    entry.file_size += len(data)
+
+                    if compress_type == STORED:
+                        yield data
+                    elif executor is not None:
+                        yield executor.submit(deflate_block, data, level)
+                    else:
+                        yield deflate_block(data, level)
+
+                if compress_type == DEFLATED:
+                    yield END_OF_DEFLATE_STREAM
+
+            yield None  # End of the entry; its CRC and size are final by the time this is consumed
+
+    written = []
+    state = {'offset': 0, 'entry': None}
+
+    def emit(piece):
+        if isinstance(piece, _ZipEntry):
+            piece.header_offset = state['offset']
+            state['entry'] = piece
+            data = piece.local_header()
+        elif piece is None:
+            entry = state['entry']
+            data = entry.data_descriptor()
+            written.append(entry)
+            if progress is not None:
+                progress(len(written), len(entries))
+        else:
+            if piece is END_OF_DEFLATE_STREAM:
+                data = DEFLATE_STREAM_END
+            elif isinstance(piece, bytes):
+                data = piece
+            else:
+                data = piece.result()
+            state['entry'].compress_size += len(data)
+
+        state['offset'] += len(data)
+        return data
+
+    try:
+        pending = deque()
+        for piece in plan():
+            pending.append(piece)
+            while len(pending) > max_pending:
+                yield emit(pending.popleft())
+        while pending:
+            yield emit(pending.popleft())
+    finally:
+        if executor is not None:
+            # Abandoned downloads leave at most max_pending blocks to finish compressing
+            executor.shutdown(wait=False)
+
+    central_directory = b''.join(entry.central_directory_header() for entry in written)
+    central_directory_offset = state['offset']
+    central_directory_size = len(central_directory)
+    yield central_directory
+
+    entry_count = len(written)
+    end = b''
+    if (entry_count >= ZIP_FILECOUNT_LIMIT or central_directory_offset >= ZIP64_LIMIT
+            or central_directory_size >= ZIP64_LIMIT):
+        end += END_OF_CENTRAL_DIRECTORY64.pack(
+            0x06064b50, 44, 45, 45, 0, 0, entry_count, entry_count, central_directory_size,
+            central_directory_offset)
+        end += END_OF_CENTRAL_DIRECTORY64_LOCATOR.pack(
+            0x07064b50, 0, central_directory_offset + central_directory_size, 1)
+    end += END_OF_CENTRAL_DIRECTORY.pack(
+        0x06054b50, 0, 0,
+        min(entry_count, ZIP_FILECOUNT_LIMIT), min(entry_count, ZIP_FILECOUNT_LIMIT),
+        min(central_directory_size, ZIP64_LIMIT), min(central_directory_offset, ZIP64_LIMIT), 0)
+    yield end
@@ -0,0 +1,393 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from contextlib import ExitStack
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now
+
+from missions.models import Mission
+from .archives import ZIP_STREAM_CHUNK_SIZE
+from .locks import LockTimeout, ReportBuildSlots
+from .templates import ReportTemplateCache, DEFAULT_TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+# Progress phases reported (see generate_report_or_attachments) while a build waits to start
+SHARED_BUILD_PHASE = 'Waiting for the same build requested by someone else'
+BUILD_SLOT_PHASE = 'Waiting for other reports to finish'
+
+
+class ReportArtifactCache(object):
+    """
+    On-disk cache of finished reports and supporting data packages. Entries are keyed by the mission's
+    content_version (which moves on any edit that affects the output), so an unchanged mission is served straight
+    from disk. The cache is bounded by REPORT_ARTIFACT_CACHE_MAX_BYTES; least recently used entries are evicted first.
+
+    Builds are single-flight: a request for an artifact that is already being built (by any process on the host)
+    waits for that build and is served its output rather than building it again. Builds also take one of the
+    REPORT_BUILD_CONCURRENCY build slots (see ReportBuildSlots).
+    """
+
+    KIND_REPORT = 'report'
+    KIND_ATTACHMENTS = 'attachments'
+
+    EXTENSIONS = {
+        KIND_REPORT: 'docx',
+        KIND_ATTACHMENTS: 'zip',
+    }
+
+    hits = 0
+    misses = 0
+    shared_builds = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_cache_dir():
+        cache_dir = getattr(settings, 'REPORT_ARTIFACT_CACHE_DIR',
+                            os.path.join(settings.BASE_DIR, 'data', 'cache', 'report_artifacts'))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        return cache_dir
+
+    @classmethod
+    def get_path(cls, mission_id, kind, content_version, template_name=DEFAULT_TEMPLATE):
+        """ Path the artifact for this mission, kind and content version is (or would be) stored at """
+        key_parts = [content_version]
+
+        if kind == cls.KIND_REPORT:
+            # Reports are stamped with the generation date and built from the mission's report template
+            key_parts.extend([
+                now().strftime('%x'),
+                ReportTemplateCache.get_version(template_name),
+            ])
+
+        digest = hashlib.sha1('|'.join(key_parts).encode('utf-8')).hexdigest()
+        return os.path.join(cls.get_cache_dir(), '{mission}-{kind}-{digest}.{ext}'.format(
+            mission=mission_id,
+            kind=kind,
+            digest=digest,
+            ext=cls.EXTENSIONS[kind],
+        ))
+
+    @classmethod
+    def get(cls, path):
+        """ Returns the path if the artifact is cached (marking it recently used), otherwise None """
+        if os.path.isfile(path):
+            try:
+                os.utime(path)
+            except OSError:
+                # Evicted between the check and the touch
+                return cls._count_miss(path)
+            with cls._lock:
+                cls.hits += 1
+            logger.info('Report artifact cache hit: {path} (hits: {hits}, misses: {misses})'.format(
+                path=os.path.basename(path), hits=cls.hits, misses=cls.misses))
+            return path
+        return cls._count_miss(path)
+
+    @classmethod
+    def _count_miss(cls, path):
+        with cls._lock:
+            cls.misses += 1
+        logger.info('Report artifact cache miss: {path} (hits: {hits}, misses: {misses})'.format(
+            path=os.path.basename(path), hits=cls.hits, misses=cls.misses))
+        return None
+
+    @staticmethod
+    def iter_file(stream):
+        """ Reads a generated artifact from the start as chunks suitable for put() """
+        stream.seek(0)
+        return iter(lambda: stream.read(ZIP_STREAM_CHUNK_SIZE), b'')
+
+    @classmethod
+    def put(cls, path, chunks):
+        """
+        Stores a generated artifact, replacing older versions for the same mission & kind.
+        :param chunks: Iterable of bytes making up the artifact
+        :return: The stored artifact, opened for reading (so it can be served even if it is evicted right away)
+        """
+        fd, temp_path = tempfile.mkstemp(dir=cls.get_cache_dir(), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except BaseException:
+            cls._remove(temp_path)
+            raise
+
+        return cls._commit(temp_path, path, open_stored=True)
+
+    @classmethod
+    def _commit(cls, temp_path, path, open_stored=False):
+        """ :return: The stored artifact opened for reading if open_stored, otherwise None """
+        cache_dir = cls.get_cache_dir()
+        os.replace(temp_path, path)
+
+        # Opened before anything is evicted (which may include this entry, if it's bigger than the whole cache)
+        stored = open(path, 'rb') if open_stored else None
+
+        # Anything else for this mission & kind is for an outdated content version
+        mission_and_kind = os.path.basename(path).rsplit('-', 1)[0]
+        for stale_path in glob.glob(os.path.join(cache_dir, mission_and_kind + '-*')):
+            if stale_path != path:
+                cls._remove(stale_path)
+
+        cls.evict()
+        return stored
+
+    @classmethod
+    def evict(cls):
+        """ Removes least recently used artifacts until the cache fits in REPORT_ARTIFACT_CACHE_MAX_BYTES """
+        max_bytes = getattr(settings, 'REPORT_ARTIFACT_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+
+        entries = []
+        total_bytes = 0
+        for entry in os.scandir(cls.get_cache_dir()):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                entry_stat = entry.stat()
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+                total_bytes += entry_stat.st_size
+
+        for mtime, size, path in sorted(entries):
+            if total_bytes <= max_bytes:
+                break
+            cls._remove(path)
+            total_bytes -= size
+            logger.info('Evicted {path} from the report artifact cache'.format(path=os.path.basename(path)))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @classmethod
+    def _open_cached(cls, mission_id, kind):
+        """ :return: (open file of the cached artifact or None, path it is cached at, mission name) """
+        mission_name, content_version, business_area = Mission.objects.values_list(
+            'mission_name', 'content_version', 'business_area__name').get(pk=mission_id)
+        path = cls.get_path(mission_id, kind, content_version, ReportTemplateCache.get_template_name(business_area))
+        return cls._open(path), path, mission_name
+
+    @classmethod
+    def _open(cls, path):
+        """ :return: The cached artifact at path opened for reading, or None """
+        if cls.get(path) is not None:
+            try:
+                # Open right away; an open file survives a concurrent eviction
+                return open(path, 'rb')
+            except OSError:
+                pass
+        return None
+
+    @staticmethod
+    def get_build_lock(path):
+        """
+        :return: FileLock held while the artifact at path is built. Locks are per mission & kind rather than per
+                 content version, so the number of lock files stays bounded; a build for a newer version waits for
+                 one of an older version to finish first.
+        """
+        return ReportBuildSlots.get_lock('build-' + os.path.basename(path).rsplit('-', 1)[0])
+
+    @classmethod
+    def acquire_build_lock(cls, path, timeout=None, on_wait=None):
+        """
+        :param on_wait: Optional callable, called once if the artifact is already being built and this has to wait
+        :return: The artifact's build lock (see get_build_lock), acquired
+        :raise LockTimeout: If the concurrent build didn't finish within timeout seconds
+        """
+        build_lock = cls.get_build_lock(path)
+        if not build_lock.acquire(blocking=False):
+            if on_wait is not None:
+                on_wait()
+            if not build_lock.acquire(timeout=timeout):
+                raise LockTimeout('{path} is still being built after {timeout}s'.format(
+                    path=os.path.basename(path), timeout=timeout))
+        return build_lock
+
+    @classmethod
+    def _open_shared(cls, path):
+        """ Called with the build lock held: the artifact if a concurrent request built it in the meantime """
+        shared = cls._open(path)
+        if shared is not None:
+            with cls._lock:
+                cls.shared_builds += 1
+            logger.info('Served {path} from a concurrent build (shared builds: {shared})'.format(
+                path=os.path.basename(path), shared=cls.shared_builds))
+        return shared
+
+    @classmethod
+    def fetch(cls, mission_id, zip_attachments=False, progress=None, timeout=None):
+        """
+        Returns the finished report (or supporting data package) for a mission, building it only when the cache
+        doesn't already hold one for the mission's current content version. The build lock and slot are only held
+        while the artifact is built; the caller streams the stored copy without holding either.
+        :param timeout: Most seconds to wait for a concurrent build of the artifact and then for a build slot (None:
+                        wait as long as it takes)
+        :return: (open binary file of the artifact, mission name)
+        :raise LockTimeout: If the artifact couldn't be built within the timeout
+        """
+
+        # Imported here to avoid a circular import (utils depends on the helpers package)
+        from missions.extras.utils import generate_report_or_attachments
+
+        kind = cls.KIND_ATTACHMENTS if zip_attachments else cls.KIND_REPORT
+        cached, path, mission_name = cls._open_cached(mission_id, kind)
+        if cached is not None:
+            return cached, mission_name
+
+        def report_waiting(phase):
+            if progress is not None:
+                progress(phase, 0, 0, 0)
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        build_lock = cls.acquire_build_lock(path, timeout, on_wait=lambda: report_waiting(SHARED_BUILD_PHASE))
+        try:
+            shared = cls._open_shared(path)
+            if shared is not None:
+                return shared, mission_name
+
+            with ReportBuildSlots.hold(on_wait=lambda: report_waiting(BUILD_SLOT_PHASE),
+                                       timeout=max(0, deadline - time.monotonic()) if deadline else None):
+                output, name = generate_report_or_attachments(mission_id, zip_attachments=zip_attachments,
+                                                              progress=progress)
+
+                # Stored under the version read before generation; if the mission changed mid-build this entry is
+                # simply never requested again
+                if zip_attachments:
+                    return cls.put(path, output), name
+
+                # Serve the stored copy; the generated output (possibly spooled to disk) is discarded straight away
+                with output:
+                    return cls.put(path, cls.iter_file(output)), name
+        finally:
+            build_lock.release()
+
+    @classmethod
+    def stream_attachments(cls, mission_id, timeout=None):
+        """
+        Returns the supporting data package for a mission without waiting for it to be built: a cached package is
+        returned as an open file; otherwise the package is built into the cache on a background thread and streamed
+        from the file as it grows (see ArtifactBuild). The build lock and slot belong to the build rather than the
+        download, so they are released as soon as the package is stored, however slowly the client reads it, and
+        the cache entry is the only copy written.
+        :param timeout: As for fetch; only the wait to start the build is limited, not the build itself
+        :return: (open binary file or iterable of bytes chunks, mission name)
+        :raise LockTimeout: If the build couldn't start within the timeout
+        """
+
+        # Imported here to avoid a circular import (utils depends on the helpers package)
+        from missions.extras.utils import generate_attachments_zip
+
+        cached, path, mission_name = cls._open_cached(mission_id, cls.KIND_ATTACHMENTS)
+        if cached is not None:
+            return cached, mission_name
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        held = ExitStack()
+        held.callback(cls.acquire_build_lock(path, timeout).release)
+        try:
+            shared = cls._open_shared(path)
+            if shared is not None:
+                held.close()
+                return shared, mission_name
+
+            held.enter_context(ReportBuildSlots.hold(
+                timeout=max(0, deadline - time.monotonic()) if deadline else None))
+            chunks, name = generate_attachments_zip(mission_id)
+            build = ArtifactBuild(cls, path)
+        except BaseException:
+            held.close()
+            raise
+
+        return build.start(chunks, held), name
+
+
+class ArtifactBuild(object):
+    """
+    Writes an artifact into the cache on a background thread while a download follows the file as it grows. The
+    build goes at the speed of the disk whatever the download's speed, and carries on to completion (and into the
+    cache) if the client goes away. Each chunk is flushed as it's written so the follower sees it straight away.
+    """
+
+    def __init__(self, cache, path):
+        self.cache = cache
+        self.path = path
+        fd, self.temp_path = tempfile.mkstemp(dir=cache.get_cache_dir(), suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+        self.written = 0
+        self.finished = False
+        self.failed = False
+        self.condition = threading.Condition()
+
+    def start(self, chunks, held):
+        """
+        :param chunks: Iterable of bytes making up the artifact
+        :param held: ExitStack of the build lock and slot, closed once the artifact is stored (or the build fails)
+        :return: Generator of the artifact's bytes chunks, read from the file as it is written
+        """
+        # Opened before the build starts: the open file keeps reading the same data after the artifact is moved
+        # into place or evicted
+        reader = open(self.temp_path, 'rb')
+        threading.Thread(target=self.build, args=(chunks, held), name='dart-artifact-build', daemon=True).start()
+        return self.follow(reader)
+
+    def build(self, chunks, held):
+        try:
+            with self.file:
+                for chunk in chunks:
+                    self.file.write(chunk)
+                    self.file.flush()
+                    with self.condition:
+                        self.written += len(chunk)
+                        self.condition.notify_all()
+            self.cache._commit(self.temp_path, self.path)
+        except BaseException:
+            logger.exception('Unable to build {path}'.format(path=os.path.basename(self.path)))
+            self.failed = True
+            self.cache._remove(self.temp_path)
+        finally:
+            held.close()
+            # The run is recorded from this thread (see generate_attachments_zip)
+            connection.close()
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def follow(self, reader):
+        with reader:
+            while True:
+                chunk = reader.read(ZIP_STREAM_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                    continue
+                with self.condition:
+                    if self.finished and reader.tell() >= self.written:
+                        break
+                    self.condition.wait_for(lambda: self.finished or self.written > reader.tell())
+
+        if self.failed:
+            # Ends the download early, rather than letting a truncated archive look complete
+            raise IOError('{path} could not be built'.format(path=os.path.basename(self.path)))
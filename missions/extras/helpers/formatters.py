@@ -27,6 +27,13 @@ def standardize_report_output_field(field_content):
     return standardized_text
 
 
+def expand_hex_color_code(hex_color_code):
+    """ Expands shorthand hex codes (e.g. "f0a" to "ff00aa"); RGBColor doesn't handle them """
+    if len(hex_color_code) == 3:
+        return ''.join(char + char for char in hex_color_code)
+    return hex_color_code
+
+
 def join_as_compacted_paragraphs(paragraphs):
     """
     :param paragraphs: List containing individual paragraphs; potentially with extraneous whitespace within
@@ -0,0 +1,177 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import caches, InvalidCacheBackendError
+
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+DOC_PR_XPATH = './/wp:docPr'
+PICTURE_NAME_PATTERN = re.compile(r'^Picture \d+$')
+
+
+class DrawingIds(object):
+    """
+    Hands out ids for the drawings (pictures) spliced into a document. python-docx's part.next_id scans the whole
+    document for the highest id in use, so it's only done once, until reset() is called because something other
+    than splice() (e.g. python-docx's add_picture()) may have used ids since.
+    """
+
+    def __init__(self, part):
+        self.part = part
+        self.next_id = None
+
+    def allocate(self):
+        if self.next_id is None:
+            self.next_id = self.part.next_id
+        drawing_id = self.next_id
+        self.next_id += 1
+        return drawing_id
+
+    def reset(self):
+        self.next_id = None
+
+
+class ReportFragment(object):
+    """
+    The rendered body elements of one report section (e.g. a test case: heading, table & screenshots) in a form that
+    can be cached and spliced into another document built from the same template.
+
+    Stored as a plain dict so cached entries don't depend on this class's import path:
+        xml: list of serialized top-level body elements (bytes)
+        images: {relationship id used in the xml: path of the image file it embeds}
+        images_embedded: number of pictures in the fragment
+    """
+
+    @staticmethod
+    def capture(document, marker, images):
+        """
+        Serializes every body element appended after `marker`.
+        :param document: The python-docx document being built
+        :param marker: The last body element before the section was rendered
+        :param images: {rId: image file path} for each picture added while rendering the section
+        :return: A fragment dict
+        """
+        elements = []
+        element = marker.getnext()
+        while element is not None and element.tag != qn('w:sectPr'):
+            elements.append(element)
+            element = element.getnext()
+
+        return {
+            'xml': [etree.tostring(e) for e in elements],
+            'images': dict(images),
+            'images_embedded': len(images),
+        }
+
+    @staticmethod
+    def splice(document, fragment, open_image=None, drawing_ids=None):
+        """
+        Appends a cached fragment's elements to the end of the document body, re-relating each embedded image to
+        the document and renumbering drawing ids so they remain unique.
+        :param open_image: Optional callable returning an image's contents as a file object given its path
+        :param drawing_ids: Optional DrawingIds handing out the ids, when splicing many fragments in a row
+        :return: False (leaving the document untouched) if an image file the fragment depends on is gone
+        """
+        elements = [parse_xml(xml) for xml in fragment['xml']]
+
+        images = {}
+        for old_rId, path in fragment['images'].items():
+            try:
+                images[old_rId] = open_image(path) if open_image is not None else open(path, 'rb')
+            except OSError:
+                logger.info('Cached report fragment references a missing image ({path}); re-rendering'
+                            .format(path=path))
+                for image in images.values():
+                    image.close()
+                return False
+
+        part = document.part
+        rId_map = {}
+        for old_rId, image in images.items():
+            with image:
+                rId_map[old_rId], _ = part.get_or_add_image(image)
+
+        if drawing_ids is None:
+            drawing_ids = DrawingIds(part)
+
+        for element in elements:
+            for blip in element.xpath('.//a:blip'):
+                old_rId = blip.get(qn('r:embed'))
+                if old_rId in rId_map:
+                    blip.set(qn('r:embed'), rId_map[old_rId])
+
+            for doc_pr in element.xpath(DOC_PR_XPATH):
+                drawing_id = drawing_ids.allocate()
+                doc_pr.set('id', str(drawing_id))
+                # python-docx names pictures after their drawing id
+                if PICTURE_NAME_PATTERN.match(doc_pr.get('name', '')):
+                    doc_pr.set('name', 'Picture {}'.format(drawing_id))
+
+        body = document._body._element
+        for element in elements:
+            if body.sectPr is not None:
+                body.sectPr.addprevious(element)
+            else:
+                body.append(element)
+
+        return True
+
+
+class ReportFragmentCache(object):
+    """ Content-addressed storage of rendered report fragments """
+
+    CACHE_ALIAS = 'report_fragments'
+    KEY_PREFIX = 'report-fragment:'
+
+    @classmethod
+    def get_cache(cls):
+        try:
+            return caches[cls.CACHE_ALIAS]
+        except InvalidCacheBackendError:
+            return caches['default']
+
+    @classmethod
+    def make_key(cls, key_data):
+        """ Hashes a JSON-serializable description of everything that affects a fragment's rendering """
+        digest = hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return cls.KEY_PREFIX + digest
+
+    @classmethod
+    def get(cls, key):
+        if not getattr(settings, 'REPORT_FRAGMENT_CACHE_ENABLED', True):
+            return None
+        return cls.get_cache().get(key)
+
+    @classmethod
+    def has(cls, key):
+        if not getattr(settings, 'REPORT_FRAGMENT_CACHE_ENABLED', True):
+            return False
+        return cls.get_cache().has_key(key)
+
+    @classmethod
+    def set(cls, key, fragment):
+        if not getattr(settings, 'REPORT_FRAGMENT_CACHE_ENABLED', True):
+            return
+        cls.get_cache().set(key, fragment, getattr(settings, 'REPORT_FRAGMENT_CACHE_TIMEOUT', None))
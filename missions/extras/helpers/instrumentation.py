@@ -0,0 +1,190 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import logging
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.db import connection, DatabaseError
+from django.utils.timezone import now
+
+from missions.models import ReportRun
+
+logger = logging.getLogger(__name__)
+
+
+class PhaseTimer(object):
+    """
+    Adds up the wall clock time and database queries spent in each named phase of a piece of work. A phase can be
+    entered any number of times (e.g. once per test case) and phases can nest; a nested phase's time and queries
+    also count towards the phases around it.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()  # name: [seconds, queries, times entered]
+        self.queries = 0  # Queries made in any phase, each counted once
+        self.depth = 0
+
+    @contextmanager
+    def phase(self, name):
+        totals = self.phases.get(name)
+        if totals is None:
+            totals = self.phases[name] = [0.0, 0, 0]
+        outermost = self.depth == 0
+
+        def count_query(execute, sql, params, many, context):
+            totals[1] += 1
+            if outermost:
+                self.queries += 1
+            return execute(sql, params, many, context)
+
+        self.depth += 1
+        started = time.perf_counter()
+        try:
+            # Queries are counted on this thread's connection only
+            with connection.execute_wrapper(count_query):
+                yield
+        finally:
+            totals[0] += time.perf_counter() - started
+            totals[2] += 1
+            self.depth -= 1
+
+    def get_phases(self):
+        """ :return: [[phase, seconds, queries, times entered]] in the order the phases were first entered """
+        return [[name, seconds, queries, entered] for name, (seconds, queries, entered) in self.phases.items()]
+
+    def merge(self, phases, prefix=''):
+        """ Adds the phases of another timer (e.g. from get_phases() in a worker process) to this one's """
+        for name, seconds, queries, entered in phases:
+            totals = self.phases.setdefault(prefix + name, [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += queries
+            totals[2] += entered
+
+
+class ReportRunRecorder(PhaseTimer):
+    """
+    Records a report or supporting data package build as a ReportRun: its phase timings (see PhaseTimer), queries,
+    bytes of uploaded files read, images embedded, output size and, when REPORT_RUN_TRACE_MEMORY is on, the peak
+    Python memory use traced while it ran. Only the newest REPORT_RUN_HISTORY_LENGTH runs are kept per mission.
+
+    Use as a context manager, or call start() and finish() (e.g. around a stream, see record_stream()). Queries made
+    outside of a phase aren't counted. Peak memory is only traced if nothing else is already tracing allocations,
+    and covers the whole process (including any other reports being built at the same time).
+    """
+
+    def __init__(self, mission_id, kind):
+        super(ReportRunRecorder, self).__init__()
+        self.mission_id = mission_id
+        self.kind = kind
+
+        self.test_cases = 0
+        self.images_embedded = 0
+        self.fragments_reused = 0
+        self.bytes_read = 0
+        self.output_size = 0
+
+        self.started_at = None
+        self.started = None
+        self.tracing_memory = False
+        self.finished = False
+
+    def start(self):
+        self.started_at = now()
+        self.started = time.perf_counter()
+        if getattr(settings, 'REPORT_RUN_TRACE_MEMORY', False) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing_memory = True
+        return self
+
+    def finish(self, succeeded=True):
+        """ Saves the run; only the first call does anything """
+        if self.finished:
+            return
+        self.finished = True
+
+        duration = time.perf_counter() - self.started
+        peak_memory = None
+        if self.tracing_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        logger.info('{kind} run for mission {mission} {result} in {duration:.2f}s: {queries} queries, {read} bytes '
+                    'read, {images} images, {output} bytes output, peak memory {peak}; phases: {phases}'.format(
+                        kind=self.kind, mission=self.mission_id, result='succeeded' if succeeded else 'failed',
+                        duration=duration, queries=self.queries, read=self.bytes_read, images=self.images_embedded,
+                        output=self.output_size, peak=peak_memory if peak_memory is not None else 'not traced',
+                        phases=', '.join('{0} {1:.2f}s'.format(name, seconds)
+                                         for name, seconds, queries, entered in self.get_phases())))
+
+        try:
+            ReportRun.objects.create(
+                mission_id=self.mission_id,
+                kind=self.kind,
+                started_at=self.started_at,
+                succeeded=succeeded,
+                duration=duration,
+                test_cases=self.test_cases,
+                images_embedded=self.images_embedded,
+                fragments_reused=self.fragments_reused,
+                query_count=self.queries,
+                bytes_read=self.bytes_read,
+                output_size=self.output_size,
+                peak_memory=peak_memory,
+                phase_timings=json.dumps(self.get_phases()),
+            )
+            self.prune(self.mission_id)
+        except DatabaseError:
+            # Bookkeeping only; never fail (or hide the failure of) the report itself
+            logger.warning('Unable to record the {kind} run for mission {mission}'.format(
+                kind=self.kind, mission=self.mission_id), exc_info=True)
+
+    @staticmethod
+    def prune(mission_id):
+        history_length = getattr(settings, 'REPORT_RUN_HISTORY_LENGTH', 50)
+        stale = ReportRun.objects.filter(mission_id=mission_id) \
+            .order_by('-started_at', '-id').values_list('id', flat=True)[history_length:]
+        ReportRun.objects.filter(id__in=list(stale)).delete()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish(succeeded=exc_type is None)
+
+    def record_stream(self, chunks, phase):
+        """
+        Times producing each chunk of a stream (but not the consumer's handling of it) as the phase, adds up the
+        output size and finishes the run when the stream ends, fails or is closed early.
+        :param chunks: Iterable of bytes
+        :return: Generator of the same chunks
+        """
+        succeeded = False
+        try:
+            iterator = iter(chunks)
+            while True:
+                with self.phase(phase):
+                    chunk = next(iterator, None)
+                if chunk is None:
+                    break
+                self.output_size += len(chunk)
+                yield chunk
+            succeeded = True
+        finally:
+            self.finish(succeeded=succeeded)
@@ -0,0 +1,335 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, connection, DatabaseError
+from django.db.models import Q
+from django.utils.timezone import now
+
+from missions.models import Mission, ReportJob
+from .artifacts import ReportArtifactCache
+
+logger = logging.getLogger(__name__)
+
+
+class ReportJobRunner(object):
+    """
+    Runs queued ReportJobs on a small pool of in-process worker threads so report and supporting data package
+    builds never tie up a request worker. Set REPORT_JOB_RUNNER = 'external' to only queue jobs and have them
+    processed by `manage.py process_report_jobs` instead.
+
+    Each job records the process it's queued in or running on (its runner), and that process sends a heartbeat for
+    all of its jobs every HEARTBEAT_INTERVAL seconds. Jobs without one for REPORT_JOB_STALE_SECONDS belong to a
+    process which has gone away (with the thread runner, taking its queue with it); recover_stale_jobs() fails
+    them if they were running and takes them over if they were still queued, and they are never shared with new
+    requests. Jobs queued for an external worker have no runner until one claims them.
+    """
+
+    # Minimum number of seconds between progress writes while a job is mid-phase; phase changes are always saved
+    PROGRESS_SAVE_INTERVAL = 1.0
+
+    # Seconds between a process's heartbeats for its queued and running jobs; well under REPORT_JOB_STALE_SECONDS
+    HEARTBEAT_INTERVAL = 30
+
+    STALE_MESSAGE = 'The job stopped responding before it finished; please try again.'
+    FAILED_MESSAGE = 'The {kind} could not be generated; please try again or ask an administrator to check the log.'
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    _runner_id = None
+    _heartbeats = None
+    _heartbeats_lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'REPORT_JOB_WORKERS', 2),
+                    thread_name_prefix='dart-report-job',
+                )
+            return cls._executor
+
+    @staticmethod
+    def get_output_dir():
+        output_dir = getattr(settings, 'REPORT_JOB_OUTPUT_DIR', os.path.join(settings.BASE_DIR, 'data', 'report_jobs'))
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        return output_dir
+
+    @staticmethod
+    def is_threaded():
+        return getattr(settings, 'REPORT_JOB_RUNNER', 'thread') == 'thread'
+
+    @classmethod
+    def get_runner_id(cls):
+        """ :return: Identifies this process as the runner of the jobs it queues and runs """
+        with cls._heartbeats_lock:
+            # Forked processes (e.g. web server workers) get their own
+            if cls._runner_id is None or cls._runner_id[1] != os.getpid():
+                cls._runner_id = ('{host}:{pid}:{nonce}'.format(host=socket.gethostname(), pid=os.getpid(),
+                                                                 nonce=uuid.uuid4().hex[:8]), os.getpid())
+            return cls._runner_id[0]
+
+    @staticmethod
+    def get_stale_cutoff():
+        """ :return: Jobs whose last heartbeat is older than this are stale """
+        return now() - timedelta(seconds=getattr(settings, 'REPORT_JOB_STALE_SECONDS', 300))
+
+    @classmethod
+    def is_stale(cls, job):
+        """ :return: True if the job is unfinished and its process has gone away; see recover_stale_jobs """
+        return not job.is_finished() and job.heartbeat_at < cls.get_stale_cutoff() and \
+            (job.status == ReportJob.STATUS_RUNNING or bool(job.runner))
+
+    @classmethod
+    def submit(cls, mission_id, kind, user=None):
+        """
+        Queues a new job and, unless an external worker is configured, hands it to the thread pool. If a job for
+        the same output (mission, kind and content version) is already queued or running, that job is returned
+        instead so everyone waiting on it shares one build.
+        """
+
+        cls.prune_expired_jobs()
+        cls.recover_stale_jobs()
+
+        content_version = Mission.objects.values_list('content_version', flat=True).get(pk=mission_id)
+        # Jobs still pending (see is_stale): those queued for an external worker don't get heartbeats until it
+        # claims them
+        pending = ReportJob.objects.filter(
+            Q(heartbeat_at__gte=cls.get_stale_cutoff()) | Q(status=ReportJob.STATUS_QUEUED, runner=''),
+            mission_id=mission_id,
+            kind=kind,
+            content_version=content_version,
+            status__in=[ReportJob.STATUS_QUEUED, ReportJob.STATUS_RUNNING],
+        ).order_by('created_at').first()
+        if pending is not None:
+            logger.info('Sharing {job}'.format(job=pending))
+            return pending
+
+        job = ReportJob.objects.create(
+            mission_id=mission_id,
+            kind=kind,
+            content_version=content_version,
+            requested_by=user if user is not None and user.is_authenticated else None,
+            runner=cls.get_runner_id() if cls.is_threaded() else '',
+        )
+        logger.info('Queued {job}'.format(job=job))
+
+        if cls.is_threaded():
+            cls.start_heartbeats()
+            cls.get_executor().submit(cls._run_in_thread, job.pk)
+
+        return job
+
+    @classmethod
+    def recover_stale_jobs(cls):
+        """
+        Fails running jobs whose process has stopped sending heartbeats. With the thread runner, queued jobs whose
+        process has stopped are taken over by this one and handed to its thread pool; jobs queued for an external
+        worker wait for it however long that takes.
+        """
+        cutoff = cls.get_stale_cutoff()
+        stale = ReportJob.objects.filter(heartbeat_at__lt=cutoff)
+
+        failed = stale.filter(status=ReportJob.STATUS_RUNNING).update(
+            status=ReportJob.STATUS_FAILED,
+            message=cls.STALE_MESSAGE,
+            finished_at=now(),
+        )
+        if failed:
+            logger.warning('Failed {count} report job(s) that stopped sending heartbeats'.format(count=failed))
+
+        if cls.is_threaded():
+            runner = cls.get_runner_id()
+            for stale_id in stale.filter(status=ReportJob.STATUS_QUEUED).exclude(runner='') \
+                    .values_list('id', flat=True):
+                # Only one process takes each job over
+                if ReportJob.objects.filter(pk=stale_id, status=ReportJob.STATUS_QUEUED, heartbeat_at__lt=cutoff) \
+                        .update(runner=runner, heartbeat_at=now()):
+                    logger.warning('Took over report job {job_id}, queued by a process which has gone away'.format(
+                        job_id=stale_id))
+                    cls.start_heartbeats()
+                    cls.get_executor().submit(cls._run_in_thread, stale_id)
+
+    @classmethod
+    def claim(cls, job_id):
+        """ Atomically moves a queued job to running; returns False if another worker got to it first """
+        claimed = ReportJob.objects.filter(pk=job_id, status=ReportJob.STATUS_QUEUED).update(
+            status=ReportJob.STATUS_RUNNING,
+            runner=cls.get_runner_id(),
+            started_at=now(),
+            heartbeat_at=now(),
+        )
+        return claimed == 1
+
+    @classmethod
+    def start_heartbeats(cls):
+        """ Starts this process's heartbeat thread, unless it's already running """
+        cls.get_runner_id()
+        with cls._heartbeats_lock:
+            if cls._heartbeats is None or not cls._heartbeats.is_alive():
+                cls._heartbeats = threading.Thread(target=cls._send_heartbeats, args=(cls._runner_id[0],),
+                                                   name='dart-report-job-heartbeat', daemon=True)
+                cls._heartbeats.start()
+
+    @classmethod
+    def _send_heartbeats(cls, runner):
+        """ Runs for the life of the process: a single update per interval covers every job the process has """
+        while True:
+            time.sleep(cls.HEARTBEAT_INTERVAL)
+            close_old_connections()
+            try:
+                ReportJob.objects.filter(
+                    runner=runner,
+                    status__in=[ReportJob.STATUS_QUEUED, ReportJob.STATUS_RUNNING],
+                ).update(heartbeat_at=now())
+            except DatabaseError:
+                logger.warning('Unable to record a heartbeat for report jobs', exc_info=True)
+
+    @classmethod
+    def _run_in_thread(cls, job_id):
+        # Worker threads get their own database connection; make sure it is released when the job is done
+        close_old_connections()
+        try:
+            if cls.claim(job_id):
+                cls.run(job_id)
+        finally:
+            connection.close()
+
+    @classmethod
+    def run(cls, job_id):
+        """ Builds the output for a claimed job, recording progress as generation moves along """
+
+        job = ReportJob.objects.get(pk=job_id)
+        zip_attachments = job.kind == ReportJob.KIND_ATTACHMENTS
+        last_saved = {'phase': None, 'at': 0.0}
+
+        def progress(phase, current, total, images_embedded):
+            job.phase = phase
+            job.progress_current = current
+            job.progress_total = total
+            job.images_embedded = images_embedded
+
+            # Throttle writes so a long report doesn't hold the database hostage with progress updates
+            if phase != last_saved['phase'] or time.time() - last_saved['at'] >= cls.PROGRESS_SAVE_INTERVAL:
+                job.save(update_fields=['phase', 'progress_current', 'progress_total', 'images_embedded'])
+                last_saved['phase'] = phase
+                last_saved['at'] = time.time()
+
+        try:
+            output_file, name = ReportArtifactCache.fetch(job.mission_id,
+                                                          zip_attachments=zip_attachments,
+                                                          progress=progress)
+
+            if zip_attachments:
+                extension = 'zip'
+                output_name = '{}_{}_supporting_data.zip'.format(name, job.mission_id)
+            else:
+                extension = 'docx'
+                output_name = '{}_{}_mission_report.docx'.format(name, job.mission_id)
+
+            output_path = os.path.join(cls.get_output_dir(), 'job_{}.{}'.format(job.pk, extension))
+            with output_file:
+                cls.link_output(output_file, output_path)
+
+            finished = {
+                'output_path': output_path,
+                'output_name': output_name,
+                'status': ReportJob.STATUS_COMPLETE,
+                'message': 'Complete',
+            }
+
+        except Exception:
+            # The details go to the log; the message is shown to the user
+            logger.exception('Report job {job_id} failed'.format(job_id=job_id))
+            finished = {
+                'status': ReportJob.STATUS_FAILED,
+                'message': cls.FAILED_MESSAGE.format(kind=job.get_kind_display().lower()),
+            }
+
+        finished['finished_at'] = now()
+        # Only the fields the job's outcome changes, and only if it hasn't been recovered as stale in the meantime
+        if ReportJob.objects.filter(pk=job.pk, status=ReportJob.STATUS_RUNNING).update(**finished):
+            logger.info('Finished {job} ({status})'.format(job=job, status=finished['status']))
+        else:
+            logger.warning('{job} was recovered as stale before it finished; discarding its output'.format(job=job))
+            if 'output_path' in finished:
+                cls._remove(finished['output_path'])
+
+        job.refresh_from_db()
+        return job
+
+    @staticmethod
+    def link_output(output_file, output_path):
+        """
+        Gives the job its own name for a cached artifact: a hard link to the cache entry, so no second copy of the
+        file is written, or where that's not possible (a different file system, or the entry was evicted or
+        replaced after being opened) a copy of the open file.
+        """
+        try:
+            os.link(output_file.name, output_path)
+            if os.path.samestat(os.fstat(output_file.fileno()), os.stat(output_path)):
+                return
+            os.remove(output_path)
+        except OSError:
+            pass
+
+        output_file.seek(0)
+        with open(output_path, 'wb') as f:
+            shutil.copyfileobj(output_file, f)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @classmethod
+    def run_queued_jobs(cls):
+        """ Processes every queued job in submission order; used by the process_report_jobs command """
+        cls.recover_stale_jobs()
+        cls.start_heartbeats()
+        processed = 0
+        for job_id in ReportJob.objects.filter(status=ReportJob.STATUS_QUEUED) \
+                .order_by('created_at').values_list('id', flat=True):
+            if cls.claim(job_id):
+                cls.run(job_id)
+                processed += 1
+        return processed
+
+    @staticmethod
+    def prune_expired_jobs():
+        """ Removes finished jobs (and their output files) older than REPORT_JOB_RETENTION_HOURS """
+        retention = timedelta(hours=getattr(settings, 'REPORT_JOB_RETENTION_HOURS', 24))
+        expired = ReportJob.objects.filter(
+            status__in=[ReportJob.STATUS_COMPLETE, ReportJob.STATUS_FAILED],
+            finished_at__lt=now() - retention,
+        )
+        # Delete individually so the post_delete handler removes each output file
+        for job in expired:
+            job.delete()
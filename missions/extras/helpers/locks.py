@@ -0,0 +1,170 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from contextlib import contextmanager
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: locks only exclude the threads of this process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to take a lock or build slot while waiting for one
+POLL_INTERVAL = 0.25
+
+
+class LockTimeout(Exception):
+    """ A lock or build slot didn't come free within the time allowed """
+    pass
+
+
+class FileLock(object):
+    """
+    An exclusive lock held through a lock file, so it's shared by every thread and process (e.g. web server
+    workers and the process_report_jobs worker) on the host. Each FileLock opens the file itself; create one per
+    acquisition rather than sharing an instance between threads.
+    """
+
+    # Stand-ins for file locks where they aren't available; {path: threading.Lock}
+    _thread_locks = {}
+    _thread_locks_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.thread_lock = None
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        :param timeout: When blocking, the most seconds to wait for the lock (None: wait as long as it takes)
+        :return: True if the lock was acquired (always, when blocking without a timeout)
+        """
+        if fcntl is None:
+            with self._thread_locks_lock:
+                thread_lock = self._thread_locks.setdefault(self.path, threading.Lock())
+            if not thread_lock.acquire(blocking, -1 if timeout is None or not blocking else timeout):
+                return False
+            self.thread_lock = thread_lock
+            return True
+
+        if blocking and timeout is not None:
+            # flock() can't time out; poll for the lock until the deadline instead
+            deadline = time.monotonic() + timeout
+            while not self.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(POLL_INTERVAL)
+            return True
+
+        lock_file = open(self.path, 'ab')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        except BaseException:
+            lock_file.close()
+            raise
+        self.file = lock_file
+        return True
+
+    def release(self):
+        if self.file is not None:
+            # Closing the file releases the lock
+            self.file.close()
+            self.file = None
+        if self.thread_lock is not None:
+            self.thread_lock.release()
+            self.thread_lock = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class ReportBuildSlots(object):
+    """
+    Admission control for report and supporting data package builds: at most REPORT_BUILD_CONCURRENCY builds run
+    at once across every process on the host, so a burst of report requests can't take all the workers and memory
+    away from everyone else. Further builds wait for a slot to free up; requests served synchronously only wait
+    REPORT_BUILD_WAIT_TIMEOUT seconds (see get_wait_timeout) so they can't tie up a web server worker indefinitely.
+    """
+
+    @staticmethod
+    def get_lock_dir():
+        lock_dir = getattr(settings, 'REPORT_BUILD_LOCK_DIR',
+                           os.path.join(settings.BASE_DIR, 'data', 'cache', 'report_locks'))
+        if not os.path.isdir(lock_dir):
+            os.makedirs(lock_dir, exist_ok=True)
+        return lock_dir
+
+    @staticmethod
+    def get_wait_timeout():
+        """ :return: Seconds a request served synchronously may wait for a build lock or slot """
+        return getattr(settings, 'REPORT_BUILD_WAIT_TIMEOUT', 30)
+
+    @classmethod
+    def get_lock(cls, name):
+        """ :return: A FileLock in the lock directory """
+        return FileLock(os.path.join(cls.get_lock_dir(), name + '.lock'))
+
+    @classmethod
+    @contextmanager
+    def hold(cls, on_wait=None, timeout=None):
+        """
+        Waits for a free build slot and holds it for the duration of the block.
+        :param on_wait: Optional callable, called once if all the slots are taken and the build has to wait
+        :param timeout: Most seconds to wait for a slot (None: wait as long as it takes)
+        :raise LockTimeout: If no slot came free in time
+        """
+        limit = getattr(settings, 'REPORT_BUILD_CONCURRENCY', 2)
+        if not limit:
+            yield
+            return
+
+        slots = [cls.get_lock('build-slot-{0}'.format(slot)) for slot in range(limit)]
+        started = None
+        while True:
+            for slot in slots:
+                if slot.acquire(blocking=False):
+                    if started is not None:
+                        logger.info('Waited {seconds:.2f}s for a free report build slot'.format(
+                            seconds=time.perf_counter() - started))
+                    try:
+                        yield
+                    finally:
+                        slot.release()
+                    return
+
+            if started is None:
+                started = time.perf_counter()
+                logger.info('All {limit} report build slots are in use; waiting'.format(limit=limit))
+                if on_wait is not None:
+                    on_wait()
+            elif timeout is not None and time.perf_counter() - started >= timeout:
+                logger.warning('No report build slot came free within {timeout}s'.format(timeout=timeout))
+                raise LockTimeout('No report build slot came free within {timeout}s'.format(timeout=timeout))
+            time.sleep(POLL_INTERVAL)
@@ -0,0 +1,118 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import logging
+import mimetypes
+
+from docx.image import SIGNATURES
+from docx.image.exceptions import UnexpectedEndOfFileError, InvalidImageStreamError
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+METADATA_FIELDS = (
+    'content_type',
+    'image_format',
+    'image_width',
+    'image_height',
+    'file_size',
+    'content_hash',
+)
+
+
+class SupportingDataMetadata(object):
+    """
+    Detects what an uploaded supporting data file is once, at upload, so report generation can tell screenshots
+    from file attachments without opening every file on every run.
+
+    Images are recognized exactly the way python-docx recognizes them when they're embedded in the report (same
+    signatures and header parsing), so anything flagged as an image can be embedded.
+    """
+
+    @staticmethod
+    def read_image_header(stream):
+        """
+        :return: python-docx's parsed image header for the stream, or None if it isn't an image docx can embed
+        """
+        stream.seek(0)
+        header = stream.read(32)
+        for image_class, offset, signature in SIGNATURES:
+            if header[offset:offset + len(signature)] == signature:
+                try:
+                    return image_class.from_stream(stream)
+                except (InvalidImageStreamError, UnexpectedEndOfFileError):
+                    # Damaged image; it's attached as a file rather than dropped
+                    logger.warning('Unable to parse the image header of {name}; treating it as a file'.format(
+                        name=getattr(stream, 'name', 'upload')), exc_info=True)
+                    return None
+        return None
+
+    @classmethod
+    def detect(cls, field_file):
+        """
+        :param field_file: The SupportingData.test_file
+        :return: {field name: value} for each of METADATA_FIELDS
+        """
+        content_hash = hashlib.sha256()
+        file_size = 0
+
+        with open(field_file.path, 'rb') as stream:
+            image_header = cls.read_image_header(stream)
+
+            stream.seek(0)
+            for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+                content_hash.update(chunk)
+                file_size += len(chunk)
+
+        if image_header is not None:
+            content_type = image_header.content_type
+        else:
+            content_type = mimetypes.guess_type(field_file.name)[0] or 'application/octet-stream'
+
+        return {
+            'content_type': content_type,
+            'image_format': image_header.default_ext if image_header is not None else '',
+            'image_width': image_header.px_width if image_header is not None else None,
+            'image_height': image_header.px_height if image_header is not None else None,
+            'file_size': file_size,
+            'content_hash': content_hash.hexdigest(),
+        }
+
+    @classmethod
+    def refresh(cls, supporting_data, force=False):
+        """
+        Records the metadata for an upload that doesn't have it yet (or whose file was replaced).
+        :return: True if the metadata changed
+        """
+        if not force and supporting_data.has_metadata() and not supporting_data.test_file_changed():
+            return False
+
+        try:
+            values = cls.detect(supporting_data.test_file)
+        except (OSError, ValueError):
+            logger.warning('Unable to read {name} to record its metadata'.format(
+                name=supporting_data.test_file.name), exc_info=True)
+            return False
+
+        changed = any(getattr(supporting_data, name) != value for name, value in values.items())
+        for name, value in values.items():
+            setattr(supporting_data, name, value)
+
+        # Update rather than save so the post_save handlers don't run again
+        type(supporting_data).objects.filter(pk=supporting_data.pk).update(**values)
+        supporting_data.mark_test_file_loaded()
+        return changed
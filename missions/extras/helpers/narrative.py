@@ -0,0 +1,122 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+import re
+
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement
+from docx.oxml.ns import nsmap
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Characters python-docx turns into elements of their own (w:tab, w:br) when setting a run's text
+RUN_CONTROL_CHARACTERS = re.compile(r'([\t\r\n])')
+
+
+class NarrativeWriter(object):
+    """
+    Adds whole sections of text to a report at once. python-docx's document.add_paragraph() looks for the end of
+    the document (the section properties) every time it's called, so adding a long narrative a line at a time gets
+    slower as the report grows; these build the paragraph elements up front and insert them in one go, with the
+    same markup add_paragraph() produces.
+    """
+
+    @staticmethod
+    def make_paragraph(text, style_id=None):
+        """ :return: A detached w:p element holding the text in a single run, as document.add_paragraph() would """
+        p = OxmlElement('w:p')
+        if style_id is not None:
+            p.style = style_id
+        if text:
+            r = OxmlElement('w:r')
+            # Same content as Run.text = text, which works through the text a character at a time
+            for piece in RUN_CONTROL_CHARACTERS.split(text):
+                if piece == '\t':
+                    r.add_tab()
+                elif piece == '\r' or piece == '\n':
+                    r.add_br()
+                elif piece:
+                    r.add_t(piece)
+            p.append(r)
+        return p
+
+    @classmethod
+    def append_paragraphs(cls, document, texts, style=None):
+        """
+        Adds a paragraph for each text to the end of the document.
+        :param style: Paragraph style name (or None for the default paragraph style)
+        :return: The number of paragraphs added
+        """
+        style_id = document.part.get_style_id(style, WD_STYLE_TYPE.PARAGRAPH) if style is not None else None
+        paragraphs = [cls.make_paragraph(text, style_id) for text in texts]
+
+        body = document._body._element
+        sectPr = body.sectPr
+        position = body.index(sectPr) if sectPr is not None else len(body)
+        body[position:position] = paragraphs
+        return len(paragraphs)
+
+
+class SlugReplacer(object):
+    """
+    Replaces handlebar slugs (e.g. {{MISSION}}) in the text of a document's paragraphs in a single pass: one
+    compiled alternation over every run, found with one XPath query per story (body, including tables, headers and
+    footers) rather than testing each slug against each run in Python.
+
+    Slugs are replaced within a run, so a slug Word has split across runs (e.g. by spell-check marks) is left as is.
+    Replacement values are inserted literally and aren't searched for slugs themselves.
+    """
+
+    def __init__(self, slugs):
+        """
+        :param slugs: {slug: replacement text}
+        """
+        self.slugs = dict(slugs)
+        self.pattern = re.compile('|'.join(re.escape(slug) for slug in sorted(self.slugs, key=len, reverse=True)))
+
+        # Narrows the runs down in lxml before their text is assembled in Python (and checked against the pattern)
+        self.variables = {'slug{0}'.format(i): slug for i, slug in enumerate(self.slugs)}
+        self.find_runs = etree.XPath('.//w:p/w:r[{0}]'.format(
+            ' or '.join('contains(string(.), ${0})'.format(name) for name in self.variables)), namespaces=nsmap)
+
+    def get_stories(self, document):
+        """ :return: Root elements of the document body and of each header & footer """
+        stories = [document.element.body]
+        for rel in document.part.rels.values():
+            if not rel.is_external and rel.reltype in (RT.HEADER, RT.FOOTER):
+                stories.append(rel.target_part.element)
+        return stories
+
+    def replace(self, document):
+        """ :return: The number of runs changed """
+        if not self.slugs:
+            return 0
+
+        runs_changed = 0
+        for story in self.get_stories(document):
+            for r in self.find_runs(story, **self.variables):
+                old_text = r.text
+                new_text = self.pattern.sub(lambda match: self.slugs[match.group(0)], old_text)
+                if new_text != old_text:
+                    logger.debug('>> Replaced: {old} With: {new}'.format(
+                        old=old_text.encode('utf-8'),
+                        new=new_text.encode('utf-8'),
+                    ))
+                    r.text = new_text
+                    runs_changed += 1
+        return runs_changed
@@ -0,0 +1,129 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def read_file(path):
+    """ :return: (file contents, seconds spent reading) """
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        data = f.read()
+    return data, time.perf_counter() - started
+
+
+class AttachmentPrefetcher(object):
+    """
+    Reads the files a report is about to embed on a small thread pool, ahead of the test case being laid out, so
+    slow storage (e.g. an NFS MEDIA_ROOT) is read while the main thread is busy building the document.
+
+    Files are read in the order they were scheduled, with at most REPORT_PREFETCH_MAX_BYTES read but not yet
+    consumed (a file bigger than that is still read, on its own). Use as a context manager.
+    """
+
+    def __init__(self, files):
+        """
+        :param files: (path, expected size in bytes or None) for each file, in the order they'll be opened
+        """
+        self.max_bytes = getattr(settings, 'REPORT_PREFETCH_MAX_BYTES', 64 * 1024 * 1024)
+        self.workers = getattr(settings, 'REPORT_PREFETCH_WORKERS', 4)
+        self.executor = None
+
+        self.pending = deque()
+        seen = set()
+        for path, size in files:
+            if path not in seen:
+                seen.add(path)
+                self.pending.append((path, size or 0))
+
+        self.in_flight = OrderedDict()  # path: (future, size)
+        self.bytes_in_flight = 0
+
+        self.files_read = 0
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def __enter__(self):
+        if self.workers > 0 and self.pending:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dart-prefetch')
+            self.top_up()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            for future, size in self.in_flight.values():
+                future.cancel()
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.in_flight.clear()
+
+    def top_up(self):
+        """ Starts reading scheduled files until the memory ceiling is reached """
+        while self.pending:
+            path, size = self.pending[0]
+            if self.in_flight and self.bytes_in_flight + size > self.max_bytes:
+                break
+            self.pending.popleft()
+            self.in_flight[path] = (self.executor.submit(read_file, path), size)
+            self.bytes_in_flight += size
+
+    def open(self, path):
+        """
+        :return: The file's contents as a BytesIO; read now if it wasn't scheduled (or prefetching is off)
+        :raise OSError: If the file can't be read
+        """
+        if path in self.in_flight:
+            future, size = self.in_flight.pop(path)
+            self.bytes_in_flight -= size
+
+            started = time.perf_counter()
+            try:
+                data, read_seconds = future.result()
+            finally:
+                self.wait_seconds += time.perf_counter() - started
+                self.top_up()
+        else:
+            # Not scheduled, or this report is consuming files out of order
+            self.pending = deque(entry for entry in self.pending if entry[0] != path)
+            data, read_seconds = read_file(path)
+            self.wait_seconds += read_seconds
+
+        self.files_read += 1
+        self.bytes_read += len(data)
+        self.read_seconds += read_seconds
+        return BytesIO(data)
+
+    @property
+    def overlapped_seconds(self):
+        """ Time spent reading files while the report was being laid out rather than waiting on the read """
+        return max(0.0, self.read_seconds - self.wait_seconds)
+
+    def get_timings(self):
+        return {
+            'files': self.files_read,
+            'bytes': self.bytes_read,
+            'read_seconds': self.read_seconds,
+            'wait_seconds': self.wait_seconds,
+            'overlapped_seconds': self.overlapped_seconds,
+        }
@@ -0,0 +1,98 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import copy
+import logging
+
+from docx.table import Table, _Cell
+
+logger = logging.getLogger(__name__)
+
+
+class TablePrototype(object):
+    """
+    A copy of one of the report template's tables with its unused rows already removed and its static text (e.g. the
+    classification markings) already filled in. Each test case clones the prototype rather than the template, and
+    gets its cells by name instead of looking them up through python-docx's row/column grid.
+    """
+
+    def __init__(self, template_table, cells, removed_rows=()):
+        """
+        :param template_table: The python-docx table to copy
+        :param cells: {name: (row, column)} of each cell that's filled in, in the template table's coordinates
+        :param removed_rows: Indexes (in the template table) of the rows to leave out
+        """
+        self.table = Table(copy.deepcopy(template_table._tbl), template_table._parent)
+
+        # Look cells up before any rows are removed so the names line up with the template's coordinates
+        self.cells = {name: self.table.cell(row, column) for name, (row, column) in cells.items()}
+
+        rows = self.table._tbl.tr_lst
+        for row in removed_rows:
+            self.table._tbl.remove(rows[row])
+
+        self.paths = {name: self.get_path(self.table._tbl, cell._tc) for name, cell in self.cells.items()}
+
+    @staticmethod
+    def get_path(ancestor, element):
+        """ :return: Child indexes leading from the ancestor down to the element """
+        path = []
+        while element is not ancestor:
+            parent = element.getparent()
+            path.append(parent.index(element))
+            element = parent
+        return tuple(reversed(path))
+
+    @staticmethod
+    def resolve_path(ancestor, path):
+        element = ancestor
+        for index in path:
+            element = element[index]
+        return element
+
+    def clone(self, document):
+        """
+        Appends a copy of the prototype to the end of the document.
+        :return: (python-docx table, {name: python-docx cell})
+        """
+        tbl = copy.deepcopy(self.table._tbl)
+        document._body._element._insert_tbl(tbl)
+        table = Table(tbl, document._body)
+        cells = {name: _Cell(self.resolve_path(tbl, path), table) for name, path in self.paths.items()}
+        return table, cells
+
+
+class TablePrototypeCache(object):
+    """
+    The table prototypes used while generating one report, built the first time each combination (e.g. of include
+    flags) is needed.
+    """
+
+    def __init__(self):
+        self.prototypes = {}
+
+    def get(self, key, build):
+        """
+        :param key: Identifies the combination (must be hashable)
+        :param build: Called without arguments to create the TablePrototype if it isn't cached yet
+        """
+        prototype = self.prototypes.get(key)
+        if prototype is None:
+            prototype = self.prototypes[key] = build()
+            logger.debug('Built table prototype {count} for {key}'.format(count=len(self.prototypes), key=key))
+        return prototype
+
+    def __len__(self):
+        return len(self.prototypes)
@@ -0,0 +1,154 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+from io import BytesIO
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+try:
+    from PIL import Image
+except ImportError:  # Renditions are skipped and reports embed the original uploads
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'renditions'
+
+# Formats Word handles natively and which are reasonably compact; others (BMP, TIFF...) are always transcoded
+EMBEDDABLE_FORMATS = ('PNG', 'JPEG', 'GIF')
+EMBEDDABLE_EXTENSIONS = ('png', 'jpg', 'gif')
+
+
+def get_embed_width_inches():
+    return getattr(settings, 'REPORT_IMAGE_EMBED_WIDTH_INCHES', 5)
+
+
+class ReportImageRendition(object):
+    """
+    Report-ready copies of screenshot uploads: scaled down to the width they are embedded at in the report (at
+    REPORT_IMAGE_EMBED_DPI) and transcoded to PNG/JPEG where needed, so a report doesn't carry every capture at full
+    resolution. The original upload is left untouched for download and the data package.
+    """
+
+    @staticmethod
+    def is_available():
+        return Image is not None
+
+    @staticmethod
+    def get_max_width():
+        """ Widest a rendition needs to be, in pixels """
+        return int(get_embed_width_inches() * getattr(settings, 'REPORT_IMAGE_EMBED_DPI', 150))
+
+    @staticmethod
+    def get_name(supporting_data):
+        """ Rendition names are derived from the upload's name, so replacing the upload makes the rendition stale """
+        source = hashlib.sha1(supporting_data.test_file.name.encode('utf-8')).hexdigest()[:12]
+        return '{dir}/{pk}-{source}'.format(dir=RENDITION_DIR, pk=supporting_data.pk, source=source)
+
+    @classmethod
+    def is_current(cls, supporting_data):
+        return os.path.splitext(supporting_data.report_rendition.name)[0] == cls.get_name(supporting_data)
+
+    @classmethod
+    def needs_rendition(cls, supporting_data):
+        """ Decides from the recorded metadata alone whether an upload needs a rendition """
+        if not supporting_data.image_format:
+            return False  # Not a screenshot
+        return supporting_data.image_format not in EMBEDDABLE_EXTENSIONS or \
+            (supporting_data.image_width or 0) > cls.get_max_width()
+
+    @classmethod
+    def render(cls, path):
+        """
+        :return: (encoded image bytes, file extension) of the rendition for an image file, or None if the original
+                 can be embedded as is (or isn't an image Pillow can read)
+        """
+        try:
+            image = Image.open(path)
+        except (OSError, Image.DecompressionBombError):
+            return None
+
+        with image:
+            max_width = cls.get_max_width()
+            needs_resize = image.width > max_width
+            if not needs_resize and image.format in EMBEDDABLE_FORMATS:
+                return None
+
+            if image.format == 'JPEG':
+                output_format, extension, options = 'JPEG', 'jpg', {
+                    'quality': getattr(settings, 'REPORT_IMAGE_JPEG_QUALITY', 85)}
+            else:
+                # Screenshots & diagrams: lossless keeps text legible
+                output_format, extension, options = 'PNG', 'png', {'optimize': True}
+
+            try:
+                image.seek(0)  # First frame of an animated GIF or multi-page TIFF
+                rendition = image.convert('RGB' if output_format == 'JPEG' else
+                                          'RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+                if needs_resize:
+                    height = max(1, round(image.height * max_width / image.width))
+                    rendition = rendition.resize((max_width, height), Image.LANCZOS)
+
+                dpi = getattr(settings, 'REPORT_IMAGE_EMBED_DPI', 150)
+                output = BytesIO()
+                rendition.save(output, format=output_format, dpi=(dpi, dpi), **options)
+            except (OSError, ValueError):
+                logger.warning('Unable to create a report rendition of {path}'.format(path=path), exc_info=True)
+                return None
+
+        return output.getvalue(), extension
+
+    @classmethod
+    def refresh(cls, supporting_data, force=False):
+        """
+        Creates (or replaces) the rendition for an upload if it doesn't have a current one.
+        :return: True if the supporting data's report_rendition changed
+        """
+        if not cls.is_available():
+            return False
+        if not force and cls.is_current(supporting_data):
+            return False
+        if supporting_data.has_metadata() and not supporting_data.report_rendition and \
+                not cls.needs_rendition(supporting_data):
+            return False
+
+        old_name = supporting_data.report_rendition.name
+        rendered = cls.render(supporting_data.test_file.path) if supporting_data.test_file else None
+
+        if rendered is None:
+            if not old_name:
+                return False
+            new_name = ''
+        else:
+            data, extension = rendered
+            name = '{}.{}'.format(cls.get_name(supporting_data), extension)
+            storage = supporting_data.report_rendition.storage
+            if storage.exists(name):
+                storage.delete(name)
+            new_name = storage.save(name, ContentFile(data))
+
+        if old_name and old_name != new_name:
+            supporting_data.report_rendition.storage.delete(old_name)
+
+        # Update rather than save so the post_save handlers don't run again
+        type(supporting_data).objects.filter(pk=supporting_data.pk).update(report_rendition=new_name)
+        supporting_data.report_rendition.name = new_name
+        logger.debug('Report rendition for {file}: {rendition}'.format(
+            file=supporting_data.filename(), rendition=new_name or 'original'))
+        return True
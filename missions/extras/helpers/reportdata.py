@@ -0,0 +1,107 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+
+from django.db import connection, transaction
+from django.db.models import Prefetch
+
+from missions.models import Mission, TestDetail, DARTDynamicSettings, Host
+from .sorters import TestSortingHelper
+
+logger = logging.getLogger(__name__)
+
+
+class ReportData(object):
+    """
+    Everything report generation reads from the database, loaded up front in a fixed number of queries no matter
+    how many test cases, hosts or supporting data files the mission has:
+        the mission (and business area), the dynamic settings (and classification legend & colors), the mission's
+        test cases, their source & target hosts, and their supporting data.
+    Everything is read in one read only transaction (see SNAPSHOT_STATEMENTS), so the report sees a consistent
+    snapshot even while others edit the mission: on SQLite the transaction's read lock holds off writers until
+    loading is done, and PostgreSQL and MySQL are switched to REPEATABLE READ. Other backends only get their default
+    isolation, where each query may see changes committed since the one before. Loading never writes: supporting
+    data is ordered by TestSortingHelper.get_mission_supporting_data, which corrects out of date sort orders in
+    memory only (the repair_report_data command persists the corrections).
+    """
+
+    # Run first thing in the loading transaction; {database vendor: SQL}
+    SNAPSHOT_STATEMENTS = {
+        'postgresql': 'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY',
+        'mysql': 'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY',
+    }
+
+    def __init__(self, mission, dynamic_settings, tests, reportable_tests, supporting_data):
+        self.mission = mission
+        self.dynamic_settings = dynamic_settings
+        self.system_classification = dynamic_settings.system_classification
+        self.host_output_format = str(dynamic_settings.host_output_format)
+
+        # Every test case in the mission, in sort order
+        self.tests = tests
+
+        # Test cases included in the report, in sort order
+        self.reportable_tests = reportable_tests
+
+        # {test detail id: [supporting data included in the report, in sort order]}
+        self.supporting_data = supporting_data
+
+    @classmethod
+    def load(cls, mission_id):
+        # The isolation level can only be set before a transaction's first query, i.e. not within an outer one
+        outermost = not connection.in_atomic_block
+        with transaction.atomic():
+            statement = cls.SNAPSHOT_STATEMENTS.get(connection.vendor)
+            if outermost and statement is not None:
+                with connection.cursor() as cursor:
+                    cursor.execute(statement)
+            return cls._load(mission_id)
+
+    @classmethod
+    def _load(cls, mission_id):
+        mission = Mission.objects.select_related('business_area').get(pk=mission_id)
+
+        dynamic_settings = DARTDynamicSettings.objects.select_related(
+            'system_classification__text_color',
+            'system_classification__background_color',
+        ).order_by('pk').first()
+        if dynamic_settings is None:
+            dynamic_settings = DARTDynamicSettings.objects.get_as_object()
+
+        hosts = Host.objects.order_by('pk')
+        tests = list(TestDetail.objects.filter(mission=mission).order_by('sort_position', 'id').prefetch_related(
+            Prefetch('target_hosts', queryset=hosts),
+            Prefetch('source_hosts', queryset=hosts),
+        ))
+
+        data_by_test = TestSortingHelper.get_mission_supporting_data(mission.id)
+        supporting_data = {t.id: data_by_test.get(t.id, []) for t in tests}
+
+        return cls(
+            mission=mission,
+            dynamic_settings=dynamic_settings,
+            tests=tests,
+            reportable_tests=[t for t in tests if t.test_case_include_flag],
+            supporting_data=supporting_data,
+        )
+
+    def format_host(self, host):
+        """ Host as configured by the host output format setting; same as str(host) without the cache lookup """
+        return host.format(self.host_output_format)
+
+    def count_tests(self, has_findings):
+        """ Number of test cases in the mission (reportable or not) with or without findings """
+        return sum(1 for t in self.tests if t.has_findings == has_findings)
@@ -0,0 +1,179 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import logging
+import multiprocessing
+import os
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Phase timings reported by shard workers are recorded under this prefix
+WORKER_PHASE_PREFIX = 'Shard workers: '
+
+# State kept by a shard worker process between the chunks of the report it's working on
+_worker_state = {}
+
+
+def init_worker():
+    """ Shard workers are spawned (not forked), so Django has to be set up again in each one """
+    import django
+    django.setup()
+
+
+def render_chunk(run_id, mission_id, template_name, assignments):
+    """
+    Runs in a shard worker: renders a chunk of a mission's test cases into a copy of the report template and
+    captures each one as a report fragment.
+    :param run_id: Identifies the report being generated; the mission's data is loaded once per report per worker
+    :param assignments: [(test detail id, test case number)] in report order
+    :return: {
+        'fragments': {test detail id: (fragment key, fragment)},
+        'phases': the chunk's phase timings (see PhaseTimer.get_phases),
+        'queries': number of queries made,
+        'bytes_read': bytes of screenshots read,
+    }
+    """
+    # Imported here: this module is imported by the parent before Django is set up in the worker
+    from missions.extras.utils import TestCaseRenderer, LOADING_PHASE, TEMPLATE_PHASE, TEST_CASE_PHASE
+    from .fragments import ReportFragment
+    from .instrumentation import PhaseTimer
+    from .prefetch import AttachmentPrefetcher
+    from .reportdata import ReportData
+    from .templates import ReportTemplateCache
+
+    timer = PhaseTimer()
+
+    if _worker_state.get('run_id') != run_id:
+        _worker_state.clear()
+        _worker_state['run_id'] = run_id
+        with timer.phase(LOADING_PHASE):
+            _worker_state['report_data'] = ReportData.load(mission_id)
+    report_data = _worker_state['report_data']
+
+    tests_by_id = {t.id: t for t in report_data.reportable_tests}
+    supporting_data_by_test = report_data.supporting_data if report_data.mission.supporting_data_include_flag \
+        else {}
+
+    assignments = [(tests_by_id[test_id], number) for test_id, number in assignments if test_id in tests_by_id]
+
+    with timer.phase(TEMPLATE_PHASE):
+        document, template_version = ReportTemplateCache.open(template_name)
+    body = document._body._element
+    results = {}
+
+    prefetcher = AttachmentPrefetcher(
+        (d.report_image_path(), d.file_size)
+        for t, number in assignments for d in supporting_data_by_test.get(t.id, []) if d.image_format)
+
+    with prefetcher, timer.phase(TEST_CASE_PHASE):
+        renderer = TestCaseRenderer(document, report_data, template_version, prefetcher.open, timer=timer)
+
+        for t, number in assignments:
+            my_data = supporting_data_by_test.get(t.id, [])
+            marker = body.sectPr.getprevious()
+            images = renderer.render(t, number, renderer.get_template_table(t), my_data)
+            fragment = ReportFragment.capture(document, marker, images)
+            results[t.id] = (renderer.get_fragment_key(t, number, my_data), fragment)
+
+            # Only the fragment is needed; keeping the document small keeps python-docx's picture id scans cheap
+            for element in list(marker.itersiblings()):
+                if element is not body.sectPr:
+                    body.remove(element)
+
+    return {
+        'fragments': results,
+        'phases': timer.get_phases(),
+        'queries': timer.queries,
+        'bytes_read': prefetcher.bytes_read,
+    }
+
+
+class ReportShards(object):
+    """
+    Renders the test cases of a large report in parallel: the test cases are split into chunks which are rendered
+    by a pool of worker processes (each into its own copy of the template) and returned as report fragments, which
+    the report then splices in order (re-relating images and renumbering drawings, see ReportFragment.splice).
+
+    Used automatically when at least REPORT_SHARD_MIN_TESTS test cases need rendering and REPORT_SHARD_WORKERS is
+    more than 1.
+    """
+
+    @staticmethod
+    def get_workers():
+        """
+        :return: Worker processes per report: REPORT_SHARD_WORKERS, or by default the CPUs shared out between the
+                 REPORT_BUILD_CONCURRENCY builds that may run at once, so together they use at most one process per
+                 CPU
+        """
+        workers = getattr(settings, 'REPORT_SHARD_WORKERS', None)
+        if workers is not None:
+            return workers
+        builds = getattr(settings, 'REPORT_BUILD_CONCURRENCY', 2)
+        return max(1, (os.cpu_count() or 1) // builds) if builds else (os.cpu_count() or 1)
+
+    @classmethod
+    def is_enabled(cls, test_count):
+        return cls.get_workers() > 1 and test_count >= getattr(settings, 'REPORT_SHARD_MIN_TESTS', 200)
+
+    @staticmethod
+    def get_chunks(assignments):
+        chunk_size = max(1, getattr(settings, 'REPORT_SHARD_CHUNK_SIZE', 50))
+        return [assignments[i:i + chunk_size] for i in range(0, len(assignments), chunk_size)]
+
+    @classmethod
+    def render(cls, mission_id, template_name, assignments, progress=None, recorder=None):
+        """
+        :param assignments: [(test detail id, test case number)] in report order
+        :param progress: Optional callable accepting the number of test cases rendered so far
+        :param recorder: Optional ReportRunRecorder to add the workers' phase timings (summed over the workers, under
+                         WORKER_PHASE_PREFIX), queries and file reads to
+        :return: {test detail id: (fragment key, fragment)} for the test cases that were rendered; anything missing
+                 (e.g. a worker failed) is left for the caller to render
+        """
+        run_id = uuid.uuid4().hex
+        chunks = cls.get_chunks(assignments)
+        workers = min(cls.get_workers(), len(chunks))
+        results = {}
+
+        logger.info('Rendering {count} test cases of mission {mission} in {chunks} chunks on {workers} processes'
+                    .format(count=len(assignments), mission=mission_id, chunks=len(chunks), workers=workers))
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=init_worker) as executor:
+                futures = [executor.submit(render_chunk, run_id, mission_id, template_name, chunk)
+                           for chunk in chunks]
+                for future in as_completed(futures):
+                    try:
+                        shard = future.result()
+                    except Exception:
+                        logger.warning('A report shard failed; its test cases will be rendered in process',
+                                       exc_info=True)
+                    else:
+                        results.update(shard['fragments'])
+                        if recorder is not None:
+                            recorder.merge(shard['phases'], prefix=WORKER_PHASE_PREFIX)
+                            recorder.queries += shard['queries']
+                            recorder.bytes_read += shard['bytes_read']
+                    if progress is not None:
+                        progress(len(results))
+        except OSError:
+            logger.warning('Unable to start report shard workers; rendering in process', exc_info=True)
+
+        return results
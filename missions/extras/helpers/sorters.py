@@ -13,155 +13,326 @@
 # limitations under the License.
 #
 
+from bisect import bisect_left
 import logging
 import json
 
-from missions.models import Mission, TestDetail, SupportingData
+from django.db import transaction
+from django.db.models import F, Q
+
+from missions.models import Mission, TestDetail, SupportingData, SORT_POSITION_GAP
 
 logger = logging.getLogger(__name__)
 
 
+class SortOrderConflict(Exception):
+    """ Raised when a reorder is based on an out of date version of the sort order """
+
+    def __init__(self, version, order):
+        super(SortOrderConflict, self).__init__('The sort order has changed (now version {0})'.format(version))
+        self.version = version  # The current version
+        self.order = order  # The current order (list of ids)
+
+
 class TestSortingHelper(object):
 
     @staticmethod
-    def deconflict_and_update(mission_id, tests=None):
-        """ Ensures the mission's testdetail_sort_order is accurate and returns an ordered array of current test Ids """
-
-        logger.debug('Performing TC deconflict and update (mission {mission})'.format(mission=mission_id))
-
-        mission_model = Mission.objects.get(pk=mission_id)
-        sort_order = json.loads(mission_model.testdetail_sort_order)
-        deconflicted_sort_order = []
-        sort_order_dirty = False
-
-        if not tests:
-            try:
-                tests = TestDetail.objects.filter(mission=mission_id)
-            except TestDetail.DoesNotExist:
-                tests = ()
-
-        # If tests exist, but there's no sort order, this may be the first run of this DART version;
-        # We should preserve existing sort order and build the testdetail_sort_order field
-        if tests and not sort_order:
-            logger.debug('TC Deconflict found TCs but no existing order (mission {mission}); ' +
-                        'Building sort order from test case numbers'.format(mission=mission_id))
-            tests.order_by('test_number')
-            sort_order = [test.id for test in tests]
-
-        # Perform a reconcile to catch edge cases where tests have been added or deleted
-        logger.debug('TC Deconflict is reconciling sort order with the database (mission {mission})'
-                    .format(mission=mission_id))
-        test_ids_from_db = [test.id for test in tests]
-        for x in sort_order:
-            if x in test_ids_from_db:
-                deconflicted_sort_order.append(x)
-            else:
-                logger.info('Sort order is dirty (TC has been deleted from DB) (mission {mission}, tc {tc})'
-                            .format(mission=mission_id, tc=x))
-                sort_order_dirty = True  # Id in mission's sort order, but not database (it's been deleted)
-
-        for x in test_ids_from_db:
-            if x not in deconflicted_sort_order:
-                deconflicted_sort_order.append(x)
-                logger.info('Sort order is dirty (TC has been added to DB) (mission {mission}, tc {tc})'
-                            .format(mission=mission_id, tc=x))
-                sort_order_dirty = True  # Id in the database, but not in the mission's sort order (it's been added)
-
-        # Save the reconciled sort order
-        if sort_order_dirty:
-            mission_model.testdetail_sort_order = json.dumps(deconflicted_sort_order)
-            mission_model.save(update_fields=['testdetail_sort_order'])
-            logger.info('Reconciliation Performed (Mission %s): '
-                        'Mission Sort Order: %s; '
-                        'Database TC Records: %s; '
-                        'Result of Deconflict: %s' % (mission_id, sort_order, test_ids_from_db, deconflicted_sort_order))
-
-        return deconflicted_sort_order
+    def reconcile_sort_order(sort_order, ids_from_db):
+        """
+        Reconciles a saved sort order with the ids currently in the database: ids which have been deleted are
+        dropped and new ids are appended. With no saved order, the database order is used as is.
+        :return: (reconciled list of ids, True if it differs from the saved sort order)
+        """
+        if ids_from_db and not sort_order:
+            return list(ids_from_db), False
+
+        ids = set(ids_from_db)
+        reconciled = [x for x in sort_order if x in ids]
+        dirty = len(reconciled) != len(sort_order)
+
+        included = set(reconciled)
+        for x in ids_from_db:
+            if x not in included:
+                reconciled.append(x)
+                included.add(x)
+                dirty = True
+
+        return reconciled, dirty
 
     @staticmethod
-    def deconflict_and_update_supporting_data_sort_order(testdetail_id, testdata=None):
-        """Ensures the supporting_data_sort_order of a test is accurate. Returns ordered array of supporting_data ids"""
-
-        logger.debug('Performing Supporting Data deconflict and update (testdetail {testdetail})'
-                     .format(testdetail=testdetail_id))
-
-        testdetail_model = TestDetail.objects.get(pk=testdetail_id)
-        sort_order = json.loads(testdetail_model.supporting_data_sort_order)
-        deconflicted_sort_order = []
-        sort_order_dirty = False
-
-        # Preserve existing sort order and build the testdetail_sort_order field
-        if testdata and not sort_order:
-            logger.debug('Supporting data for test found but no existing order (testdetail {testdetail}); ' +
-                         'Building default sort order'.format(testdetail=testdetail_id))
-            sort_order = [data.id for data in testdata]
-
-        # Perform a reconcile to catch edge cases where testdata have been added or deleted
-        logger.debug('Supporting Data Deconflict is reconciling sort order with the database (testdetail {testdetail})'
-                     .format(testdetail=testdetail_id))
-        data_ids_from_db = [data.id for data in testdata]
-        for x in sort_order:
-            if x in data_ids_from_db:
-                deconflicted_sort_order.append(x)
-            else:
-                logger.info('Sort order is dirty (Supporting data has been deleted from DB) '
-                            '(testdetail {testdetail}, sd {sd})'.format(testdetail=testdetail_id, sd=x))
-                sort_order_dirty = True  # Id in mission's sort order, but not database (it's been deleted)
-
-        for x in data_ids_from_db:
-            if x not in deconflicted_sort_order:
-                deconflicted_sort_order.append(x)
-                logger.info('Sort order is dirty (Supporting data has been added to DB) '
-                            '(testdetail {testdetail}, sd {sd})'.format(testdetail=testdetail_id, sd=x))
-                sort_order_dirty = True  # Id in the database, but not in the testdetail sort order (it's been added)
-
-        # Save the reconciled sort order
-        if sort_order_dirty:
-            testdetail_model.supporting_data_sort_order = json.dumps(deconflicted_sort_order)
-            testdetail_model.save(update_fields=['supporting_data_sort_order'])
-            logger.info('Reconciliation Performed (TestDetail %s): '
-                        'TestDetail Supporting Data Sort Order: %s; '
-                        'Suppporting Data from Database: %s; '
-                        'Result of Deconflict: %s' % (testdetail_id, sort_order, data_ids_from_db, deconflicted_sort_order))
-
-        return deconflicted_sort_order
+    def get_ordered_testdetails(mission_id, reportable_tests_only=False):
+        """ :return: List of the mission's test cases in sort order """
+        tests = TestDetail.objects.filter(mission=mission_id)
+        if reportable_tests_only:
+            tests = tests.filter(test_case_include_flag=True)
+        return list(tests.order_by('sort_position', 'id'))
+
+    @staticmethod
+    def get_position_between(before, after):
+        """
+        :param before: Sort position of the test case to go after, or None for the start of the list
+        :param after: Sort position of the test case to go before, or None for the end of the list
+        :return: A sort position between the two, or None if there is no room left between them
+        """
+        if before is None and after is None:
+            return SORT_POSITION_GAP
+        if before is None:
+            return after - SORT_POSITION_GAP
+        if after is None:
+            return before + SORT_POSITION_GAP
+        if after - before < 2:
+            return None
+        return (before + after) // 2
+
+    @staticmethod
+    def get_ordered_test_ids(mission_id):
+        return list(TestDetail.objects.filter(mission=mission_id).order_by('sort_position', 'id')
+                    .values_list('id', flat=True))
 
     @classmethod
-    def get_ordered_testdetails(cls, mission_id, reportable_tests_only=False):
+    def _lock_test_order(cls, mission_id, version=None):
+        """
+        Locks the mission's test order for the rest of the transaction (so reorders within a mission are serialized
+        and two moves never pick the same gap) and checks that the reorder is based on the current version of it.
+        :param version: The version the reorder is based on, or None to skip the check
+        :return: The current version
+        """
+        cls._lock_for_write(Mission.objects.filter(pk=mission_id), 'test_order_version')
+        current = Mission.objects.select_for_update().filter(pk=mission_id) \
+            .values_list('test_order_version', flat=True).get()
+        if version is not None and version != current:
+            raise SortOrderConflict(current, cls.get_ordered_test_ids(mission_id))
+        return current
 
-        try:
-            tests = TestDetail.objects.filter(mission=mission_id)
-        except TestDetail.DoesNotExist:
-            tests = ()
+    @staticmethod
+    def _lock_for_write(queryset, field):
+        """
+        Takes the write lock on the rows (a no-op update of field) before the version check reads them. On SQLite,
+        where select_for_update() does nothing, two transactions that had both read the version would deadlock when
+        upgrading to write and one would fail with "database is locked"; this way the second waits for the first to
+        commit and then sees its new version.
+        """
+        queryset.update(**{field: F(field)})
 
-        sort_order = cls.deconflict_and_update(mission_id, tests)
+    @staticmethod
+    def _bump_test_order_version(mission_id, current):
+        Mission.objects.filter(pk=mission_id).update(test_order_version=current + 1)
+        Mission.bump_content_version(mission_id)
+        return current + 1
 
-        # Order
-        excluded_tests = []
-        if reportable_tests_only:
-            excluded_tests = tests.filter(test_case_include_flag=False).values_list('id', flat=True)
+    @classmethod
+    def move_test(cls, test, after_test=None, version=None):
+        """
+        Moves a test case to just after another one in the same mission (or to the top of the list). Only the moved
+        test case's row is updated, unless its new neighbours have no room left between them, in which case the
+        mission's positions are spaced out again first.
+        :param test: The TestDetail to move
+        :param after_test: The TestDetail it should follow, or None to make it the first test case
+        :param version: The Mission.test_order_version the move is based on; if the order has changed since,
+                        SortOrderConflict is raised and nothing is moved. None moves regardless.
+        :return: The new test_order_version
+        """
+        with transaction.atomic():
+            current = cls._lock_test_order(test.mission_id, version)
+
+            position = cls._get_move_position(test, after_test)
+            if position is None:
+                cls.respace_tests(test.mission_id)
+                if after_test is not None:
+                    after_test.refresh_from_db(fields=['sort_position'])
+                position = cls._get_move_position(test, after_test)
+
+            TestDetail.objects.filter(pk=test.pk).update(sort_position=position)
+            test.sort_position = position
+            current = cls._bump_test_order_version(test.mission_id, current)
+
+        logger.debug('Moved test case {test} after {after} (mission {mission}, position {position})'.format(
+            test=test.pk, after=after_test.pk if after_test is not None else None, mission=test.mission_id,
+            position=position))
+        return current
 
-        test_dict = dict([(test.id, test) for test in tests])
-        ordered_tests = [test_dict[test_id] for test_id in sort_order if test_id not in excluded_tests]
+    @classmethod
+    def reorder_tests(cls, mission_id, order, version=None):
+        """
+        Puts the mission's test cases in the order given (see respace_tests), writing only the test cases that
+        changed position.
+        :param version: As for move_test
+        :return: The new test_order_version (unchanged if the order was already as given)
+        """
+        with transaction.atomic():
+            current = cls._lock_test_order(mission_id, version)
+            if cls.respace_tests(mission_id, order=order):
+                current = cls._bump_test_order_version(mission_id, current)
+        return current
 
-        return ordered_tests
+    @staticmethod
+    def _get_move_position(test, after_test):
+        others = TestDetail.objects.filter(mission=test.mission_id).exclude(pk=test.pk)
+
+        if after_test is None:
+            before = None
+            following = others
+        else:
+            before = after_test.sort_position
+            following = others.filter(Q(sort_position__gt=before) | Q(sort_position=before, id__gt=after_test.pk))
+        after = following.order_by('sort_position', 'id').values_list('sort_position', flat=True).first()
+
+        return TestSortingHelper.get_position_between(before, after)
+
+    @staticmethod
+    def respace_tests(mission_id, order=None):
+        """
+        Gives the mission's test cases evenly spaced sort positions, keeping their current order (or using the order
+        given), and saves the ones that changed.
+        :param order: Optional list of test case ids; test cases it leaves out keep their relative order after those
+                      it lists, and ids of other missions' test cases are ignored
+        :return: The number of test cases whose position changed
+        """
+        tests = list(TestDetail.objects.filter(mission=mission_id).order_by('sort_position', 'id')
+                     .only('id', 'sort_position'))
+
+        if order is not None:
+            rank = {test_id: index for index, test_id in enumerate(order)}
+            unranked = len(rank)
+            tests.sort(key=lambda test: rank.get(test.id, unranked))  # Stable: unlisted tests keep their order
+
+        changed = []
+        for index, test in enumerate(tests, start=1):
+            if test.sort_position != index * SORT_POSITION_GAP:
+                test.sort_position = index * SORT_POSITION_GAP
+                changed.append(test)
+
+        TestDetail.objects.bulk_update(changed, ['sort_position'], batch_size=500)
+        logger.debug('Respaced {changed} of {total} test cases (mission {mission})'.format(
+            changed=len(changed), total=len(tests), mission=mission_id))
+        return len(changed)
+
+    @staticmethod
+    def get_order_delta(client_order, current_order):
+        """
+        The changes that turn a client's (out of date) copy of an order into the current one, keeping as many of
+        the client's items in place as possible (those on a longest run already in the current order).
+        :param client_order: List of ids as the client has them
+        :param current_order: List of ids in the current order
+        :return: {
+            'removed': [ids the client has which no longer exist],
+            'added': [ids the client doesn't have yet],
+            'moved': [{'id': id, 'after': id it now follows, or None for first}, for the added ids and those which
+                      have moved, in the current order],
+        }
+        Applied by dropping the removed ids, then placing the moved ids one after the other.
+        """
+        current_index = dict((item_id, index) for index, item_id in enumerate(current_order))
+        client_order = list(dict.fromkeys(client_order))
+        client_ids = set(client_order)
+
+        # Longest increasing run of current positions among the client's ids, in the client's order
+        kept_positions = [current_index[item_id] for item_id in client_order if item_id in current_index]
+        tails, tail_indexes, previous = [], [], [None] * len(kept_positions)
+        for i, position in enumerate(kept_positions):
+            length = bisect_left(tails, position)
+            if length == len(tails):
+                tails.append(position)
+                tail_indexes.append(i)
+            else:
+                tails[length] = position
+                tail_indexes[length] = i
+            previous[i] = tail_indexes[length - 1] if length else None
+        kept = set()
+        i = tail_indexes[-1] if tail_indexes else None
+        while i is not None:
+            kept.add(current_order[kept_positions[i]])
+            i = previous[i]
+
+        return {
+            'removed': [item_id for item_id in client_order if item_id not in current_index],
+            'added': [item_id for item_id in current_order if item_id not in client_ids],
+            'moved': [{'id': item_id, 'after': current_order[index - 1] if index else None}
+                      for index, item_id in enumerate(current_order) if item_id not in kept],
+        }
 
     @classmethod
-    def get_ordered_supporting_data(cls, test_detail_id, reportable_supporting_data_only=False):
+    def reorder_supporting_data(cls, test_detail_id, order, version=None):
+        """
+        Puts a test case's supporting data in the order given; supporting data it leaves out follows in its current
+        order, and ids of other test cases' supporting data are ignored.
+        :param version: The TestDetail.supporting_data_order_version the reorder is based on; if the order has
+                        changed since, SortOrderConflict is raised. None reorders regardless.
+        :return: The new supporting_data_order_version (unchanged if the order was already as given)
+        """
+        with transaction.atomic():
+            cls._lock_for_write(TestDetail.objects.filter(pk=test_detail_id), 'supporting_data_order_version')
+            testdetail = TestDetail.objects.select_for_update().get(pk=test_detail_id)
+            data_ids = list(SupportingData.objects.filter(test_detail=testdetail).order_by('id')
+                            .values_list('id', flat=True))
+            current_order, _ = cls.reconcile_sort_order(json.loads(testdetail.supporting_data_sort_order or '[]'),
+                                                        data_ids)
+
+            if version is not None and version != testdetail.supporting_data_order_version:
+                raise SortOrderConflict(testdetail.supporting_data_order_version, current_order)
+
+            existing = set(data_ids)
+            listed = [data_id for data_id in dict.fromkeys(order) if data_id in existing]
+            rank = dict((data_id, index) for index, data_id in enumerate(listed))
+            new_order = sorted(current_order, key=lambda data_id: rank.get(data_id, len(rank)))
+            if new_order != current_order:
+                testdetail.supporting_data_sort_order = json.dumps(new_order)
+                testdetail.supporting_data_order_version += 1
+                testdetail.save(update_fields=['supporting_data_sort_order', 'supporting_data_order_version'])
+
+        return testdetail.supporting_data_order_version
 
-        try:
-            testdata = SupportingData.objects.filter(test_detail=test_detail_id)
-        except TestDetail.DoesNotExist:
-            testdata = ()
+    @classmethod
+    def get_ordered_supporting_data(cls, test_detail_id, reportable_supporting_data_only=False):
+        """
+        :return: List of the test case's supporting data in sort order. Never writes: the saved order is kept up to
+                 date as supporting data is added and removed, and anything out of step with it (e.g. data from
+                 before that was the case) is only corrected in memory; repair_report_data saves such corrections.
+        """
+        sort_order = TestDetail.objects.filter(pk=test_detail_id) \
+            .values_list('supporting_data_sort_order', flat=True).first()
+        testdata = list(SupportingData.objects.filter(test_detail=test_detail_id).order_by('id'))
+        return cls._order_supporting_data(test_detail_id, sort_order, testdata, reportable_supporting_data_only)
 
-        sort_order = cls.deconflict_and_update_supporting_data_sort_order(test_detail_id, testdata)
+    @classmethod
+    def get_mission_supporting_data(cls, mission_id, reportable_supporting_data_only=True):
+        """
+        The supporting data of every test case in a mission, in each test case's sort order, from a single query:
+        each row carries its test case's saved order, and the ordering (with any correction, see
+        get_ordered_supporting_data) is done in memory.
+        :return: {test detail id: [supporting data in sort order]}; test cases without any supporting data (or none
+                 included in the report, when reportable_supporting_data_only) are left out
+        """
+        sort_orders = {}
+        data_by_test = {}
+        for data in SupportingData.objects.filter(test_detail__mission=mission_id) \
+                .annotate(test_sort_order=F('test_detail__supporting_data_sort_order')).order_by('id'):
+            sort_orders[data.test_detail_id] = data.test_sort_order
+            data_by_test.setdefault(data.test_detail_id, []).append(data)
+
+        ordered = {}
+        for test_detail_id, testdata in data_by_test.items():
+            ordered_testdata = cls._order_supporting_data(test_detail_id, sort_orders[test_detail_id], testdata,
+                                                          reportable_supporting_data_only)
+            if ordered_testdata:
+                ordered[test_detail_id] = ordered_testdata
+
+        return ordered
 
-        # Order
-        excluded_data = []
-        if reportable_supporting_data_only:
-            excluded_data = testdata.filter(include_flag=False).values_list('id', flat=True)
+    @classmethod
+    def _order_supporting_data(cls, test_detail_id, sort_order, testdata, reportable_supporting_data_only):
+        """
+        :param sort_order: The test case's saved supporting_data_sort_order (JSON)
+        :param testdata: All of the test case's supporting data, in id order
+        """
+        sort_order, dirty = cls.reconcile_sort_order(json.loads(sort_order or '[]'), [data.id for data in testdata])
+        if dirty:
+            logger.info('Supporting data sort order of test case {testdetail} is out of date; using {sort_order} '
+                        '(run repair_report_data to save it)'.format(testdetail=test_detail_id, sort_order=sort_order))
 
         testdata_dict = dict([(data.id, data) for data in testdata])
-        ordered_testdata = [testdata_dict[testdata_id] for testdata_id in sort_order if testdata_id not in excluded_data]
+        ordered_testdata = [testdata_dict[testdata_id] for testdata_id in sort_order]
+        if reportable_supporting_data_only:
+            ordered_testdata = [data for data in ordered_testdata if data.include_flag]
 
         return ordered_testdata
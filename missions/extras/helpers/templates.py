@@ -0,0 +1,127 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import copy
+import hashlib
+from io import BytesIO
+import logging
+import os
+import threading
+
+from django.conf import settings
+from docx import Document
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE = 'default'
+
+
+class ParsedTemplate(object):
+    def __init__(self, name, path, stat_key, content_hash, document):
+        self.name = name
+        self.path = path
+        self.stat_key = stat_key
+        self.content_hash = content_hash
+        self.document = document
+
+    @property
+    def version(self):
+        """ Identifies the template's contents, for cache keys """
+        return '{name}:{hash}'.format(name=self.name, hash=self.content_hash)
+
+
+class ReportTemplateCache(object):
+    """
+    Report templates (Word documents providing the styles and the blank test case / screenshot tables) parsed once
+    per process and kept in memory. Each report gets its own copy of the parsed template, which is much cheaper than
+    unzipping and parsing the package again.
+
+    A cached template is checked against the file's size & modification time whenever it's used and re-read if they
+    changed; it's only parsed again if the contents (SHA-256) actually differ.
+
+    Templates are named (REPORT_TEMPLATES); missions use the template REPORT_TEMPLATE_BY_BUSINESS_AREA maps their
+    business area to, or DEFAULT_TEMPLATE (REPORT_TEMPLATE_PATH unless REPORT_TEMPLATES says otherwise).
+    """
+
+    _templates = {}  # name: ParsedTemplate
+    _lock = threading.Lock()
+
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def get_template_paths():
+        """ :return: {template name: path} """
+        templates = {DEFAULT_TEMPLATE: settings.REPORT_TEMPLATE_PATH}
+        templates.update(getattr(settings, 'REPORT_TEMPLATES', {}))
+        return templates
+
+    @classmethod
+    def get_template_name(cls, business_area):
+        """ :return: Name of the template used for reports of missions in the business area """
+        name = getattr(settings, 'REPORT_TEMPLATE_BY_BUSINESS_AREA', {}).get(str(business_area), DEFAULT_TEMPLATE)
+        if name not in cls.get_template_paths():
+            logger.warning('Report template {name} (for business area {area}) is not in REPORT_TEMPLATES; using the '
+                           'default template'.format(name=name, area=business_area))
+            return DEFAULT_TEMPLATE
+        return name
+
+    @classmethod
+    def load(cls, name):
+        """
+        :return: The ParsedTemplate for the named template, parsing (or re-parsing) it if needed. The document it
+                 holds is shared; use open() to get a copy to build a report in.
+        :raise OSError: If the template file can't be read
+        """
+        path = cls.get_template_paths()[name]
+        template_stat = os.stat(path)
+        stat_key = (template_stat.st_size, template_stat.st_mtime_ns)
+
+        with cls._lock:
+            cached = cls._templates.get(name)
+            if cached is not None and cached.path == path and cached.stat_key == stat_key:
+                cls.hits += 1
+                return cached
+
+            with open(path, 'rb') as f:
+                data = f.read()
+            content_hash = hashlib.sha256(data).hexdigest()
+
+            if cached is not None and cached.path == path and cached.content_hash == content_hash:
+                # Touched or copied over with the same contents
+                cached.stat_key = stat_key
+                cls.hits += 1
+                return cached
+
+            cls.misses += 1
+            logger.info('Parsing report template {name} ({path}, sha256 {hash})'.format(
+                name=name, path=path, hash=content_hash))
+            cached = cls._templates[name] = ParsedTemplate(name, path, stat_key, content_hash, Document(BytesIO(data)))
+            return cached
+
+    @classmethod
+    def get_version(cls, name):
+        return cls.load(name).version
+
+    @classmethod
+    def open(cls, name):
+        """ :return: (python-docx Document to build a report in, template version) """
+        template = cls.load(name)
+        return copy.deepcopy(template.document), template.version
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._templates.clear()
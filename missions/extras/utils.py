@@ -17,29 +17,91 @@ import logging
 import json
 import copy
 import os
-import shutil
-import re
-import imghdr
-from io import BytesIO
+import tempfile
 import traceback
-import io
 
 
 from django.utils.timezone import localtime, now
 from django.conf import settings
 from django.utils.text import normalize_newlines
 
-from docx import Document
 from docx.shared import Inches, RGBColor
+from docx.table import Table, _Row
 from docx.image.exceptions import UnrecognizedImageError, UnexpectedEndOfFileError, InvalidImageStreamError
 
-from missions.models import Mission, DARTDynamicSettings, TestDetail
-from .helpers.sorters import TestSortingHelper
-from .helpers.formatters import standardize_report_output_field
+from missions.models import Mission, ReportJob, TestDetail
+from .helpers.archives import iter_zip
+from .helpers.fragments import ReportFragment, ReportFragmentCache, DrawingIds
+from .helpers.instrumentation import PhaseTimer, ReportRunRecorder
+from .helpers.narrative import NarrativeWriter, SlugReplacer
+from .helpers.prefetch import AttachmentPrefetcher
+from .helpers.prototypes import TablePrototype, TablePrototypeCache
+from .helpers.renditions import get_embed_width_inches
+from .helpers.reportdata import ReportData
+from .helpers.shards import ReportShards
+from .helpers.templates import ReportTemplateCache
+from .helpers.formatters import standardize_report_output_field, expand_hex_color_code
 
 
 logger = logging.getLogger(__name__)
 
+# Mission-wide include flags which change how test cases are rendered
+MISSION_REPORT_FLAGS = (
+    'attack_phase_include_flag',
+    'attack_type_include_flag',
+    'assumptions_include_flag',
+    'test_description_include_flag',
+    'findings_include_flag',
+    'mitigation_include_flag',
+    'tools_used_include_flag',
+    'command_syntax_include_flag',
+    'targets_include_flag',
+    'sources_include_flag',
+    'attack_time_date_include_flag',
+    'attack_side_effects_include_flag',
+    'test_result_observation_include_flag',
+    'supporting_data_include_flag',
+    'customer_notes_include_flag',
+)
+
+# Optional rows of the test case details table, in template order (starting at row 2, after the classification
+# marking and the test number & title)
+TEST_CASE_TABLE_ROWS = (
+    'attack_phase_type',
+    'assumptions',
+    'description',
+    'findings',
+    'mitigations',
+    'tools',
+    'commands',
+    'targets',
+    'sources',
+    'date_time',
+    'side_effects',
+    'details',
+    'supporting_data',
+    'notes',
+)
+
+# Progress phases reported by generate_report_or_attachments
+NARRATIVE_PHASE = 'Narrative sections'
+TEST_CASE_PHASE = 'Test cases'
+OUTPUT_PHASE = 'Writing output'
+
+# Further phases timed for the report run history (see ReportRunRecorder)
+LOADING_PHASE = 'Loading data'
+TEMPLATE_PHASE = 'Copying template'
+SHARD_PHASE = 'Waiting on shard workers'
+TABLE_CLONING_PHASE = 'Test cases: cloning tables'
+IMAGE_PHASE = 'Test cases: embedding images'
+SLUG_PHASE = 'Replacing slugs'
+MANIFEST_PHASE = 'Listing files'
+ZIP_PHASE = 'Zipping files'
+
+# Part of every report fragment key; bump it when the rendered output changes in a way the rest of the key doesn't
+# capture, so fragments cached by an older version aren't reused
+FRAGMENT_FORMAT_VERSION = 2
+
 
 class ReturnStatus(object):
     def __init__(self, success=True, message='', **kwargs):
@@ -67,10 +129,17 @@ def copy_table(document, table, cut=False):
     :return: The newly created table instance
     """
     if cut:
-        document._body._element._insert_tbl(table._tbl)
+        tbl = table._tbl
     else:
-        document._body._element._insert_tbl(copy.deepcopy(table)._tbl)
-    return document.tables[-1]
+        # Copy just the table's XML; deep-copying the python-docx object would copy the document it belongs to
+        tbl = copy.deepcopy(table._tbl)
+    document._body._element._insert_tbl(tbl)
+    return Table(tbl, document._body)
+
+
+def remove_table(table):
+    tbl = table._tbl
+    tbl.getparent().remove(tbl)
 
 
 def remove_row(table, row):
@@ -85,185 +154,170 @@ def get_cleared_paragraph(cell):
     return paragraph
 
 
-def generate_report_or_attachments(mission_id, zip_attachments=False):
+def get_output_buffer():
     '''
-    Generates the report docx or attachments zip.
-    :param mission_id: The id of the mission
-    :param zip_attachments: True to return a zip of attachments, False to get the docx report as an IOStream
-    :return: Returns StringIO if returning a report, a zip object otherwise
+    :return: A binary temporary file for generated output which is held in memory until it grows past
+             REPORT_SPOOL_MAX_MEMORY bytes and then moved to disk (in REPORT_SPOOL_DIR), so a large report never needs
+             to fit in memory. It is deleted when closed.
     '''
-    system_classification = DARTDynamicSettings.objects.get_as_object().system_classification
-    system_classification_verbose = system_classification.verbose_legend
-    system_classification_short = system_classification.short_legend
-
-    mission = Mission.objects.get(id=mission_id)
-    tests = TestSortingHelper.get_ordered_testdetails(
-        mission_id=mission_id,
-        reportable_tests_only=True)
-
-    # Set some values we'll use throughout this section
-    total_reportable_tests = len(tests)
-    total_tests_with_findings = TestDetail.objects.filter(
-        mission=mission,
-        has_findings=True).count()
-    total_tests_without_findings = TestDetail.objects.filter(
-        mission=mission,
-        has_findings=False).count()
-    LIGHTEST_PERMISSIBLE_CLASSIFICATION_LABEL_COLOR = 0xbbbbbb
-    DARKEN_OVERLY_LIGHT_CLASSIFICATION_LABEL_COLOR_BY = 0x444444
-    mission_data_dir = None
-    report_has_attachments = False
+    return tempfile.SpooledTemporaryFile(
+        max_size=getattr(settings, 'REPORT_SPOOL_MAX_MEMORY', 8 * 1024 * 1024),
+        dir=getattr(settings, 'REPORT_SPOOL_DIR', None),
+    )
 
-    def replace_document_slugs(doc):
-        """Cycle through the runs in each paragraph in the template & replace handlebar slugs"""
-
-        logger.debug('> replace_document_slugs')
-
-        handlebar_slugs = {
-            r'{{AREA}}': str(mission.business_area),
-            r'{{MISSION}}': str(mission.mission_name),
-            r'{{GENERATION_DATE}}': now().strftime('%x'),
-            r'{{TOTAL_TESTS}}': str(total_reportable_tests),
-            r'{{TESTS_WITH_FINDINGS}}': str(total_tests_with_findings),
-            r'{{TESTS_WITHOUT_FINDINGS}}': str(total_tests_without_findings),
-        }
-
-        for p in doc.paragraphs:
-            for r in p.runs:
-                for pattern in list(handlebar_slugs.keys()):
-                    if re.search(pattern, r.text):
-                        logger.debug('>> Replaced: {old} With: {new}'.format(
-                            old=r.text.encode('utf-8'),
-                            new=handlebar_slugs[pattern].encode('utf-8')
-                            )
-                        )
-                        r.text = re.sub(pattern, handlebar_slugs[pattern], r.text)
-
-    def get_or_create_mission_data_dir(mission_data_dir):
-        if mission_data_dir is None :
-            mission_data_dir = os.path.join(
-                settings.BASE_DIR,
-                'SUPPORTING_DATA_PACKAGE',
-                str(mission.id) + "_" + str(now().strftime('%Y%m%d-%H%M%S')))
-            if not os.path.isdir(mission_data_dir):
-                os.makedirs(mission_data_dir)
-        return mission_data_dir
-
-    def add_to_data_dir(mission_data_dir, test_case_number, supporting_data):
-        # If test case directory path is not created, create it
-        path = os.path.join(mission_data_dir, str(test_case_number))
-
-        # Shouldn't have race condition issues, but may need to add
-        # try/catch if so later on
-        if not os.path.isdir(path):
-            os.makedirs(path)
-
-        # Copy file to destination path
-        shutil.copy(
-            os.path.join(settings.MEDIA_ROOT, supporting_data.filename()),
-            path
-        )
 
-    def prepend_classification(text):
-        return '(' + system_classification_short + ') ' + text
-
-    def portion_mark_and_insert(paragraphs, document):
-        for paragraph in normalize_newlines(paragraphs).split('\n'):
-            if len(paragraph) > 0:
-                document.add_paragraph(prepend_classification(paragraph))
-
-    # Load the template file to get the styles
-    document = Document(settings.REPORT_TEMPLATE_PATH)
-
-    # Get the table templates
-    table_no_findings = document.tables[0]
-    table_with_findings = document.tables[1]
-    data_table = document.tables[2]
+def get_attachments_manifest(mission_id, progress=None):
+    '''
+    Lists the supporting data files (attachments which aren't embedded in the report as images) that make up a
+    mission's data package, in report order.
+    :param mission_id: The id of the mission
+    :param progress: Optional callable accepting (current test case, total test cases)
+    :return: List of (archive name, file path) tuples; files are grouped in a directory per report test case number
+    '''
+    report_data = ReportData.load(mission_id)
+    tests = report_data.reportable_tests
+    manifest = []
 
-    # Set the classification legend color from the background color of the banner
-    classification_style = document.styles['Table Classification']
-    classification_font = classification_style.font
+    if not report_data.mission.supporting_data_include_flag:
+        return manifest
 
-    # RGBColor doesn't handle shorthand hex codes, so let's just go ahead and expand it
-    # if we come across a legacy or "misguided" entry
-    if len(system_classification.background_color.hex_color_code) == 3:
-        new_hex_code = ''
-        for char in system_classification.background_color.hex_color_code:
-            new_hex_code += char + char
-        system_classification.background_color.hex_color_code = new_hex_code
-        system_classification.background_color.save()
+    for test_case_number, t in enumerate(tests, start=1):
+        if progress is not None:
+            progress(test_case_number, len(tests))
 
-    if len(system_classification.text_color.hex_color_code) == 3:
-        new_hex_code = ''
-        for char in system_classification.text_color.hex_color_code:
-            new_hex_code += char + char
-        system_classification.text_color.hex_color_code = new_hex_code
-        system_classification.text_color.save()
+        for d in report_data.supporting_data[t.id]:
+            try:
+                if d.is_report_image():
+                    continue
+            except OSError:
+                logger.warning('>> Unable to read {file_name}; leaving it out of the data package: '
+                               '\n{trace}'.format(file_name=d.filename(), trace=traceback.format_exc(10)))
+                continue
+            manifest.append(('{0}/{1}'.format(test_case_number, d.filename()),
+                             os.path.join(settings.MEDIA_ROOT, d.filename())))
 
-    classification_font.color.rgb = RGBColor.from_string(system_classification.get_report_label_color().hex_color_code)
+    return manifest
 
-    # Intro H1 and text
-    document.add_heading('Introduction', level=1)
-    portion_mark_and_insert(mission.introduction, document)
-
-    # Scope H1 and text
-    document.add_heading('Scope', level=1)
-    portion_mark_and_insert(mission.scope, document)
-
-    # Objectives H1 and text
-    document.add_heading('Objectives', level=1)
-    portion_mark_and_insert(mission.objectives, document)
-
-    # Exec Summary H1 and text
-    document.add_heading('Executive Summary', level=1)
-    portion_mark_and_insert(mission.executive_summary, document)
-
-    # Technical Assessment / Attack Architecture and text H1
-    document.add_heading('Technical Assessment / Attack Architecture', level=1)
-    portion_mark_and_insert(mission.technical_assessment_overview, document)
-
-    # Technical Assessment / Test Cases and Results and loop
-    document.add_heading('Technical Assessment / Test Cases and Results', level=1)
-
-    # For each test, Test # - Objective  Attack Phase: H2
-
-    """
-    Note: If a test case is hidden from the report, the test_case number and the auto-generated paragraph
-    number in Word won't align and it could cause confusion. The team may need to discuss how they want to
-    handle this situation.
-    """
 
+def generate_attachments_zip(mission_id, progress=None):
+    '''
+    Generates the supporting data package for a mission as a stream of zip chunks; nothing is staged or buffered,
+    so the archive can be arbitrarily large.
+    :param mission_id: The id of the mission
+    :param progress: Optional callable; see generate_report_or_attachments
+    :return: (generator of zip bytes chunks, mission name)
+    '''
+    # Recorded once the stream has been consumed (or abandoned)
+    recorder = ReportRunRecorder(mission_id, ReportJob.KIND_ATTACHMENTS).start()
+
+    def report_progress(phase):
+        def callback(current, total):
+            if progress is not None:
+                progress(phase, current, total, 0)
+        return callback
+
+    try:
+        with recorder.phase(MANIFEST_PHASE):
+            name = Mission.objects.values_list('mission_name', flat=True).get(pk=mission_id)
+            manifest = get_attachments_manifest(mission_id, progress=report_progress(TEST_CASE_PHASE))
+
+            for arcname, path in manifest:
+                try:
+                    recorder.bytes_read += os.path.getsize(path)
+                except OSError:
+                    pass  # Left out of the archive
+            recorder.test_cases = len({arcname.split('/', 1)[0] for arcname, path in manifest})
+    except Exception:
+        recorder.finish(succeeded=False)
+        raise
+
+    return recorder.record_stream(iter_zip(manifest, progress=report_progress(OUTPUT_PHASE)), ZIP_PHASE), name
+
+
+class TestCaseRenderer(object):
     """
-    WARNING
-
-    Hidden test cases are NOT numbered in the report so the customer doesn't think something was
-    accidentally left out. This will result in test case numbering differing between report and web when
-    one or more test cases are hidden from the report.
+    Lays out test cases (heading, details table & screenshots) at the end of a report document built from the report
+    template, either in the report itself or, for large reports, in a shard worker's copy of the template whose
+    rendered test cases are spliced into the report (see helpers/shards.py).
     """
 
-    test_case_number = 0
-    tests_with_findings = 0
-    tests_without_findings = 0
-
-    # Let's just always craete a mission data dir when zipping attachments on report generation; this way
-    # mission attachments will always return a zip file... it just may be empty - located here to account for times
-    # when Get Attachments is actuated, but there are no test cases yet.
-    if zip_attachments:
-        mission_data_dir = get_or_create_mission_data_dir(mission_data_dir)
-
-    for t in tests:
-
-        if test_case_number > 0:
-            document.add_page_break()
-
-        test_case_number += 1
+    def __init__(self, document, report_data, template_version, open_image, timer=None):
+        """
+        :param document: python-docx document copied from the report template, before any test case is added
+        :param report_data: The mission's ReportData
+        :param template_version: Version of the template the document was copied from (for fragment keys)
+        :param open_image: Callable returning an image's contents as a file object given its path
+        :param timer: Optional PhaseTimer to add the time spent cloning tables and embedding images to
+        """
+        self.document = document
+        self.report_data = report_data
+        self.mission = report_data.mission
+        self.system_classification_verbose = report_data.system_classification.verbose_legend
+        self.template_version = template_version
+        self.open_image = open_image
+        self.timer = timer if timer is not None else PhaseTimer()
+
+        # Get the table templates
+        self.table_no_findings = document.tables[0]
+        self.table_with_findings = document.tables[1]
+        self.data_table = document.tables[2]
+
+        # Pruned copies of the template tables, built once per report for each combination of include flags
+        self.table_prototypes = TablePrototypeCache()
+
+    def get_template_table(self, t):
+        return self.table_with_findings if t.has_findings else self.table_no_findings
+
+    def build_test_case_prototype(self, template_table, included_rows, include_attack_phase, include_attack_type):
+        cells = {
+            'classification_top': (0, 0),
+            'test_number': (1, 0),
+            'title': (1, 1),
+            'classification_bottom': (16, 1),
+        }
+        cells.update((row_name, (row, 1)) for row, row_name in enumerate(TEST_CASE_TABLE_ROWS, start=2)
+                     if row_name in included_rows)
+        if include_attack_phase != include_attack_type:
+            cells['attack_label'] = (2, 0)
+
+        removed_rows = [row for row, row_name in enumerate(TEST_CASE_TABLE_ROWS, start=2)
+                        if row_name not in included_rows]
+        logger.debug('Removing rows {rows} from the test case table'.format(rows=removed_rows))
+        prototype = TablePrototype(template_table, cells, removed_rows)
+
+        # Classification Marking - Top & Bottom
+        get_cleared_paragraph(prototype.cells['classification_top']).text = self.system_classification_verbose
+        get_cleared_paragraph(prototype.cells['classification_bottom']).text = self.system_classification_verbose
+
+        # Template text in column 0 assumes both attack phase & type are included
+        if include_attack_phase and not include_attack_type:
+            get_cleared_paragraph(prototype.cells['attack_label']).text = "Attack Phase:"
+        elif include_attack_type and not include_attack_phase:
+            get_cleared_paragraph(prototype.cells['attack_label']).text = "Attack Type:"
+
+        return prototype
+
+    def build_image_prototype(self):
+        prototype = TablePrototype(self.data_table, {
+            'classification_top': (0, 0),
+            'content': (1, 0),
+            'classification_bottom': (2, 0),
+        })
+        get_cleared_paragraph(prototype.cells['classification_top']).text = self.system_classification_verbose
+        get_cleared_paragraph(prototype.cells['classification_bottom']).text = self.system_classification_verbose
+        return prototype
+
+    def render(self, t, test_case_number, template_table, my_data):
+        """
+        Adds the heading, details table and screenshots for a test case to the end of the self.document.
+        :return: {rId: image path} for each embedded picture
+        """
+        images = {}
 
         if t.has_findings:
             test_title = "*"
-            tests_with_findings += 1
         else:
             test_title = ""
-            tests_without_findings += 1
 
         if t.enclave:
             test_title += "(%s) %s" % (
@@ -274,264 +328,165 @@ def generate_report_or_attachments(mission_id, zip_attachments=False):
             test_title += "%s" % (
                 t.test_objective,
             )
-        document.add_heading(test_title, level=2)
-
-        # Duplicate one of the pre-made tables; if this is the last of a specific type of
-        # test case (findings / no findings), use the cut operation to remove the blank
-        # table.
-        #TODO: convert to logging: print("T w/ F: {0}\nTotal: {1}\nT w/o F: {2}\nTotal: {3}".format(tests_with_findings, total_tests_with_findings, tests_without_findings, total_tests_without_findings))
-        is_last_test_case = True if test_case_number == total_reportable_tests else False
-        if t.has_findings:
-            if tests_with_findings == total_tests_with_findings or is_last_test_case:
-                table = copy_table(document, table_with_findings, cut=True)
-            else:
-                table = copy_table(document,table_with_findings, cut=False)
-        else:
-            if tests_without_findings == total_tests_without_findings or is_last_test_case:
-                table = copy_table(document, table_no_findings, cut=True)
-            else:
-                table = copy_table(document,table_no_findings, cut=False)
+        self.document.add_heading(test_title, level=2)
 
-        # Classification Marking - Top
-        cell = table.cell(0, 0)
-        get_cleared_paragraph(cell).text = system_classification_verbose
-
-        # Classification Marking - Bottom
-        cell = table.cell(16, 1)
-        get_cleared_paragraph(cell).text = system_classification_verbose
+        #
+        # Include flags (mission-wide and per test case) decide which rows the details table keeps
+        #
+        include_attack_phase = bool(self.mission.attack_phase_include_flag
+                                    and t.attack_phase_include_flag
+                                    and len(t.get_attack_phase_display()) > 0)
+        include_attack_type = bool(self.mission.attack_type_include_flag
+                                   and t.attack_type_include_flag
+                                   and len(t.attack_type) > 0)
+
+        included_rows = tuple(row_name for row_name, include in (
+            ('attack_phase_type', include_attack_phase or include_attack_type),
+            ('assumptions', self.mission.assumptions_include_flag and t.assumptions_include_flag),
+            ('description', self.mission.test_description_include_flag and t.test_description_include_flag),
+            ('findings', self.mission.findings_include_flag and t.findings_include_flag),
+            ('mitigations', self.mission.mitigation_include_flag and t.mitigation_include_flag),
+            ('tools', self.mission.tools_used_include_flag and t.tools_used_include_flag),
+            ('commands', self.mission.command_syntax_include_flag and t.command_syntax_include_flag),
+            ('targets', self.mission.targets_include_flag and t.targets_include_flag),
+            ('sources', self.mission.sources_include_flag and t.sources_include_flag),
+            ('date_time', self.mission.attack_time_date_include_flag and t.attack_time_date_include_flag),
+            ('side_effects', self.mission.attack_side_effects_include_flag and t.attack_side_effects_include_flag),
+            ('details', self.mission.test_result_observation_include_flag and t.test_result_observation_include_flag),
+            ('supporting_data', self.mission.supporting_data_include_flag),
+            # Notes - Used for post report generation notes / customer use
+            ('notes', True),  # TODO: add mission-level toggle
+        ) if include)
+
+        prototype = self.table_prototypes.get(
+            (t.has_findings, included_rows, include_attack_phase, include_attack_type),
+            lambda: self.build_test_case_prototype(template_table, included_rows, include_attack_phase,
+                                                   include_attack_type))
+        with self.timer.phase(TABLE_CLONING_PHASE):
+            table, cells = prototype.clone(self.document)
 
         # Test Case Number (Table Header Row)
-        cell = table.cell(1, 0)
-        if mission.test_case_identifier:
-            get_cleared_paragraph(cell).text = 'Test #{0}-{1}'.format(mission.test_case_identifier, test_case_number)
+        cell = cells['test_number']
+        if self.mission.test_case_identifier:
+            get_cleared_paragraph(cell).text = 'Test #{0}-{1}'.format(self.mission.test_case_identifier,
+                                                                     test_case_number)
         else:
             get_cleared_paragraph(cell).text = 'Test #{0}'.format(test_case_number)
 
-        row_number = 0
-
         #
         # Test Case Title (Table Header Row)
         #
-        row_number += 1
-        cell = table.cell(row_number, 1)
-        get_cleared_paragraph(cell).text = t.test_objective
+        get_cleared_paragraph(cells['title']).text = t.test_objective
 
         #
         # Attack Phase / Type
         #
-        row_number += 1
-
-        include_attack_phase = False
-        include_attack_type = False
-
-        if mission.attack_phase_include_flag \
-                and t.attack_phase_include_flag \
-                and len(t.get_attack_phase_display())> 0:
-            include_attack_phase = True
-
-        if mission.attack_type_include_flag \
-                and t.attack_type_include_flag \
-                and len(t.attack_type) > 0:
-            include_attack_type = True
-
-        left_cell = table.cell(row_number, 0)
-        right_cell = get_cleared_paragraph(table.cell(row_number, 1))
-
-        if include_attack_phase or include_attack_type:
-            if include_attack_phase and include_attack_type:
-                # Table text in column 1 assumes both items are included already
-                right_cell.text = ' - '.join([t.get_attack_phase_display(), t.attack_type])
-            elif include_attack_phase:
-                get_cleared_paragraph(left_cell).text = "Attack Phase:"
-                right_cell.text = t.get_attack_phase_display()
-            elif include_attack_type:
-                get_cleared_paragraph(left_cell).text = "Attack Type:"
-                right_cell.text = t.attack_type
-        else:
-            logger.debug('Removing Attack Phase/Type Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
+        if include_attack_phase and include_attack_type:
+            # Table text in column 1 assumes both items are included already
+            get_cleared_paragraph(cells['attack_phase_type']).text = ' - '.join(
+                [t.get_attack_phase_display(), t.attack_type])
+        elif include_attack_phase:
+            get_cleared_paragraph(cells['attack_phase_type']).text = t.get_attack_phase_display()
+        elif include_attack_type:
+            get_cleared_paragraph(cells['attack_phase_type']).text = t.attack_type
 
         #
         # Assumptions
         #
-        row_number += 1
-        if mission.assumptions_include_flag and t.assumptions_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
+        if 'assumptions' in cells:
+            cell = get_cleared_paragraph(cells['assumptions'])
             cell.text = standardize_report_output_field(t.assumptions)
-        else:
-            logger.debug('Removing Assumptions Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
 
         #
         # Description
         #
-        row_number += 1
-        if mission.test_description_include_flag and t.test_description_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
+        if 'description' in cells:
+            cell = get_cleared_paragraph(cells['description'])
             if t.re_eval_test_case_number:
                 cell.text = standardize_report_output_field('This is a reevaluation; reference previous test case #{0}\n\n{1}'.format(t.re_eval_test_case_number, t.test_description))
             else:
                 cell.text = standardize_report_output_field(t.test_description)
-        else:
-            logger.debug('Removing Description Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
 
         #
         # Findings
         #
-        row_number += 1
-        if mission.findings_include_flag and t.findings_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
+        if 'findings' in cells:
+            cell = get_cleared_paragraph(cells['findings'])
             cell.text = standardize_report_output_field(t.findings)
-        else:
-            logger.debug('Removing Findings Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
 
         #
         # Mitigations
         #
-        row_number += 1
-        if mission.mitigation_include_flag and t.mitigation_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
+        if 'mitigations' in cells:
+            cell = get_cleared_paragraph(cells['mitigations'])
             cell.text = standardize_report_output_field(t.mitigation)
-        else:
-            logger.debug('Removing Mitigations Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
 
         #
         # Tools
         #
-        row_number += 1
-        if mission.tools_used_include_flag and t.tools_used_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
+        if 'tools' in cells:
+            cell = get_cleared_paragraph(cells['tools'])
             cell.text = standardize_report_output_field(t.tools_used)
-        else:
-            logger.debug('Removing Tools Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
 
         #
         # Commands / Syntax
         #
-        row_number += 1
-        if mission.command_syntax_include_flag and t.command_syntax_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
+        if 'commands' in cells:
+            cell = get_cleared_paragraph(cells['commands'])
             cell.text = standardize_report_output_field(t.command_syntax)
-        else:
-            logger.debug('Removing Commands/Syntax Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
 
         #
         # Targets
         #
-        row_number += 1
-        if mission.targets_include_flag and t.targets_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
-            cell.text = '\n'.join([str(x) for x in t.target_hosts.all()])
-        else:
-            logger.debug('Removing Targets Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
+        if 'targets' in cells:
+            cell = get_cleared_paragraph(cells['targets'])
+            cell.text = '\n'.join([self.report_data.format_host(x) for x in t.target_hosts.all()])
 
         #
         # Sources
         #
-        row_number += 1
-        if mission.sources_include_flag and t.sources_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
-            cell.text = '\n'.join([str(x) for x in t.source_hosts.all()])
-
-        else:
-            logger.debug('Removing Sources Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
+        if 'sources' in cells:
+            cell = get_cleared_paragraph(cells['sources'])
+            cell.text = '\n'.join([self.report_data.format_host(x) for x in t.source_hosts.all()])
 
         #
         # Date / Time
         #
-        row_number += 1
-        if mission.attack_time_date_include_flag and t.attack_time_date_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
+        if 'date_time' in cells:
+            cell = get_cleared_paragraph(cells['date_time'])
             cell.text = localtime(t.attack_time_date).strftime('%b %d, %Y @ %I:%M %p')
-        else:
-            logger.debug('Removing Date/Time Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
 
         #
         # Side Effects
         #
-        row_number += 1
-        if mission.attack_side_effects_include_flag and t.attack_side_effects_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
+        if 'side_effects' in cells:
+            cell = get_cleared_paragraph(cells['side_effects'])
             cell.text = standardize_report_output_field(t.attack_side_effects)
-        else:
-            logger.debug('Removing Side Effects Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
 
         #
         # Details
         #
-        row_number += 1
-        if mission.test_result_observation_include_flag and t.test_result_observation_include_flag:
-            cell = get_cleared_paragraph(table.cell(row_number, 1))
+        if 'details' in cells:
+            cell = get_cleared_paragraph(cells['details'])
             cell.text = standardize_report_output_field(t.test_result_observation)
-        else:
-            logger.debug('Removing Details Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
 
         #
         # Supporting Data
         #
-        row_number += 1
         supporting_data_cell = None
-        supporting_data_row = None
-        if mission.supporting_data_include_flag:
-            supporting_data_cell = get_cleared_paragraph(table.cell(row_number, 1))
-            supporting_data_row = table.rows[row_number]
-        else:
-            logger.debug('Removing Supporting Data Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
-
-        #
-        # Notes - Used for post report generation notes / customer use
-        #
-        row_number += 1
-        if False: #TODO: add mission-level toggle
-            logger.debug('Removing Customer Notes Row')
-            remove_row(table, table.rows[row_number])
-            row_number -= 1
+        if 'supporting_data' in cells:
+            supporting_data_cell = get_cleared_paragraph(cells['supporting_data'])
 
         # Attachments section
 
         supporting_data_cell_items = []
 
-        if mission.supporting_data_include_flag:
-            my_data = TestSortingHelper.get_ordered_supporting_data(
-                test_detail_id=t.id,
-                reportable_supporting_data_only=True)
-
+        if self.mission.supporting_data_include_flag:
             if len(my_data) > 0:
 
                 is_first_screenshot = True
 
                 for d in my_data:
-                    allowed_image_types = [
-                        'gif',
-                        'tiff',
-                        'jpeg',
-                        'bmp',
-                        'png',
-                    ]
                     try:
                         file_path = os.path.join(settings.MEDIA_ROOT, d.filename())
                         logger.debug('>> Beginning processing of {} at {}.'
@@ -540,31 +495,29 @@ def generate_report_or_attachments(mission_id, zip_attachments=False):
                                         file_path,
                                         ))
 
-                        if imghdr.what(file_path) not in allowed_image_types:
+                        if not d.is_report_image():
                             raise UnrecognizedImageError('File type is not in the allowed image types. '
                                                          'Handling as non-image.')
 
                         if is_first_screenshot:
-                            document.add_heading('Screenshots / Diagrams', level=3)
+                            self.document.add_heading('Screenshots / Diagrams', level=3)
                             logger.debug('This is the first screenshot of this test case.')
                             is_first_screenshot = False
 
-                        image_table = copy_table(document, data_table)
+                        with self.timer.phase(TABLE_CLONING_PHASE):
+                            image_table, image_cells = self.table_prototypes.get(
+                                'image', self.build_image_prototype).clone(self.document)
                         logger.debug('Creating a new image table.')
-                        document.add_paragraph()
-
-                        # Classification Marking - Top
-                        cell = image_table.cell(0, 0)
-                        get_cleared_paragraph(cell).text = system_classification_verbose
-
-                        # Classification Marking - Bottom
-                        cell = image_table.cell(2, 0)
-                        get_cleared_paragraph(cell).text = system_classification_verbose
+                        self.document.add_paragraph()
 
-                        content_cell = image_table.cell(1, 0)
+                        content_cell = image_cells['content']
 
-                        get_cleared_paragraph(content_cell).add_run().add_picture(d.test_file, width=Inches(5))
+                        image_path = d.report_image_path()
+                        with self.timer.phase(IMAGE_PHASE):
+                            picture = get_cleared_paragraph(content_cell).add_run().add_picture(
+                                self.open_image(image_path), width=Inches(get_embed_width_inches()))
                         content_cell.paragraphs[0].add_run("\r" + d.caption)
+                        images[picture._inline.xpath('.//a:blip/@r:embed')[0]] = image_path
 
                     except UnrecognizedImageError as e:
                         logger.debug('>> Attachment {attachment_name} not recognized as an image; adding as file.'
@@ -573,9 +526,6 @@ def generate_report_or_attachments(mission_id, zip_attachments=False):
                             filename=d.filename(),
                             caption=d.caption,
                         ))
-
-                        if zip_attachments:
-                            add_to_data_dir(mission_data_dir, test_case_number, d)
                     except (InvalidImageStreamError,
                             UnexpectedEndOfFileError) as e:
                         logger.warning('>> Attempting to add {file_name} to the report output resulted in an error: '
@@ -598,11 +548,291 @@ def generate_report_or_attachments(mission_id, zip_attachments=False):
                     )
                     supporting_data_cell.text = '\n'.join(supporting_data_cell_items)
 
-        if len(supporting_data_cell_items) == 0:
+        if len(supporting_data_cell_items) == 0 and supporting_data_cell is not None:
             logger.debug('There are no supporting_data_cell_items; removing the supporting data row.')
-            remove_row(table, supporting_data_row)
+            remove_row(table, _Row(cells['supporting_data']._tc.getparent(), table))
+
+        return images
+
+    def get_fragment_key(self, t, test_case_number, my_data):
+        """ Hashes everything that goes into rendering a test case so unchanged test cases can reuse their fragment """
+        supporting_data = []
+        for d in my_data:
+            if d.has_metadata():
+                file_version = d.content_hash
+            else:
+                try:
+                    file_stat = os.stat(d.test_file.path)
+                    file_version = (file_stat.st_size, file_stat.st_mtime_ns)
+                except OSError:
+                    file_version = None
+            supporting_data.append((d.id, d.test_file.name, d.report_rendition.name, d.caption, file_version))
+
+        return ReportFragmentCache.make_key({
+            'format': FRAGMENT_FORMAT_VERSION,
+            'template': self.template_version,
+            'classification': self.system_classification_verbose,
+            'test_case_identifier': self.mission.test_case_identifier,
+            'test_case_number': test_case_number,
+            'mission_flags': [(f, getattr(self.mission, f)) for f in MISSION_REPORT_FLAGS],
+            # The order fields aren't rendered: the test case number and the order of my_data stand for them, so
+            # moving a test case (or respacing the mission) only invalidates the fragments it renumbers
+            'test': [(f.attname, f.value_to_string(t)) for f in t._meta.concrete_fields
+                     if f.attname not in TestDetail.ORDER_FIELDS],
+            'attack_time_date': localtime(t.attack_time_date).strftime('%b %d, %Y @ %I:%M %p'),
+            'targets': [self.report_data.format_host(x) for x in t.target_hosts.all()],
+            'sources': [self.report_data.format_host(x) for x in t.source_hosts.all()],
+            'supporting_data': supporting_data,
+            'image_width': get_embed_width_inches(),
+        })
+
+
+def generate_report_or_attachments(mission_id, zip_attachments=False, progress=None):
+    '''
+    Generates the report docx or attachments zip.
+    :param mission_id: The id of the mission
+    :param zip_attachments: True to return a zip of attachments, False to get the docx report as a file
+    :param progress: Optional callable accepting (phase, current, total, images_embedded); called as generation
+                     moves through the narrative sections, test cases and output packaging
+    :return: Returns a binary file (see get_output_buffer) if returning a report, a generator of zip chunks otherwise
+    '''
+    if zip_attachments:
+        return generate_attachments_zip(mission_id, progress=progress)
+
+    with ReportRunRecorder(mission_id, ReportJob.KIND_REPORT) as recorder:
+        return generate_report(mission_id, recorder, progress=progress)
+
+
+def generate_report(mission_id, recorder, progress=None):
+    '''
+    Generates the report docx; see generate_report_or_attachments.
+    :param recorder: ReportRunRecorder to time the phases of the report and add up its resource use in
+    :return: (binary file holding the docx, positioned at the start; see get_output_buffer, mission name)
+    '''
+    # Everything the report needs from the database, in a fixed number of queries
+    with recorder.phase(LOADING_PHASE):
+        report_data = ReportData.load(mission_id)
+
+    system_classification = report_data.system_classification
+    system_classification_verbose = system_classification.verbose_legend
+    system_classification_short = system_classification.short_legend
+
+    mission = report_data.mission
+    tests = report_data.reportable_tests
+
+    # Set some values we'll use throughout this section
+    total_reportable_tests = len(tests)
+    total_tests_with_findings = report_data.count_tests(has_findings=True)
+    total_tests_without_findings = report_data.count_tests(has_findings=False)
+    LIGHTEST_PERMISSIBLE_CLASSIFICATION_LABEL_COLOR = 0xbbbbbb
+    DARKEN_OVERLY_LIGHT_CLASSIFICATION_LABEL_COLOR_BY = 0x444444
+    images_embedded = 0
+
+    def report_progress(phase, current=0, total=0):
+        if progress is not None:
+            progress(phase, current, total, images_embedded)
+
+    def replace_document_slugs(doc):
+        """Replace handlebar slugs in the body (including tables), headers & footers"""
+
+        logger.debug('> replace_document_slugs')
+
+        handlebar_slugs = {
+            '{{AREA}}': str(mission.business_area),
+            '{{MISSION}}': str(mission.mission_name),
+            '{{GENERATION_DATE}}': now().strftime('%x'),
+            '{{TOTAL_TESTS}}': str(total_reportable_tests),
+            '{{TESTS_WITH_FINDINGS}}': str(total_tests_with_findings),
+            '{{TESTS_WITHOUT_FINDINGS}}': str(total_tests_without_findings),
+        }
+
+        SlugReplacer(handlebar_slugs).replace(doc)
+
+    def prepend_classification(text):
+        return '(' + system_classification_short + ') ' + text
+
+    def portion_mark_and_insert(paragraphs, document):
+        with recorder.phase(NARRATIVE_PHASE):
+            NarrativeWriter.append_paragraphs(document, [
+                prepend_classification(paragraph)
+                for paragraph in normalize_newlines(paragraphs).split('\n')
+                if len(paragraph) > 0
+            ])
+
+    # Copy the (parsed once) template for the mission's business area to get the styles
+    template_name = ReportTemplateCache.get_template_name(mission.business_area)
+    with recorder.phase(TEMPLATE_PHASE):
+        document, template_version = ReportTemplateCache.open(template_name)
+
+    # Get the table templates
+    table_no_findings = document.tables[0]
+    table_with_findings = document.tables[1]
+    data_table = document.tables[2]
+
+    # Set the classification legend color from the background color of the banner
+    classification_style = document.styles['Table Classification']
+    classification_font = classification_style.font
+
+    # RGBColor doesn't handle shorthand hex codes, so expand legacy or "misguided" entries (in memory only; Colors
+    # are expanded when saved and by the repair_report_data command)
+    classification_font.color.rgb = RGBColor.from_string(
+        expand_hex_color_code(system_classification.get_report_label_color().hex_color_code))
+
+    # Intro H1 and text
+    report_progress(NARRATIVE_PHASE, 1, 6)
+    document.add_heading('Introduction', level=1)
+    portion_mark_and_insert(mission.introduction, document)
+
+    # Scope H1 and text
+    report_progress(NARRATIVE_PHASE, 2, 6)
+    document.add_heading('Scope', level=1)
+    portion_mark_and_insert(mission.scope, document)
+
+    # Objectives H1 and text
+    report_progress(NARRATIVE_PHASE, 3, 6)
+    document.add_heading('Objectives', level=1)
+    portion_mark_and_insert(mission.objectives, document)
+
+    # Exec Summary H1 and text
+    report_progress(NARRATIVE_PHASE, 4, 6)
+    document.add_heading('Executive Summary', level=1)
+    portion_mark_and_insert(mission.executive_summary, document)
+
+    # Technical Assessment / Attack Architecture and text H1
+    report_progress(NARRATIVE_PHASE, 5, 6)
+    document.add_heading('Technical Assessment / Attack Architecture', level=1)
+    portion_mark_and_insert(mission.technical_assessment_overview, document)
+
+    # Technical Assessment / Test Cases and Results and loop
+    document.add_heading('Technical Assessment / Test Cases and Results', level=1)
+
+    # For each test, Test # - Objective  Attack Phase: H2
+
+    """
+    Note: If a test case is hidden from the report, the test_case number and the auto-generated paragraph
+    number in Word won't align and it could cause confusion. The team may need to discuss how they want to
+    handle this situation.
+    """
+
+    """
+    WARNING
+
+    Hidden test cases are NOT numbered in the report so the customer doesn't think something was
+    accidentally left out. This will result in test case numbering differing between report and web when
+    one or more test cases are hidden from the report.
+    """
+
+    test_case_number = 0
+    tests_with_findings = 0
+    tests_without_findings = 0
+
+    fragments_reused = 0
+    fragments_from_shards = 0
+
+    if mission.supporting_data_include_flag:
+        supporting_data_by_test = report_data.supporting_data
+    else:
+        supporting_data_by_test = {t.id: [] for t in tests}
+
+    # Screenshots are read in the background, in report order, while earlier test cases are laid out
+    prefetcher = AttachmentPrefetcher(
+        (d.report_image_path(), d.file_size)
+        for t in tests for d in supporting_data_by_test[t.id] if d.image_format)
+
+    renderer = TestCaseRenderer(document, report_data, template_version, prefetcher.open, timer=recorder)
+
+    # Reuse the rendered test case from an earlier report if nothing that feeds into it has changed
+    with recorder.phase(TEST_CASE_PHASE):
+        fragment_keys = {
+            t.id: renderer.get_fragment_key(t, test_case_number, supporting_data_by_test[t.id])
+            for test_case_number, t in enumerate(tests, start=1)
+        }
+
+    # Large reports: render the test cases which aren't cached in parallel, in other processes, and splice them in
+    shard_fragments = {}
+    if ReportShards.is_enabled(total_reportable_tests):
+        uncached = [(t.id, test_case_number) for test_case_number, t in enumerate(tests, start=1)
+                    if not ReportFragmentCache.has(fragment_keys[t.id])]
+        if ReportShards.is_enabled(len(uncached)):
+            with recorder.phase(SHARD_PHASE):
+                rendered_by_shards = ReportShards.render(
+                    mission_id, template_name, uncached, recorder=recorder,
+                    progress=lambda rendered: report_progress(TEST_CASE_PHASE, rendered, len(uncached)))
+            for test_id, (fragment_key, fragment) in rendered_by_shards.items():
+                # A shard which saw the mission mid-edit (or a different template) rendered something else
+                if fragment_key == fragment_keys[test_id]:
+                    shard_fragments[test_id] = fragment
+
+    # Drawing ids for spliced test cases, without rescanning the document for each one
+    drawing_ids = DrawingIds(document.part)
+
+    with prefetcher, recorder.phase(TEST_CASE_PHASE):
+        for t in tests:
+
+            if test_case_number > 0:
+                document.add_page_break()
+
+            test_case_number += 1
+            report_progress(TEST_CASE_PHASE, test_case_number, total_reportable_tests)
+
+            if t.has_findings:
+                tests_with_findings += 1
+            else:
+                tests_without_findings += 1
+
+            # Duplicate one of the pre-made tables; if this is the last of a specific type of
+            # test case (findings / no findings), remove the blank template table afterwards.
+            is_last_test_case = True if test_case_number == total_reportable_tests else False
+            if t.has_findings:
+                template_table = table_with_findings
+                is_last_of_type = tests_with_findings == total_tests_with_findings or is_last_test_case
+            else:
+                template_table = table_no_findings
+                is_last_of_type = tests_without_findings == total_tests_without_findings or is_last_test_case
+
+            my_data = supporting_data_by_test[t.id]
+
+            fragment_key = fragment_keys[t.id]
+            fragment = shard_fragments.pop(t.id, None)
+            from_shard = fragment is not None
+            if fragment is None:
+                fragment = ReportFragmentCache.get(fragment_key)
+
+            if fragment is not None and ReportFragment.splice(document, fragment, open_image=prefetcher.open,
+                                                              drawing_ids=drawing_ids):
+                if from_shard:
+                    fragments_from_shards += 1
+                    ReportFragmentCache.set(fragment_key, fragment)
+                else:
+                    fragments_reused += 1
+                images_embedded += fragment['images_embedded']
+            else:
+                marker = document._body._element.sectPr.getprevious()
+                images = renderer.render(t, test_case_number, template_table, my_data)
+                images_embedded += len(images)
+                drawing_ids.reset()
+                ReportFragmentCache.set(fragment_key, ReportFragment.capture(document, marker, images))
+
+            if is_last_of_type:
+                remove_table(template_table)
+
+    recorder.test_cases = total_reportable_tests
+    recorder.images_embedded = images_embedded
+    recorder.fragments_reused = fragments_reused
+    recorder.bytes_read += prefetcher.bytes_read
+
+    logger.info('Prefetched {files} screenshot(s) ({bytes} bytes) for mission {mission}: {read:.2f}s reading, '
+                '{wait:.2f}s waiting on reads, {overlapped:.2f}s overlapped with layout'.format(
+                    mission=mission_id, files=prefetcher.files_read, bytes=prefetcher.bytes_read,
+                    read=prefetcher.read_seconds, wait=prefetcher.wait_seconds,
+                    overlapped=prefetcher.overlapped_seconds))
+
+    logger.debug('Reused {reused} of {total} cached test case fragments, {sharded} rendered in parallel (mission '
+                 '{mission})'.format(reused=fragments_reused, sharded=fragments_from_shards,
+                                     total=total_reportable_tests, mission=mission_id))
 
     # Conclusion H1 and text
+    report_progress(NARRATIVE_PHASE, 6, 6)
     document.add_heading('Conclusion', level=1)
     portion_mark_and_insert(mission.conclusion, document)
 
@@ -611,14 +841,17 @@ def generate_report_or_attachments(mission_id, zip_attachments=False):
     data_table.cell(2, 0).text = ""
 
     # Replace document slugs
-    replace_document_slugs(document)
+    with recorder.phase(SLUG_PHASE):
+        replace_document_slugs(document)
     name = mission.mission_name
-    if zip_attachments:
-        zip_file = shutil.make_archive(mission_data_dir, 'zip', mission_data_dir)
-        with open(mission_data_dir + '.zip', 'rb') as f:
-            return io.BytesIO(f.read()), name
-
-    else:
-        stream = BytesIO()
-        document.save(stream)
-        return stream, name
+    report_progress(OUTPUT_PHASE)
+    stream = get_output_buffer()
+    try:
+        with recorder.phase(OUTPUT_PHASE):
+            document.save(stream)
+    except BaseException:
+        stream.close()
+        raise
+    recorder.output_size = stream.tell()
+    stream.seek(0)
+    return stream, name
@@ -0,0 +1,46 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.core.management.base import BaseCommand, CommandError
+
+from missions.extras.helpers.renditions import ReportImageRendition
+from missions.models import Mission, SupportingData
+
+
+class Command(BaseCommand):
+    help = 'creates the downscaled report copies of image uploads (run after upgrading or changing the ' \
+           'REPORT_IMAGE_EMBED_* settings)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='recreate renditions even if they are current')
+
+    def handle(self, *args, **options):
+
+        if not ReportImageRendition.is_available():
+            raise CommandError('Pillow is not installed; install the packages in requirements.txt first.')
+
+        changed = 0
+        mission_ids = set()
+        for supporting_data in SupportingData.objects.select_related('test_detail').iterator():
+            if ReportImageRendition.refresh(supporting_data, force=options['force']):
+                changed += 1
+                mission_ids.add(supporting_data.test_detail.mission_id)
+
+        # Renditions are saved without signals; make sure reports cached before the backfill are rebuilt
+        for mission_id in mission_ids:
+            Mission.bump_content_version(mission_id)
+
+        self.stdout.write('Updated the report rendition of {} supporting data file(s).'.format(changed))
@@ -0,0 +1,42 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from missions.extras.helpers.jobs import ReportJobRunner
+
+
+class Command(BaseCommand):
+    help = 'processes queued report and supporting data package jobs (use with REPORT_JOB_RUNNER = "external")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='process the jobs currently queued and exit instead of polling')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='seconds to wait between polls of the job queue')
+
+    def handle(self, *args, **options):
+
+        while True:
+            processed = ReportJobRunner.run_queued_jobs()
+            if processed:
+                self.stdout.write('Processed {} report job(s).'.format(processed))
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
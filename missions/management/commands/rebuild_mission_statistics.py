@@ -0,0 +1,59 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.core.management.base import BaseCommand, CommandError
+
+from missions.models import Mission, MissionStatistics
+
+
+class Command(BaseCommand):
+    help = 'recomputes the statistics kept for each mission from its test cases and supporting data, or with ' \
+           '--check, verifies the kept statistics without changing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('mission_ids', nargs='*', type=int,
+                            help='only these missions (default: all)')
+        parser.add_argument('--check', action='store_true',
+                            help='verify only: report statistics which are out of step and fail if there are any')
+
+    def handle(self, *args, **options):
+        missions = Mission.objects.order_by('pk')
+        if options['mission_ids']:
+            missions = missions.filter(pk__in=options['mission_ids'])
+
+        out_of_step = 0
+        rebuilt = 0
+        for mission_id in missions.values_list('pk', flat=True):
+            saved = MissionStatistics.objects.filter(pk=mission_id).first()
+            if options['check']:
+                if saved is None:
+                    continue  # Not built yet
+                differences = saved.get_differences(MissionStatistics.compute(mission_id))
+                if differences:
+                    out_of_step += 1
+                    for field, kept, actual in differences:
+                        self.stdout.write('Mission {mission} {field}: kept {kept}, actually {actual}'.format(
+                            mission=mission_id, field=field, kept=kept, actual=actual))
+            else:
+                MissionStatistics.rebuild(mission_id)
+                rebuilt += 1
+
+        if options['check']:
+            if out_of_step:
+                raise CommandError('The statistics of {} mission(s) are out of step; run rebuild_mission_statistics '
+                                   'to correct them.'.format(out_of_step))
+            self.stdout.write('Mission statistics are consistent.')
+        else:
+            self.stdout.write('Rebuilt the statistics of {} mission(s).'.format(rebuilt))
@@ -0,0 +1,47 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.core.management.base import BaseCommand
+
+from missions.extras.helpers.metadata import SupportingDataMetadata
+from missions.models import Mission, SupportingData
+
+
+class Command(BaseCommand):
+    help = 'records the file type, image dimensions, size and hash of supporting data uploaded before these were ' \
+           'captured at upload time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='re-inspect every file, not just those without metadata')
+
+    def handle(self, *args, **options):
+
+        supporting_data = SupportingData.objects.select_related('test_detail')
+        if not options['force']:
+            supporting_data = supporting_data.filter(content_hash='')
+
+        changed = 0
+        mission_ids = set()
+        for d in supporting_data.iterator():
+            if SupportingDataMetadata.refresh(d, force=True):
+                changed += 1
+                mission_ids.add(d.test_detail.mission_id)
+
+        # Metadata is saved without signals; make sure reports cached before the backfill are rebuilt
+        for mission_id in mission_ids:
+            Mission.bump_content_version(mission_id)
+
+        self.stdout.write('Recorded metadata for {} supporting data file(s).'.format(changed))
@@ -0,0 +1,69 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from missions.extras.helpers.sorters import TestSortingHelper
+from missions.models import TestDetail, SupportingData, Color
+
+
+class Command(BaseCommand):
+    help = 'saves corrections which report generation only applies in memory: supporting data sort orders that ' \
+           'are out of step with the database, and shorthand (3 digit) color codes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report what would be corrected')
+        parser.add_argument('--check', action='store_true',
+                            help='verify only: like --dry-run, but fail if anything needs correcting')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run'] or options['check']
+
+        with transaction.atomic():
+            sort_orders = 0
+            for test in TestDetail.objects.all():
+                data_ids = list(SupportingData.objects.filter(test_detail=test).values_list('id', flat=True))
+                sort_orders += self.repair_sort_order(test, 'supporting_data_sort_order', data_ids)
+
+            colors = 0
+            for color in Color.objects.all():
+                if len(color.hex_color_code) == 3:
+                    colors += 1
+                    if not self.dry_run:
+                        color.save()  # Expands the code
+
+        verb = 'Would correct' if self.dry_run else 'Corrected'
+        self.stdout.write('{verb} {sort_orders} sort order(s) and {colors} color code(s).'.format(
+            verb=verb, sort_orders=sort_orders, colors=colors))
+
+        if options['check'] and (sort_orders or colors):
+            raise CommandError('Report data needs correcting; run repair_report_data to save the corrections.')
+
+    def repair_sort_order(self, instance, sort_order_field, ids_from_db):
+        sort_order = json.loads(getattr(instance, sort_order_field))
+        reconciled, dirty = TestSortingHelper.reconcile_sort_order(sort_order, ids_from_db)
+        if not dirty:
+            return 0
+
+        self.stdout.write('{model} {pk}: {old} -> {new}'.format(
+            model=type(instance).__name__, pk=instance.pk, old=sort_order, new=reconciled))
+        if not self.dry_run:
+            setattr(instance, sort_order_field, json.dumps(reconciled))
+            instance.save(update_fields=[sort_order_field])
+        return 1
@@ -0,0 +1,34 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Generated by Django 3.2.25 on 2026-10-18 03:02
+
+from django.db import migrations, models
+import missions.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0006_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mission',
+            name='content_version',
+            field=models.CharField(default=missions.models.new_content_version, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Generated by Django 3.2.25 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0008_supportingdata_report_rendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supportingdata',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 of the file', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='supportingdata',
+            name='content_type',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='supportingdata',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='supportingdata',
+            name='image_format',
+            field=models.CharField(blank=True, editable=False, help_text='File extension of the image type if this is a screenshot the report can embed, otherwise blank', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='supportingdata',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='supportingdata',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Generated by Django 3.2.25 on 2026-10-18 04:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0009_supportingdata_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('REPORT', 'Report'), ('ATTACHMENTS', 'Supporting Data Package')], default='REPORT', max_length=20)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('succeeded', models.BooleanField(default=True)),
+                ('duration', models.FloatField(default=0, help_text='Seconds')),
+                ('test_cases', models.IntegerField(default=0)),
+                ('images_embedded', models.IntegerField(default=0)),
+                ('fragments_reused', models.IntegerField(default=0, help_text='Test cases reused from earlier reports rather than rendered')),
+                ('query_count', models.IntegerField(default=0)),
+                ('bytes_read', models.BigIntegerField(default=0, help_text='Uploaded files read (screenshots or data package contents)')),
+                ('output_size', models.BigIntegerField(default=0)),
+                ('peak_memory', models.BigIntegerField(blank=True, help_text='Peak traced Python memory in bytes (REPORT_RUN_TRACE_MEMORY)', null=True)),
+                ('phase_timings', models.TextField(blank=True, default='[]', help_text='JSON list of [phase, seconds, queries, times entered]')),
+                ('mission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='missions.mission')),
+            ],
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Generated by Django 3.2.25 on 2026-10-18 04:27
+
+import json
+
+from django.db import migrations, models
+
+# Spacing between neighbouring sort positions; fixed here rather than imported so this migration never changes
+GAP = 1024
+
+
+def positions_from_sort_order(apps, schema_editor):
+    """ Numbers each mission's test cases in its saved sort order; test cases missing from it follow, by id """
+    Mission = apps.get_model('missions', 'Mission')
+    TestDetail = apps.get_model('missions', 'TestDetail')
+
+    for mission in Mission.objects.all():
+        tests = {t.id: t for t in TestDetail.objects.filter(mission=mission).order_by('id').only('id')}
+        try:
+            sort_order = json.loads(mission.testdetail_sort_order or '[]')
+        except ValueError:
+            sort_order = []
+
+        order = [test_id for test_id in sort_order if test_id in tests]
+        order = list(dict.fromkeys(order)) + [test_id for test_id in tests if test_id not in set(order)]
+
+        for index, test_id in enumerate(order, start=1):
+            tests[test_id].sort_position = index * GAP
+        TestDetail.objects.bulk_update(tests.values(), ['sort_position'], batch_size=500)
+
+
+def sort_order_from_positions(apps, schema_editor):
+    Mission = apps.get_model('missions', 'Mission')
+    TestDetail = apps.get_model('missions', 'TestDetail')
+
+    for mission in Mission.objects.all():
+        order = list(TestDetail.objects.filter(mission=mission).order_by('sort_position', 'id')
+                     .values_list('id', flat=True))
+        mission.testdetail_sort_order = json.dumps(order)
+        mission.save(update_fields=['testdetail_sort_order'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0011_reportjob_content_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testdetail',
+            name='sort_position',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(positions_from_sort_order, sort_order_from_positions),
+        migrations.RemoveField(
+            model_name='mission',
+            name='testdetail_sort_order',
+        ),
+    ]
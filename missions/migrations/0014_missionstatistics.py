@@ -0,0 +1,98 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Generated by Django 3.2.25 on 2026-10-18 04:36
+
+from collections import defaultdict
+from datetime import timedelta
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+# TestDetail fields the statistics are counted from; the counting is repeated here rather than imported from
+# MissionStatistics so this migration never changes
+TEST_DETAIL_FIELDS = ('mission', 'test_case_include_flag', 'test_case_status', 'execution_status', 'attack_phase',
+                      'has_findings', 'attack_time_date', 'mitigation')
+
+
+def count(counter, *keys):
+    for key in keys[:-1]:
+        counter = counter.setdefault(key, {})
+    counter[keys[-1]] = counter.get(keys[-1], 0) + 1
+
+
+def build_statistics(apps, schema_editor):
+    """ Builds the statistics of the existing missions, as MissionStatistics.compute does """
+    Mission = apps.get_model('missions', 'Mission')
+    MissionStatistics = apps.get_model('missions', 'MissionStatistics')
+    SupportingData = apps.get_model('missions', 'SupportingData')
+    TestDetail = apps.get_model('missions', 'TestDetail')
+
+    statistics = {mission_id: MissionStatistics(mission_id=mission_id)
+                  for mission_id in Mission.objects.values_list('id', flat=True)}
+    counters = defaultdict(lambda: defaultdict(dict))
+
+    for values in TestDetail.objects.filter(test_case_include_flag=True).values(*TEST_DETAIL_FIELDS).iterator():
+        mission, phase = statistics[values['mission']], values['attack_phase']
+        counter = counters[values['mission']]
+        mission.test_cases += 1
+        count(counter['by_status'], values['test_case_status'])
+        count(counter['by_result'], values['execution_status'])
+        count(counter['by_phase'], phase)
+        if values['has_findings']:
+            mission.test_cases_with_findings += 1
+            count(counter['findings_by_phase'], phase)
+        if values['mitigation'] and values['mitigation'].strip():
+            count(counter['mitigations_by_phase'], phase)
+        if values['execution_status'] != 'N' and values['attack_time_date'] is not None:
+            day = timezone.localtime(values['attack_time_date']).date()
+            count(counter['executed_by_week'], (day - timedelta(days=day.weekday())).isoformat(), phase)
+
+    for row in SupportingData.objects.values('test_detail__mission').annotate(count=models.Count('id')):
+        statistics[row['test_detail__mission']].supporting_data = row['count']
+
+    for mission_id, counter in counters.items():
+        for field, values in counter.items():
+            setattr(statistics[mission_id], field, json.dumps(values, sort_keys=True))
+    MissionStatistics.objects.bulk_create(statistics.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0013_sort_order_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MissionStatistics',
+            fields=[
+                ('mission', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='missions.mission')),
+                ('test_cases', models.IntegerField(default=0)),
+                ('test_cases_with_findings', models.IntegerField(default=0)),
+                ('supporting_data', models.IntegerField(default=0)),
+                ('by_status', models.TextField(blank=True, default='{}', help_text='JSON {test case status: count}')),
+                ('by_result', models.TextField(blank=True, default='{}', help_text='JSON {execution status: count}')),
+                ('by_phase', models.TextField(blank=True, default='{}', help_text='JSON {attack phase: count}')),
+                ('findings_by_phase', models.TextField(blank=True, default='{}', help_text='JSON {attack phase: count of test cases with findings}')),
+                ('mitigations_by_phase', models.TextField(blank=True, default='{}', help_text='JSON {attack phase: count of test cases with a mitigation}')),
+                ('executed_by_week', models.TextField(blank=True, default='{}', help_text='JSON {date the week starts: {attack phase: count of executed test cases}}')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(build_statistics, migrations.RunPython.noop),
+    ]
@@ -13,17 +13,24 @@
 # limitations under the License.
 #
 
+from collections import Counter
+from datetime import date, timedelta
+import json
 import os
+import uuid
 
 from django.core.cache import cache
-from django.db import models
-from django.db.models.signals import post_delete
+from django.db import models, transaction
+from django.db.models.functions import TruncDay, TruncWeek
+from django.db.models.signals import post_delete, post_save, pre_save, m2m_changed
 from django.dispatch.dispatcher import receiver
 from django.utils import timezone
 from django.urls import reverse_lazy
 from django.conf import settings
 
-from .extras.helpers.formatters import join_as_compacted_paragraphs
+from .extras.helpers.formatters import join_as_compacted_paragraphs, expand_hex_color_code
+from .extras.helpers.metadata import SupportingDataMetadata
+from .extras.helpers.renditions import ReportImageRendition
 from .extras.validators import validate_host_format_string
 
 
@@ -57,6 +64,29 @@ def conclusion_default():
     return Mission.get_default_text('conclusion.txt')
 
 
+def new_content_version():
+    return uuid.uuid4().hex
+
+
+# Spacing between the sort positions of neighbouring test cases
+SORT_POSITION_GAP = 1024
+
+
+def fields_to_update(instance, save_kwargs, excluded):
+    """
+    The update_fields for a plain save() of an existing instance which leaves the excluded fields (and any
+    deferred ones) alone, so a save of a stale instance can't put back their old values; None when the save
+    should go ahead as asked (a new instance, or the caller chose the fields).
+    """
+    if instance.pk is None or instance._state.adding or save_kwargs.get('force_insert') \
+            or save_kwargs.get('update_fields') is not None:
+        return save_kwargs.get('update_fields')
+
+    deferred = instance.get_deferred_fields()
+    return [f.name for f in instance._meta.concrete_fields
+            if not f.primary_key and f.name not in excluded and f.attname not in deferred]
+
+
 """
 Models
 """
@@ -208,14 +238,39 @@ class Mission(models.Model):
         verbose_name="Mission Option: Include customer notes section in report?"
     )
 
-    testdetail_sort_order = models.TextField(
-        blank=True,
-        default="[]"
+    # Counts changes to the order of the mission's test cases; a reorder based on an older version is refused (see
+    # TestSortingHelper). Only ever written by TestSortingHelper, never by a plain save().
+    test_order_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+
+    # Changes whenever anything that ends up in the mission's report changes; used to key cached report output.
+    # Random rather than a counter so a save of a stale instance can never bring back an earlier version.
+    content_version = models.CharField(
+        max_length=32,
+        default=new_content_version,
+        editable=False,
     )
 
+    @staticmethod
+    def bump_content_version(mission_id=None):
+        """ Marks one mission (or every mission when mission_id is None) as changed """
+        missions = Mission.objects.all()
+        if mission_id is not None:
+            missions = missions.filter(pk=mission_id)
+        missions.update(content_version=new_content_version())
+
     def __str__(self):
         return "%s (%s)" % (self.mission_name, self.mission_number)
 
+    def save(self, *args, **kwargs):
+        kwargs['update_fields'] = fields_to_update(self, kwargs, excluded={'test_order_version'})
+        self.content_version = new_content_version()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'content_version'}
+        return super(Mission, self).save(*args, **kwargs)
+
 
 class Host(models.Model):
     mission = models.ForeignKey(
@@ -243,12 +298,15 @@ class Host(models.Model):
         format_string = str(DARTDynamicSettings.objects.get_as_object().host_output_format)
         return format_string
 
+    def format(self, format_string):
+        return format_string.format(name=self.host_name, ip=self.ip_address)
+
     def __str__(self):
         format_string = cache.get('host_output_format_string')
         if format_string is None:
             cache.set('host_output_format_string', Host.get_host_output_format_string(), 300)
             format_string = cache.get('host_output_format_string')
-        return format_string.format(name=self.host_name, ip=self.ip_address)
+        return self.format(format_string)
 
     def get_absolute_url(self):
         return
@@ -491,15 +549,65 @@ class TestDetail(models.Model):
         default="[]"
     )
 
+    # Counts reorders of the test case's supporting data, like Mission.test_order_version
+    supporting_data_order_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+
+    # Where the test case sits in the mission's test list and report. Positions are spaced SORT_POSITION_GAP apart
+    # so a test case can be moved between two others by updating only its own row (see TestSortingHelper).
+    sort_position = models.BigIntegerField(
+        default=0,
+        db_index=True,
+        editable=False,
+    )
+
+    # Maintained by TestSortingHelper and the supporting data signals; a plain save() of an existing test case (e.g.
+    # from the edit form) leaves them as they are in the database
+    ORDER_FIELDS = {'sort_position', 'supporting_data_sort_order', 'supporting_data_order_version'}
+
     def count_of_supporting_data(self):
         return len(SupportingData.objects.filter(test_detail=self.pk))
 
+    @staticmethod
+    def update_supporting_data_sort_order(test_detail_id, add=(), remove=()):
+        """
+        Appends supporting data ids to (or removes them from) a test case's saved supporting data order. The test
+        case's row is locked for the read-modify-write, so concurrent uploads never lose each other's ids.
+        """
+        with transaction.atomic():
+            saved = TestDetail.objects.select_for_update().filter(pk=test_detail_id) \
+                .values_list('supporting_data_sort_order', flat=True).first()
+            if saved is None:
+                return  # The test case is being deleted
+
+            try:
+                sort_order = json.loads(saved)
+            except ValueError:
+                sort_order = []
+            updated = [x for x in sort_order if x not in remove]
+            updated += [x for x in add if x not in updated]
+
+            if updated != sort_order:
+                TestDetail.objects.filter(pk=test_detail_id).update(supporting_data_sort_order=json.dumps(updated))
+
     def __str__(self):
         return "%s (%s)" % (self.test_objective, self.id)
 
     def save(self, *args, **kwargs):
+        kwargs['update_fields'] = fields_to_update(self, kwargs, excluded=self.ORDER_FIELDS)
         self.has_findings = True if len(self.findings) > 0 else False
-        return super(TestDetail, self).save(*args, **kwargs)
+
+        # New (and cloned) test cases go to the end of the mission's list
+        if self.pk is None:
+            last_position = TestDetail.objects.filter(mission_id=self.mission_id) \
+                .aggregate(last=models.Max('sort_position'))['last']
+            self.sort_position = SORT_POSITION_GAP if last_position is None else last_position + SORT_POSITION_GAP
+
+        # The mission's statistics are updated in the same transaction (see TestDetail_update_statistics)
+        with transaction.atomic():
+            return super(TestDetail, self).save(*args, **kwargs)
 
 
 class SupportingData(models.Model):
@@ -519,9 +627,87 @@ class SupportingData(models.Model):
         verbose_name="Supporting Data"
     )
 
+    # Downscaled / transcoded copy of an image upload used when embedding it in the report; blank if the original
+    # is already suitable. See ReportImageRendition.
+    report_rendition = models.FileField(
+        blank=True,
+        editable=False,
+    )
+
+    # Recorded when the file is uploaded (see SupportingDataMetadata) so reports needn't inspect every file
+    content_type = models.CharField(
+        blank=True,
+        max_length=100,
+        editable=False,
+    )
+
+    image_format = models.CharField(
+        blank=True,
+        max_length=10,
+        editable=False,
+        help_text='File extension of the image type if this is a screenshot the report can embed, otherwise blank',
+    )
+
+    image_width = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+    )
+
+    image_height = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+    )
+
+    file_size = models.PositiveBigIntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+    )
+
+    content_hash = models.CharField(
+        blank=True,
+        max_length=64,
+        editable=False,
+        help_text='SHA-256 of the file',
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(SupportingData, cls).from_db(db, field_names, values)
+        if 'test_file' in field_names:
+            instance.mark_test_file_loaded()
+        return instance
+
+    def mark_test_file_loaded(self):
+        self._loaded_test_file_name = self.test_file.name
+
+    def test_file_changed(self):
+        """ True if a different file has been assigned since this record was loaded (always true for new records) """
+        return self.test_file.name != getattr(self, '_loaded_test_file_name', None)
+
+    def has_metadata(self):
+        return bool(self.content_hash)
+
+    def is_report_image(self):
+        """ True if the file is a screenshot embedded in the report rather than listed as an attachment """
+        if self.has_metadata():
+            return bool(self.image_format)
+
+        # Not backfilled yet (see the record_supporting_data_metadata command)
+        with self.test_file.open('rb') as stream:
+            return SupportingDataMetadata.read_image_header(stream) is not None
+
     def filename(self):
         return os.path.basename(self.test_file.name)
 
+    def report_image_path(self):
+        """ The file to embed in the report for an image upload """
+        if self.report_rendition:
+            return self.report_rendition.path
+        return self.test_file.path
+
     def get_absolute_url(self):
         return reverse_lazy('data-view', {'supportingdata': self.pk})
 
@@ -546,6 +732,10 @@ class Color(models.Model):
         default="",
     )
 
+    def save(self, *args, **kwargs):
+        self.hex_color_code = expand_hex_color_code(self.hex_color_code)
+        super(Color, self).save(*args, **kwargs)
+
     def __str__(self):
         return '{0.display_text}'.format(self)
 
@@ -630,7 +820,616 @@ class DARTDynamicSettings(models.Model):
     objects = DARTDynamicSettingsManager()
 
 
+class ReportJob(models.Model):
+    """
+    A queued request to build a mission report or supporting data package. Jobs are picked up by the report
+    job runner (missions.extras.helpers.jobs) and record their progress here so the UI can poll for it.
+    """
+
+    mission = models.ForeignKey(
+        Mission,
+        on_delete=models.CASCADE,
+    )
+
+    KIND_REPORT = 'REPORT'
+    KIND_ATTACHMENTS = 'ATTACHMENTS'
+
+    KIND_OPTIONS = (
+        (KIND_REPORT, 'Report'),
+        (KIND_ATTACHMENTS, 'Supporting Data Package'),
+    )
+
+    kind = models.CharField(
+        choices=KIND_OPTIONS,
+        max_length=20,
+        default=KIND_REPORT,
+    )
+
+    # The mission's content_version when the job was submitted; requests for the same output share a job
+    content_version = models.CharField(
+        blank=True,
+        default="",
+        max_length=32,
+    )
+
+    STATUS_QUEUED = 'QUEUED'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_COMPLETE = 'COMPLETE'
+    STATUS_FAILED = 'FAILED'
+
+    STATUS_OPTIONS = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    status = models.CharField(
+        choices=STATUS_OPTIONS,
+        max_length=20,
+        default=STATUS_QUEUED,
+    )
+
+    phase = models.CharField(
+        blank=True,
+        default="",
+        max_length=50,
+    )
+
+    progress_current = models.IntegerField(
+        default=0,
+    )
+
+    progress_total = models.IntegerField(
+        default=0,
+    )
+
+    images_embedded = models.IntegerField(
+        default=0,
+    )
+
+    message = models.TextField(
+        blank=True,
+        default="",
+    )
+
+    output_path = models.CharField(
+        blank=True,
+        default="",
+        max_length=500,
+    )
+
+    output_name = models.CharField(
+        blank=True,
+        default="",
+        max_length=255,
+    )
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+
+    created_at = models.DateTimeField(
+        default=timezone.now,
+    )
+
+    started_at = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+
+    finished_at = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+
+    # The process (see ReportJobRunner.get_runner_id) which has the job queued or is running it; blank while a
+    # job waits for an external worker
+    runner = models.CharField(
+        blank=True,
+        default="",
+        max_length=100,
+    )
+
+    # Refreshed by the runner's process while the job is queued there or running; a job that stops getting
+    # heartbeats (its process has gone away) is recovered by ReportJobRunner.recover_stale_jobs
+    heartbeat_at = models.DateTimeField(
+        default=timezone.now,
+    )
+
+    def is_finished(self):
+        return self.status in (ReportJob.STATUS_COMPLETE, ReportJob.STATUS_FAILED)
+
+    def __str__(self):
+        return '{0.kind} job {0.id} for mission {0.mission_id} ({0.status})'.format(self)
+
+
+class ReportRun(models.Model):
+    """
+    Timings and resource use of one report or supporting data package build, kept as a short per-mission history
+    (REPORT_RUN_HISTORY_LENGTH runs) so slow missions and regressions can be spotted. Recorded by ReportRunRecorder
+    (missions.extras.helpers.instrumentation).
+    """
+
+    mission = models.ForeignKey(
+        Mission,
+        on_delete=models.CASCADE,
+    )
+
+    kind = models.CharField(
+        choices=ReportJob.KIND_OPTIONS,
+        max_length=20,
+        default=ReportJob.KIND_REPORT,
+    )
+
+    started_at = models.DateTimeField(
+        default=timezone.now,
+    )
+
+    succeeded = models.BooleanField(
+        default=True,
+    )
+
+    duration = models.FloatField(
+        default=0,
+        help_text='Seconds',
+    )
+
+    test_cases = models.IntegerField(
+        default=0,
+    )
+
+    images_embedded = models.IntegerField(
+        default=0,
+    )
+
+    fragments_reused = models.IntegerField(
+        default=0,
+        help_text='Test cases reused from earlier reports rather than rendered',
+    )
+
+    query_count = models.IntegerField(
+        default=0,
+    )
+
+    bytes_read = models.BigIntegerField(
+        default=0,
+        help_text='Uploaded files read (screenshots or data package contents)',
+    )
+
+    output_size = models.BigIntegerField(
+        default=0,
+    )
+
+    peak_memory = models.BigIntegerField(
+        blank=True,
+        null=True,
+        help_text='Peak traced Python memory in bytes (REPORT_RUN_TRACE_MEMORY)',
+    )
+
+    phase_timings = models.TextField(
+        blank=True,
+        default="[]",
+        help_text='JSON list of [phase, seconds, queries, times entered]',
+    )
+
+    def get_phase_timings(self):
+        try:
+            return json.loads(self.phase_timings)
+        except ValueError:
+            return []
+
+    def __str__(self):
+        return '{0.kind} run {0.id} for mission {0.mission_id} ({0.duration:.2f}s)'.format(self)
+
+
+class MissionStatistics(models.Model):
+    """
+    A mission's statistics, kept up to date as test cases and supporting data are saved and deleted (see the
+    signals below) so reading them is a single primary key lookup. Like MissionAnalytics, the test case counts
+    only cover test cases included in the report.
+
+    Created empty with the mission; those of missions created before they existed are built by migration 0014, and
+    the rebuild_mission_statistics command rebuilds (or checks) them. Reading them never writes.
+    Changes are added as deltas: contribution() gives what one test case adds to each counter. updated_at changes
+    with every update (including edits of the mission itself), which is how PortfolioAnalytics finds what to refresh.
+    """
+
+    # TestDetail fields the statistics depend on
+    TEST_DETAIL_FIELDS = ('mission', 'test_case_include_flag', 'test_case_status', 'execution_status', 'attack_phase',
+                          'has_findings', 'attack_time_date', 'mitigation')
+
+    # JSON {key: count} counters
+    COUNTER_FIELDS = ('by_status', 'by_result', 'by_phase', 'findings_by_phase', 'mitigations_by_phase',
+                      'executed_by_week')
+
+    mission = models.OneToOneField(
+        Mission,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='statistics',
+    )
+
+    test_cases = models.IntegerField(
+        default=0,
+    )
+
+    test_cases_with_findings = models.IntegerField(
+        default=0,
+    )
+
+    # Of every test case, whether or not it's included in the report
+    supporting_data = models.IntegerField(
+        default=0,
+    )
+
+    by_status = models.TextField(
+        blank=True,
+        default="{}",
+        help_text='JSON {test case status: count}',
+    )
+
+    by_result = models.TextField(
+        blank=True,
+        default="{}",
+        help_text='JSON {execution status: count}',
+    )
+
+    by_phase = models.TextField(
+        blank=True,
+        default="{}",
+        help_text='JSON {attack phase: count}',
+    )
+
+    findings_by_phase = models.TextField(
+        blank=True,
+        default="{}",
+        help_text='JSON {attack phase: count of test cases with findings}',
+    )
+
+    mitigations_by_phase = models.TextField(
+        blank=True,
+        default="{}",
+        help_text='JSON {attack phase: count of test cases with a mitigation}',
+    )
+
+    executed_by_week = models.TextField(
+        blank=True,
+        default="{}",
+        help_text='JSON {date the week starts: {attack phase: count of executed test cases}}',
+    )
+
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+    )
+
+    @staticmethod
+    def get_week_start(moment):
+        """ The Monday starting the week of a date/time, in the current time zone (as the database's TruncWeek) """
+        day = timezone.localtime(moment).date()
+        return day - timedelta(days=day.weekday())
+
+    @classmethod
+    def contribution(cls, values):
+        """
+        :param values: {name: value} of a test case's TEST_DETAIL_FIELDS, or None
+        :return: Counter of what the test case adds to each statistic, keyed by (field,) or (field, key[, key])
+        """
+        if not values or not values['test_case_include_flag']:
+            return Counter()
+
+        counts = Counter({
+            ('test_cases',): 1,
+            ('by_status', values['test_case_status']): 1,
+            ('by_result', values['execution_status']): 1,
+            ('by_phase', values['attack_phase']): 1,
+        })
+        if values['has_findings']:
+            counts[('test_cases_with_findings',)] += 1
+            counts[('findings_by_phase', values['attack_phase'])] += 1
+        if values['mitigation'] and values['mitigation'].strip():
+            counts[('mitigations_by_phase', values['attack_phase'])] += 1
+        if values['execution_status'] != 'N' and values['attack_time_date'] is not None:
+            week = cls.get_week_start(values['attack_time_date']).isoformat()
+            counts[('executed_by_week', week, values['attack_phase'])] += 1
+        return counts
+
+    @classmethod
+    def is_affected_by(cls, update_fields):
+        """ :return: Whether saving a test case with the given update_fields (None: every field) can change these """
+        if update_fields is None:
+            return True
+        return any(name in update_fields or TestDetail._meta.get_field(name).attname in update_fields
+                   for name in cls.TEST_DETAIL_FIELDS)
+
+    @classmethod
+    def difference(cls, after, before):
+        """ :return: Counter of the changes to the statistics when a test case's values change from before to after """
+        delta = cls.contribution(after)
+        delta.subtract(cls.contribution(before))
+        return delta
+
+    def add(self, delta):
+        """ Adds a Counter of changes (see contribution) to the statistics, without saving them """
+        counters = {}
+        for key, count in delta.items():
+            if not count:
+                continue
+            if len(key) == 1:
+                setattr(self, key[0], getattr(self, key[0]) + count)
+                continue
+
+            if key[0] not in counters:
+                counters[key[0]] = self.get_counter(key[0])
+            counter = counters[key[0]]
+            for part in key[1:-1]:
+                counter = counter.setdefault(part, {})
+            counter[key[-1]] = counter.get(key[-1], 0) + count
+
+        for field, counter in counters.items():
+            setattr(self, field, json.dumps(self._prune(counter), sort_keys=True))
+
+    @classmethod
+    def _prune(cls, counter):
+        """ Drops zero counts and empty groups """
+        pruned = {}
+        for key, value in counter.items():
+            if isinstance(value, dict):
+                value = cls._prune(value)
+            if value:
+                pruned[key] = value
+        return pruned
+
+    def get_counter(self, field):
+        try:
+            return json.loads(getattr(self, field))
+        except ValueError:
+            return {}
+
+    def get_execution_matrix(self):
+        """ The matrix of get_matrix for the stored weekly counts (see get_week_start) """
+        counts = dict(((date.fromisoformat(week), phase), count)
+                      for week, phases in self.get_counter('executed_by_week').items()
+                      for phase, count in phases.items())
+        return self.get_matrix(counts, timedelta(days=7))
+
+    @staticmethod
+    def get_matrix(counts, step):
+        """
+        :param counts: {(date the week or day starts, attack phase): count of executed test cases}
+        :param step: The length of a period (a week or a day)
+        :return: {
+            'periods': [date each period starts, from the first execution to the last with none skipped],
+            'phases': [(attack phase, [count per period])] for each of TestDetail.ATTACK_PHASES,
+            'totals': [count per period],
+        }; with no periods if no test cases have been executed
+        """
+        periods = []
+        if counts:
+            first = min(start for start, phase in counts)
+            last = max(start for start, phase in counts)
+            periods = [first + step * i for i in range((last - first) // step + 1)]
+
+        phases = [(phase, [counts.get((start, phase), 0) for start in periods])
+                  for phase, _ in TestDetail.ATTACK_PHASES]
+        totals = [sum(row[i] for phase, row in phases) for i in range(len(periods))]
+        return {'periods': periods, 'phases': phases, 'totals': totals}
+
+    @staticmethod
+    def count_executed(mission_id, period='week'):
+        """
+        Executed test cases counted per attack phase and week (or day) of the attack date, bucketed by the database
+        in the current time zone; weeks start on Monday, as with get_week_start.
+        :param period: 'week' or 'day'
+        :return: {(date the week or day starts, attack phase): count}, of test cases included in the report
+        """
+        truncate = {'week': TruncWeek, 'day': TruncDay}[period]
+        buckets = TestDetail.objects.filter(mission=mission_id, test_case_include_flag=True) \
+            .exclude(execution_status='N').exclude(attack_time_date=None) \
+            .annotate(period=truncate('attack_time_date', output_field=models.DateField())) \
+            .values('period', 'attack_phase').annotate(count=models.Count('pk')).order_by()
+        return dict(((bucket['period'], bucket['attack_phase']), bucket['count']) for bucket in buckets)
+
+    @classmethod
+    def compute(cls, mission_id):
+        """ :return: The mission's statistics computed from scratch (not saved) """
+        statistics = cls(mission_id=mission_id)
+        totals = Counter()
+        for values in TestDetail.objects.filter(mission=mission_id).values(*cls.TEST_DETAIL_FIELDS).iterator():
+            totals.update(cls.contribution(values))
+        totals[('supporting_data',)] = SupportingData.objects.filter(test_detail__mission=mission_id).count()
+
+        # The weeks are bucketed by the database rather than test case by test case
+        for key in [key for key in totals if key[0] == 'executed_by_week']:
+            del totals[key]
+        for (week, phase), count in cls.count_executed(mission_id).items():
+            totals[('executed_by_week', week.isoformat(), phase)] = count
+        statistics.add(totals)
+        return statistics
+
+    @classmethod
+    def rebuild(cls, mission_id):
+        """ Recomputes and saves a mission's statistics """
+        with transaction.atomic():
+            # Locking the row serializes with other rebuilds and the updates of saves and deletes. It's created first
+            # if need be; get_or_create re-reads it if a concurrent rebuild inserts it in the meantime. On SQLite the
+            # no-op update takes the write lock before anything is read, so concurrent rebuilds wait for each other
+            # instead of failing with "database is locked" (see TestSortingHelper._lock_for_write)
+            cls.objects.filter(pk=mission_id).update(updated_at=models.F('updated_at'))
+            cls.objects.get_or_create(mission_id=mission_id)
+            cls.objects.select_for_update().get(pk=mission_id)
+            statistics = cls.compute(mission_id)
+            statistics.save()
+        return statistics
+
+    @classmethod
+    def get_for_mission(cls, mission_id):
+        """
+        :return: The mission's saved statistics; computed (and not saved) for a mission which has none, such as one
+        loaded from a fixture, until rebuild_mission_statistics saves them
+        """
+        statistics = cls.objects.filter(pk=mission_id).first()
+        return cls.compute(mission_id) if statistics is None else statistics
+
+    @classmethod
+    def apply(cls, mission_id, delta):
+        """ Adds a Counter of changes (see contribution) to a mission's saved statistics, if they've been built """
+        if mission_id is None or not any(delta.values()):
+            return
+        with transaction.atomic():
+            statistics = cls.objects.select_for_update().filter(pk=mission_id).first()
+            if statistics is not None:
+                statistics.add(delta)
+                statistics.save()
+
+    def get_differences(self, other):
+        """ :return: [(field, this value, other value)] for the statistics which differ from another's """
+        differences = []
+        for field in ('test_cases', 'test_cases_with_findings', 'supporting_data') + self.COUNTER_FIELDS:
+            mine, theirs = getattr(self, field), getattr(other, field)
+            if field in self.COUNTER_FIELDS:
+                mine, theirs = self.get_counter(field), other.get_counter(field)
+            if mine != theirs:
+                differences.append((field, mine, theirs))
+        return differences
+
+    def __str__(self):
+        return 'Statistics for mission {0}'.format(self.mission_id)
+
+
 # Catch deletions of supporting data records and remove the associated file
 @receiver(post_delete, sender=SupportingData)
 def SupportingData_delete(sender, instance, **kwargs):
     instance.test_file.delete(False)
+    if instance.report_rendition:
+        instance.report_rendition.delete(False)
+
+
+# Inspect uploads and prepare the report-ready copy of images as they come in rather than on every report run
+@receiver(post_save, sender=SupportingData)
+def SupportingData_prepare_for_report(sender, instance, raw=False, **kwargs):
+    if not raw:
+        SupportingDataMetadata.refresh(instance)
+        ReportImageRendition.refresh(instance)
+
+
+# Keep each test case's supporting data order in step as supporting data is added and removed, so reading it never
+# has to correct it (fixtures loaded with raw saves bring their own order)
+@receiver(post_save, sender=SupportingData)
+def SupportingData_add_to_sort_order(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        TestDetail.update_supporting_data_sort_order(instance.test_detail_id, add=[instance.pk])
+
+
+@receiver(post_delete, sender=SupportingData)
+def SupportingData_remove_from_sort_order(sender, instance, **kwargs):
+    TestDetail.update_supporting_data_sort_order(instance.test_detail_id, remove=[instance.pk])
+
+
+# Keep each mission's statistics up to date: the test case's values before a save are read (and its row locked) so
+# the change can be added as a delta. Saves which only update other fields (such as moves) are skipped
+@receiver(pre_save, sender=TestDetail)
+def TestDetail_read_statistics(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._statistics_before = None
+    if not raw and instance.pk is not None and MissionStatistics.is_affected_by(update_fields):
+        instance._statistics_before = TestDetail.objects.select_for_update().filter(pk=instance.pk) \
+            .values(*MissionStatistics.TEST_DETAIL_FIELDS).first()
+
+
+@receiver(post_save, sender=TestDetail)
+def TestDetail_update_statistics(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not MissionStatistics.is_affected_by(update_fields):
+        return
+    before = getattr(instance, '_statistics_before', None)
+    instance._statistics_before = None
+
+    # Fields left out of update_fields keep their values in the database
+    after = dict(before or {})
+    for name in MissionStatistics.TEST_DETAIL_FIELDS:
+        field = TestDetail._meta.get_field(name)
+        if before is None or update_fields is None or name in update_fields or field.attname in update_fields:
+            after[name] = getattr(instance, field.attname)
+
+    if before is not None and before['mission'] != after['mission']:
+        MissionStatistics.apply(before['mission'], MissionStatistics.difference(None, before))
+        before = None
+    MissionStatistics.apply(after['mission'], MissionStatistics.difference(after, before))
+
+
+@receiver(post_delete, sender=TestDetail)
+def TestDetail_remove_from_statistics(sender, instance, **kwargs):
+    values = dict((name, getattr(instance, TestDetail._meta.get_field(name).attname))
+                  for name in MissionStatistics.TEST_DETAIL_FIELDS)
+    MissionStatistics.apply(instance.mission_id, MissionStatistics.difference(None, values))
+
+
+@receiver(post_save, sender=SupportingData)
+@receiver(post_delete, sender=SupportingData)
+def SupportingData_update_statistics(sender, instance, created=False, raw=False, **kwargs):
+    if raw or (kwargs['signal'] is post_save and not created):
+        return
+    MissionStatistics.apply(
+        TestDetail.objects.filter(pk=instance.test_detail_id).values_list('mission_id', flat=True).first(),
+        Counter({('supporting_data',): 1 if created else -1}))
+
+
+@receiver(post_save, sender=Mission)
+def Mission_touch_statistics(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        # A new mission has no test cases, so its statistics start out empty
+        MissionStatistics.objects.get_or_create(mission=instance)
+    else:
+        # The mission's business area is part of the portfolio rollups (see PortfolioAnalytics)
+        MissionStatistics.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+
+
+# Keep each mission's content_version current so cached report output is never served after an edit
+@receiver(post_save, sender=TestDetail)
+@receiver(post_delete, sender=TestDetail)
+@receiver(post_save, sender=Host)
+@receiver(post_delete, sender=Host)
+def mission_content_changed(sender, instance, **kwargs):
+    Mission.bump_content_version(instance.mission_id)
+
+
+@receiver(post_save, sender=SupportingData)
+@receiver(post_delete, sender=SupportingData)
+def supporting_data_content_changed(sender, instance, **kwargs):
+    mission_id = TestDetail.objects.filter(pk=instance.test_detail_id).values_list('mission_id', flat=True).first()
+    # None when the test case is being deleted along with it (which bumps the mission itself); bumping None would
+    # mark every mission as changed
+    if mission_id is not None:
+        Mission.bump_content_version(mission_id)
+
+
+@receiver(m2m_changed, sender=TestDetail.source_hosts.through)
+@receiver(m2m_changed, sender=TestDetail.target_hosts.through)
+def test_hosts_changed(sender, instance, action, **kwargs):
+    # instance is either the TestDetail or the Host depending on which side of the relation changed
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        Mission.bump_content_version(instance.mission_id)
+
+
+@receiver(post_save, sender=DARTDynamicSettings)
+@receiver(post_delete, sender=DARTDynamicSettings)
+@receiver(post_save, sender=ClassificationLegend)
+@receiver(post_delete, sender=ClassificationLegend)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=BusinessArea)
+def system_content_changed(sender, **kwargs):
+    # System-wide settings appear in every report
+    Mission.bump_content_version()
+
+
+# Catch deletions of report jobs and remove the generated output
+@receiver(post_delete, sender=ReportJob)
+def ReportJob_delete(sender, instance, **kwargs):
+    if instance.output_path and os.path.isfile(instance.output_path):
+        os.remove(instance.output_path)
@@ -0,0 +1,625 @@
+# Copyright 2026 Lockheed Martin Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from datetime import date, datetime, timedelta
+from http.client import CONFLICT
+from importlib import import_module
+from io import BytesIO
+import json
+import os
+import shutil
+import struct
+import tempfile
+from unittest import mock
+import zipfile
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from docx import Document
+from docx.oxml.ns import qn
+from PIL import Image
+
+from missions.extras.helpers import archives
+from missions.extras.helpers.analytics import MissionAnalytics, PortfolioAnalytics
+from missions.extras.helpers.archives import iter_zip
+from missions.extras.helpers.artifacts import ReportArtifactCache
+from missions.extras.helpers.fragments import ReportFragmentCache
+from missions.extras.helpers.jobs import ReportJobRunner
+from missions.extras.helpers.reportdata import ReportData
+from missions.extras.helpers.sorters import TestSortingHelper
+from missions.extras.utils import generate_report_or_attachments
+from missions.models import SORT_POSITION_GAP, BusinessArea, Host, Mission, MissionStatistics, ReportJob, ReportRun, \
+    SupportingData, TestDetail
+
+
+class MissionDataMixin(object):
+    """
+    Builds missions with test cases, hosts and supporting data, with uploads (MEDIA_ROOT) and everything reports
+    write to disk going to a temporary directory
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.media_root = os.path.join(cls.temp_dir, 'media')
+        cls.directories_override = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            REPORT_ARTIFACT_CACHE_DIR=os.path.join(cls.temp_dir, 'report_artifacts'),
+            REPORT_BUILD_LOCK_DIR=os.path.join(cls.temp_dir, 'report_builds'),
+            REPORT_JOB_OUTPUT_DIR=os.path.join(cls.temp_dir, 'report_jobs'),
+            REPORT_SPOOL_DIR=cls.temp_dir,
+        )
+        cls.directories_override.enable()
+        super(MissionDataMixin, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(MissionDataMixin, cls).tearDownClass()
+        cls.directories_override.disable()
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def get_png():
+        output = BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(output, 'PNG')
+        return output.getvalue()
+
+    @staticmethod
+    def get_test_values(number):
+        """ :return: TestDetail field values which vary with number, so that test cases fill every statistic """
+        return {
+            'test_objective': 'Objective {0}'.format(number),
+            'test_description': 'Description',
+            'test_case_include_flag': number % 5 != 4,
+            'test_case_status': TestDetail.TEST_CASE_STATUSES[number % 4][0],
+            'attack_phase': TestDetail.ATTACK_PHASES[number % 7][0],
+            'execution_status': TestDetail.EXECUTION_STATUS_OPTIONS[number % 4][0],
+            'attack_time_date': timezone.now() - timedelta(days=3 * number),
+            'has_findings': number % 3 == 0,
+            'findings': 'Findings' if number % 3 == 0 else '',
+            'mitigation': 'Mitigation' if number % 2 else '',
+        }
+
+    @classmethod
+    def create_mission(cls, test_cases=0, hosts_per_test=0, supporting_data_per_test=0, business_area='Testing'):
+        mission = Mission.objects.create(
+            mission_name='Mission with {0} test cases'.format(test_cases),
+            business_area=BusinessArea.objects.get_or_create(name=business_area)[0],
+            test_case_identifier='T',
+        )
+        for number in range(test_cases):
+            cls.create_test(mission, number, hosts_per_test, supporting_data_per_test)
+        return mission
+
+    @classmethod
+    def create_test(cls, mission, number=0, hosts=0, supporting_data=0):
+        test = TestDetail.objects.create(mission=mission, **cls.get_test_values(number))
+        for host in range(hosts):
+            test.target_hosts.add(Host.objects.create(mission=mission, host_name='10.0.0.{0}'.format(host + 1)))
+            test.source_hosts.add(Host.objects.create(mission=mission, host_name='10.1.0.{0}'.format(host + 1)))
+        for data in range(supporting_data):
+            SupportingData.objects.create(
+                test_detail=test,
+                caption='Screenshot {0}'.format(data),
+                test_file=SimpleUploadedFile('screenshot.png', cls.get_png(), content_type='image/png'),
+            )
+        return test
+
+
+@override_settings(REPORT_FRAGMENT_CACHE_ENABLED=False, REPORT_PREFETCH_WORKERS=0, REPORT_SHARD_WORKERS=0)
+class ReportQueryCountTests(MissionDataMixin, TestCase):
+    """ Report generation reads the database a fixed number of times, however large the mission """
+
+    def test_report_data_queries(self):
+        for size in (1, 5, 20):
+            mission = self.create_mission(size, hosts_per_test=2, supporting_data_per_test=2)
+            # Six reads, in a savepoint as the test runs in a transaction
+            with self.assertNumQueries(8):
+                data = ReportData.load(mission.pk)
+            self.assertEqual(len(data.tests), size)
+
+    def test_report_generation_queries(self):
+        for size in (1, 5, 20):
+            mission = self.create_mission(size, hosts_per_test=2, supporting_data_per_test=2)
+            # Loading the report data, then recording the run
+            with self.assertNumQueries(10):
+                generate_report_or_attachments(mission.pk)
+
+
+class StatisticsQueryCountTests(MissionDataMixin, TestCase):
+    """ A mission's statistics are read with one query, however large the mission """
+
+    def test_analytics_queries(self):
+        for size in (0, 3, 25):
+            mission = self.create_mission(size)
+            with self.assertNumQueries(1):
+                analytics = MissionAnalytics(mission.pk)
+                analytics.mission_execution_percentage()
+                analytics.mission_completion_percentage()
+                analytics.count_of_findings()
+                analytics.count_of_test_cases_by_result()
+                analytics.count_of_test_cases_by_mission_week()
+                analytics.count_of_test_case_types_by_mission_week()
+            self.assertEqual(analytics.count_of_test_cases(),
+                             sum(1 for number in range(size) if self.get_test_values(number)['test_case_include_flag']))
+
+    def test_stats_view_queries(self):
+        self.client.force_login(get_user_model().objects.create_user('analyst'))
+        for size in (0, 3, 25):
+            mission = self.create_mission(size)
+            # The session, the user and the statistics
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse('mission-stats', kwargs={'mission': mission.pk}))
+            self.assertEqual(response.status_code, 200)
+
+
+class TestOrderTests(MissionDataMixin, TestCase):
+    """ Moving test cases, including between test cases whose sort positions are tied or have no room between them """
+
+    def setUp(self):
+        self.mission = self.create_mission(4)
+        self.tests = list(TestDetail.objects.filter(mission=self.mission).order_by('id'))
+
+    def get_order(self):
+        return TestSortingHelper.get_ordered_test_ids(self.mission.pk)
+
+    def assert_order(self, tests):
+        self.assertEqual(self.get_order(), [test.pk for test in tests])
+
+    def assert_spaced(self):
+        positions = list(TestDetail.objects.filter(mission=self.mission).order_by('sort_position', 'id')
+                         .values_list('sort_position', flat=True))
+        self.assertEqual(len(set(positions)), len(positions), positions)
+
+    def test_move_between_tied_positions(self):
+        a, b, c, d = self.tests
+        TestDetail.objects.filter(mission=self.mission).update(sort_position=SORT_POSITION_GAP)
+
+        TestSortingHelper.move_test(d, a)
+        self.assert_order([a, d, b, c])
+        self.assert_spaced()
+
+        TestSortingHelper.move_test(a, c)
+        self.assert_order([d, b, c, a])
+        self.assert_spaced()
+
+    def test_move_to_top_of_tied_positions(self):
+        a, b, c, d = self.tests
+        TestDetail.objects.filter(mission=self.mission).update(sort_position=SORT_POSITION_GAP)
+
+        TestSortingHelper.move_test(c)
+        self.assert_order([c, a, b, d])
+
+    def test_move_into_full_gap_respaces(self):
+        a, b, c, d = self.tests
+        for position, test in enumerate(self.tests, start=1):
+            TestDetail.objects.filter(pk=test.pk).update(sort_position=position)
+        a.refresh_from_db()
+
+        TestSortingHelper.move_test(d, a)
+        self.assert_order([a, d, b, c])
+        self.assert_spaced()
+        # Every test case but the one moved was spaced out evenly again
+        self.assertEqual(
+            [position % SORT_POSITION_GAP for position in TestDetail.objects.exclude(pk=d.pk)
+             .filter(mission=self.mission).values_list('sort_position', flat=True)], [0, 0, 0])
+
+    def test_move_view(self):
+        a, b, c, d = self.tests
+        TestDetail.objects.filter(mission=self.mission).update(sort_position=SORT_POSITION_GAP)
+        self.client.force_login(get_user_model().objects.create_user('tester'))
+
+        response = self.client.post(reverse('mission-test-move', kwargs={'mission': self.mission.pk, 'pk': b.pk}),
+                                    json.dumps({'after': c.pk, 'version': self.mission.test_order_version}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['version'], self.mission.test_order_version + 1)
+        self.assert_order([a, c, b, d])
+        self.assert_spaced()
+
+
+class OrderConflictTests(MissionDataMixin, TestCase):
+    """ A reorder based on an out of date order gets a 409 with the current order, and changes nothing """
+
+    def setUp(self):
+        self.mission = self.create_mission(3)
+        self.tests = list(TestDetail.objects.filter(mission=self.mission).order_by('sort_position', 'id'))
+        self.client.force_login(get_user_model().objects.create_user('tester'))
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_stale_move(self):
+        a, b, c = self.tests
+        stale = self.mission.test_order_version
+        TestSortingHelper.move_test(c, None)  # Someone else moves c to the top
+
+        response = self.post(reverse('mission-test-move', kwargs={'mission': self.mission.pk, 'pk': a.pk}),
+                             {'after': b.pk, 'version': stale, 'order': [a.pk, b.pk, c.pk]})
+        self.assertEqual(response.status_code, CONFLICT)
+        data = response.json()['data']
+        self.assertEqual(data['version'], stale + 1)
+        self.assertEqual(data['order'], [c.pk, a.pk, b.pk])
+        self.assertEqual(data['delta']['moved'], [{'id': c.pk, 'after': None}])
+        self.assertEqual(TestSortingHelper.get_ordered_test_ids(self.mission.pk), [c.pk, a.pk, b.pk])
+
+    def test_stale_reorder(self):
+        a, b, c = self.tests
+        stale = self.mission.test_order_version
+        TestSortingHelper.reorder_tests(self.mission.pk, [b.pk, a.pk, c.pk], stale)
+
+        response = self.post(reverse('mission-tests-reorder', kwargs={'mission': self.mission.pk}),
+                             {'order': [c.pk, b.pk, a.pk], 'version': stale})
+        self.assertEqual(response.status_code, CONFLICT)
+        self.assertEqual(response.json()['data']['order'], [b.pk, a.pk, c.pk])
+        self.assertEqual(TestSortingHelper.get_ordered_test_ids(self.mission.pk), [b.pk, a.pk, c.pk])
+
+        # Based on the current version, the same reorder goes through
+        response = self.post(reverse('mission-tests-reorder', kwargs={'mission': self.mission.pk}),
+                             {'order': [c.pk, b.pk, a.pk], 'version': stale + 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(TestSortingHelper.get_ordered_test_ids(self.mission.pk), [c.pk, b.pk, a.pk])
+
+    def test_stale_supporting_data_reorder(self):
+        test = self.create_test(self.mission, supporting_data=3)
+        first, second, third = SupportingData.objects.filter(test_detail=test).order_by('id')
+        stale = test.supporting_data_order_version
+        TestSortingHelper.reorder_supporting_data(test.pk, [third.pk, first.pk, second.pk], stale)
+
+        url = reverse('test-data-reorder', kwargs={'mission': self.mission.pk, 'test_detail': test.pk})
+        response = self.post(url, {'order': [second.pk, first.pk, third.pk], 'version': stale})
+        self.assertEqual(response.status_code, CONFLICT)
+        self.assertEqual(response.json()['data']['order'], [third.pk, first.pk, second.pk])
+        self.assertEqual([data.pk for data in TestSortingHelper.get_ordered_supporting_data(test.pk)],
+                         [third.pk, first.pk, second.pk])
+
+
+class MissionStatisticsTests(MissionDataMixin, TestCase):
+    """ The statistics kept up to date as test cases and supporting data change match those computed from scratch """
+
+    def assert_consistent(self, *missions):
+        for mission in missions:
+            kept = MissionStatistics.objects.get(pk=mission.pk)
+            self.assertEqual(kept.get_differences(MissionStatistics.compute(mission.pk)), [])
+
+    def test_create(self):
+        mission = self.create_mission(12, supporting_data_per_test=1)
+        self.assert_consistent(mission)
+        statistics = MissionStatistics.objects.get(pk=mission.pk)
+        self.assertEqual(statistics.test_cases, 10)
+        self.assertEqual(statistics.supporting_data, 12)
+
+    def test_edit(self):
+        mission = self.create_mission(12)
+        for number, test in enumerate(TestDetail.objects.filter(mission=mission).order_by('id')):
+            # Each test case takes the values of a later one, changing every field the statistics depend on
+            for name, value in self.get_test_values(number + 5).items():
+                setattr(test, name, value)
+            test.save()
+            self.assert_consistent(mission)
+
+    def test_move_to_other_mission(self):
+        mission, other = self.create_mission(6), self.create_mission(3)
+        test = TestDetail.objects.filter(mission=mission, test_case_include_flag=True).first()
+        test.mission = other
+        test.save()
+        self.assert_consistent(mission, other)
+
+    def test_delete(self):
+        mission = self.create_mission(8, supporting_data_per_test=1)
+        SupportingData.objects.filter(test_detail__mission=mission).first().delete()
+        self.assert_consistent(mission)
+
+        for test in TestDetail.objects.filter(mission=mission).order_by('id')[:5]:
+            test.delete()
+            self.assert_consistent(mission)
+
+    def test_save_of_other_fields(self):
+        mission = self.create_mission(3)
+        test = TestDetail.objects.filter(mission=mission).first()
+        test.supporting_data_sort_order = '[]'
+        with CaptureQueriesContext(connection) as queries:
+            test.save(update_fields=['supporting_data_sort_order'])
+        # Neither the test case's values before the save nor the statistics are read
+        self.assertEqual([query['sql'] for query in queries
+                          if query['sql'].startswith('SELECT') or 'missionstatistics' in query['sql']], [])
+        self.assert_consistent(mission)
+
+    def test_execution_matrix_across_new_year(self):
+        mission = self.create_mission()
+        # The third is late on a Sunday in local time, but already the next Monday in UTC
+        for moment in ('2025-12-30T10:00', '2026-01-02T15:00', '2026-01-04T23:30', '2026-01-06T09:00',
+                       '2026-01-20T12:00'):
+            test = self.create_test(mission)
+            test.attack_time_date = timezone.make_aware(datetime.fromisoformat(moment))
+            test.execution_status = 'R'
+            test.test_case_include_flag = True
+            test.save()
+        self.assert_consistent(mission)
+
+        analytics = MissionAnalytics(mission.pk)
+        weekly = analytics.get_execution_matrix()
+        self.assertEqual(weekly['periods'], [date(2025, 12, 29) + timedelta(weeks=week) for week in range(4)])
+        self.assertEqual(weekly['totals'], [3, 1, 0, 1])
+
+        daily = analytics.get_execution_matrix('day')
+        self.assertEqual((daily['periods'][0], daily['periods'][-1], len(daily['periods'])),
+                         (date(2025, 12, 30), date(2026, 1, 20), 22))
+        self.assertEqual(sum(daily['totals']), 5)
+        self.assertEqual(daily['totals'][5], 1)
+
+    def test_read_without_saving(self):
+        mission = self.create_mission(7)
+        MissionStatistics.objects.filter(pk=mission.pk).delete()
+        with CaptureQueriesContext(connection) as queries:
+            statistics = MissionStatistics.get_for_mission(mission.pk)
+        self.assertEqual([query['sql'] for query in queries if not query['sql'].startswith('SELECT')], [])
+        self.assertEqual(statistics.get_differences(MissionStatistics.compute(mission.pk)), [])
+        self.assertFalse(MissionStatistics.objects.filter(pk=mission.pk).exists())
+
+    def test_built_when_migrating(self):
+        missions = [self.create_mission(9, supporting_data_per_test=1), self.create_mission(4), self.create_mission(0)]
+        MissionStatistics.objects.all().delete()
+        import_module('missions.migrations.0014_missionstatistics').build_statistics(apps, None)
+        self.assert_consistent(*missions)
+
+
+class PortfolioAnalyticsTests(MissionDataMixin, TestCase):
+    """ The incrementally refreshed portfolio matches one rolled up from scratch """
+
+    def setUp(self):
+        PortfolioAnalytics._rollup = None
+
+    def tearDown(self):
+        PortfolioAnalytics._rollup = None
+
+    def get_rebuilt_portfolio(self):
+        PortfolioAnalytics._rollup = None
+        return PortfolioAnalytics.get_portfolio()
+
+    def assert_matches_rebuilt(self, portfolio):
+        rebuilt = self.get_rebuilt_portfolio()
+        portfolio.pop('as_of')
+        rebuilt.pop('as_of')
+        self.assertEqual(portfolio, rebuilt)
+
+    def test_totals(self):
+        self.create_mission(10, business_area='Air')
+        self.create_mission(4, business_area='Air')
+        self.create_mission(0, business_area='Sea')
+        included = [self.get_test_values(number)['test_case_include_flag'] for number in range(10)].count(True)
+
+        portfolio = PortfolioAnalytics.get_portfolio()
+        self.assertEqual(portfolio['missions'], 3)
+        self.assertEqual(portfolio['missions_with_test_cases'], 2)
+        self.assertEqual(portfolio['test_cases'], included + 4)
+        self.assertEqual([(area['name'], area['missions']) for area in portfolio['business_areas']],
+                         [('Air', 2), ('Sea', 1)])
+        self.assertEqual(sum(phase['test_cases'] for phase in portfolio['phases']), portfolio['test_cases'])
+        self.assertEqual(sum(portfolio['throughput']['totals']),
+                         sum(phase['executed'] for phase in portfolio['phases']))
+
+    def test_incremental_refresh(self):
+        mission = self.create_mission(10, business_area='Air')
+        other = self.create_mission(5, business_area='Sea')
+        PortfolioAnalytics.get_portfolio()
+
+        test = TestDetail.objects.filter(mission=mission).order_by('id').first()
+        for name, value in self.get_test_values(6).items():
+            setattr(test, name, value)
+        test.save()
+        self.create_test(other, 3)
+        TestDetail.objects.filter(mission=other).order_by('id').first().delete()
+        self.assert_matches_rebuilt(PortfolioAnalytics.get_portfolio())
+
+        other.business_area = BusinessArea.objects.get(name='Air')
+        other.save()
+        self.assert_matches_rebuilt(PortfolioAnalytics.get_portfolio())
+
+        self.create_mission(2, business_area='Land')
+        mission.delete()
+        self.assert_matches_rebuilt(PortfolioAnalytics.get_portfolio())
+
+    def test_returned_rollup_never_changes(self):
+        mission = self.create_mission(6)
+        rollup = PortfolioAnalytics.refresh()
+        totals = dict(rollup['totals'])
+
+        self.create_test(mission, 1)
+        self.create_mission(3)
+        refreshed = PortfolioAnalytics.refresh()
+        self.assertEqual(dict(rollup['totals']), totals)
+        self.assertNotEqual(dict(refreshed['totals']), totals)
+
+    def test_read_only(self):
+        self.create_mission(3)
+        left_out = self.create_mission(2)
+        MissionStatistics.objects.filter(pk=left_out.pk).delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            portfolio = PortfolioAnalytics.get_portfolio()
+        self.assertEqual([query['sql'] for query in queries if not query['sql'].startswith('SELECT')], [])
+        # Missions without statistics are left out until they are built
+        self.assertEqual(portfolio['missions'], 1)
+        self.assertFalse(MissionStatistics.objects.filter(pk=left_out.pk).exists())
+
+
+@override_settings(REPORT_ZIP_WORKERS=2)
+class ArchiveTests(SimpleTestCase):
+    """ Archives streamed by iter_zip read back intact with zipfile """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def read_back(self, files):
+        """ :return: The ZipFile of an iter_zip archive of {archive name: bytes}, checked against the files """
+        entries = []
+        for number, (name, data) in enumerate(files.items()):
+            entries.append((name, os.path.join(self.directory, str(number))))
+            with open(entries[-1][1], 'wb') as f:
+                f.write(data)
+
+        archive = zipfile.ZipFile(BytesIO(b''.join(iter_zip(entries))))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(dict((name, archive.read(name)) for name in archive.namelist()), files)
+        return archive
+
+    def test_stored_and_deflated(self):
+        archive = self.read_back({
+            'screenshot.png': MissionDataMixin.get_png(),
+            'notes.txt': b'Lorem ipsum dolor sit amet. ' * 500,
+            'capture.bin': os.urandom(50000),
+            'empty.txt': b'',
+            'r\xe9sum\xe9/notes.txt': b'Notes ' * 500,
+        })
+        self.assertEqual(dict((info.filename, info.compress_type) for info in archive.infolist()), {
+            'screenshot.png': zipfile.ZIP_STORED,
+            'notes.txt': zipfile.ZIP_DEFLATED,
+            'capture.bin': zipfile.ZIP_STORED,
+            'empty.txt': zipfile.ZIP_STORED,
+            'r\xe9sum\xe9/notes.txt': zipfile.ZIP_DEFLATED,
+        })
+
+    def test_multiple_block_deflated_entry(self):
+        data = b''.join(b'Line %d of the capture\n' % line for line in range(200000))
+        self.assertGreater(len(data), 3 * archives.ZIP_STREAM_CHUNK_SIZE)
+        for workers in (1, 2):
+            with self.settings(REPORT_ZIP_WORKERS=workers):
+                info = self.read_back({'capture.txt': data}).getinfo('capture.txt')
+                self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+                self.assertLess(info.compress_size, info.file_size)
+
+    def test_forced_zip64_entry(self):
+        class Zip64Entry(archives._ZipEntry):
+            def __init__(self, *args):
+                super(Zip64Entry, self).__init__(*args)
+                self.zip64 = True
+
+        with mock.patch.object(archives, '_ZipEntry', Zip64Entry):
+            archive = self.read_back({'notes.txt': b'Notes ' * 500, 'screenshot.png': MissionDataMixin.get_png()})
+
+        data = archive.fp.getvalue()
+        for info in archive.infolist():
+            self.assertEqual(info.extract_version, 45)
+            # The local header's zip64 extra field, and the 64-bit sizes of the data descriptor after the data
+            name_length, extra_length = struct.unpack('<HH', data[info.header_offset + 26:info.header_offset + 30])
+            extra = info.header_offset + 30 + name_length
+            self.assertEqual(data[extra:extra + 4], struct.pack('<HH', 0x0001, 16))
+            descriptor = extra + extra_length + info.compress_size
+            self.assertEqual(archives.DATA_DESCRIPTOR64.unpack(data[descriptor:descriptor + 24]),
+                             (0x08074b50, info.CRC, info.compress_size, info.file_size))
+
+
+@override_settings(REPORT_FRAGMENT_CACHE_ENABLED=True, REPORT_PREFETCH_WORKERS=0, REPORT_SHARD_WORKERS=0,
+                   CACHES=dict(settings.CACHES, report_fragments={
+                       'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                       'LOCATION': 'report-fragment-tests',
+                   }))
+class ReportFragmentTests(MissionDataMixin, TestCase):
+    """ A report reusing cached test case fragments matches one rendered from scratch """
+
+    def setUp(self):
+        ReportFragmentCache.get_cache().clear()
+
+    @staticmethod
+    def get_contents(report):
+        """ :return: The text of every run in the report's body (tables included), and its number of pictures """
+        document = Document(report)
+        return [text.text for text in document.element.body.iter(qn('w:t'))], len(document.inline_shapes)
+
+    def test_reuse_after_edit(self):
+        mission = self.create_mission(8, supporting_data_per_test=1)
+        generate_report_or_attachments(mission.pk)
+
+        test = TestDetail.objects.filter(mission=mission, test_case_include_flag=True).order_by('sort_position')[1]
+        test.test_objective = 'Edited objective'
+        test.save()
+        report, name = generate_report_or_attachments(mission.pk)
+        run = ReportRun.objects.filter(mission=mission).latest('id')
+        self.assertEqual(run.fragments_reused, run.test_cases - 1)
+
+        with report:
+            contents = self.get_contents(report)
+        self.assertIn('Edited objective', contents[0])
+
+        with self.settings(REPORT_FRAGMENT_CACHE_ENABLED=False):
+            rendered, name = generate_report_or_attachments(mission.pk)
+        with rendered:
+            self.assertEqual(contents, self.get_contents(rendered))
+
+
+@override_settings(REPORT_JOB_RUNNER='external', REPORT_FRAGMENT_CACHE_ENABLED=False, REPORT_PREFETCH_WORKERS=0,
+                   REPORT_SHARD_WORKERS=0)
+class ReportJobRunnerTests(MissionDataMixin, TestCase):
+    """ Jobs are claimed once, shared while pending, and failed or left alone when their process goes quiet """
+
+    def make_stale(self, job):
+        ReportJob.objects.filter(pk=job.pk).update(heartbeat_at=ReportJobRunner.get_stale_cutoff() - timedelta(1))
+        job.refresh_from_db()
+
+    def test_claim_and_run(self):
+        mission = self.create_mission(3)
+        job = ReportJobRunner.submit(mission.pk, ReportJob.KIND_REPORT)
+        self.assertEqual((job.status, job.runner), (ReportJob.STATUS_QUEUED, ''))
+        self.assertEqual(ReportJobRunner.submit(mission.pk, ReportJob.KIND_REPORT), job)
+
+        self.assertTrue(ReportJobRunner.claim(job.pk))
+        self.assertFalse(ReportJobRunner.claim(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.runner), (ReportJob.STATUS_RUNNING, ReportJobRunner.get_runner_id()))
+
+        job = ReportJobRunner.run(job.pk)
+        self.assertEqual(job.status, ReportJob.STATUS_COMPLETE)
+        # The output is the cached artifact under the job's own name
+        with ReportArtifactCache.fetch(mission.pk)[0] as cached:
+            self.assertTrue(os.path.samefile(cached.name, job.output_path))
+
+    def test_recover(self):
+        mission = self.create_mission(2)
+        running = ReportJobRunner.submit(mission.pk, ReportJob.KIND_REPORT)
+        ReportJobRunner.claim(running.pk)
+        queued = ReportJobRunner.submit(mission.pk, ReportJob.KIND_ATTACHMENTS)
+        live = ReportJobRunner.submit(self.create_mission(1).pk, ReportJob.KIND_REPORT)
+        ReportJobRunner.claim(live.pk)
+        self.make_stale(running)
+        self.make_stale(queued)
+        self.assertTrue(ReportJobRunner.is_stale(running))
+        # Jobs queued for an external worker wait for it however long that takes
+        self.assertFalse(ReportJobRunner.is_stale(queued))
+
+        ReportJobRunner.recover_stale_jobs()
+        for job in (running, queued, live):
+            job.refresh_from_db()
+        self.assertEqual((running.status, running.message), (ReportJob.STATUS_FAILED, ReportJobRunner.STALE_MESSAGE))
+        self.assertEqual(queued.status, ReportJob.STATUS_QUEUED)
+        self.assertEqual(live.status, ReportJob.STATUS_RUNNING)
+
+        self.assertEqual(ReportJobRunner.submit(mission.pk, ReportJob.KIND_ATTACHMENTS), queued)
+        self.assertNotEqual(ReportJobRunner.submit(mission.pk, ReportJob.KIND_REPORT), running)
+
+        # A job recovered while it was running keeps its outcome
+        live = ReportJobRunner.run(live.pk)
+        self.assertEqual(live.status, ReportJob.STATUS_COMPLETE)
+        self.assertEqual(ReportJobRunner.run(running.pk).status, ReportJob.STATUS_FAILED)
+        self.assertFalse(os.path.exists(os.path.join(ReportJobRunner.get_output_dir(), 'job_{0}.docx'.format(
+            running.pk))))
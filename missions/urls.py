@@ -22,6 +22,10 @@ urlpatterns = [
         login_required(missions.views.ListMissionView.as_view()), name='missions-list'),
     url(r'^new/$',
         login_required(missions.views.CreateMissionView.as_view()), name='missions-new'),
+    url(r'^portfolio/$',
+        login_required(missions.views.PortfolioView.as_view()), name='portfolio'),
+    url(r'^portfolio/data/$',
+        login_required(missions.views.PortfolioDataView.as_view()), name='portfolio-data'),
     url(r'^(?P<pk>\d+)/$',
         login_required(missions.views.EditMissionView.as_view()), name='missions-edit',),
     url(r'^(?P<pk>\d+)/delete/$',
@@ -30,6 +34,14 @@ urlpatterns = [
         login_required(missions.views.ReportMissionView.as_view()), name='mission-report',),
     url(r'^(?P<mission>\d+)/attachments/$',
         login_required(missions.views.ReportAttachmentsMissionView.as_view()), name='mission-attachments', ),
+    url(r'^(?P<mission>\d+)/report/jobs/$',
+        login_required(missions.views.SubmitReportJobView.as_view()), name='mission-report-jobs',),
+    url(r'^(?P<mission>\d+)/report/jobs/(?P<pk>\d+)/$',
+        login_required(missions.views.ReportJobStatusView.as_view()), name='mission-report-job',),
+    url(r'^(?P<mission>\d+)/report/jobs/(?P<pk>\d+)/download/$',
+        login_required(missions.views.DownloadReportJobView.as_view()), name='mission-report-job-download',),
+    url(r'^(?P<mission>\d+)/report/runs/$',
+        login_required(missions.views.ReportRunHistoryView.as_view()), name='mission-report-runs',),
     url(r'^(?P<mission>\d+)/stats/$',
         login_required(missions.views.MissionStatsView.as_view()), name='mission-stats',),
     url(r'^(?P<mission_id>\d+)/hosts/$',
@@ -50,6 +62,8 @@ urlpatterns = [
         login_required(missions.views.CloneMissionTestView.as_view()), name='mission-tests-clone'),
     url(r'^(?P<mission>\d+)/tests/reorder/$',
         login_required(missions.views.OrderMissionTestsView.as_view()), name='mission-tests-reorder'),
+    url(r'^(?P<mission>\d+)/tests/(?P<pk>\d+)/move/$',
+        login_required(missions.views.MoveMissionTestView.as_view()), name='mission-test-move'),
     url(r'^(?P<mission_id>\d+)/tests/(?P<test_id>\d+)/hosts',
         login_required(missions.views.test_host_handler), name='test-hosts'),
 
@@ -15,9 +15,8 @@
 
 import json
 import logging
-import time
 from calendar import timegm
-from http.client import BAD_REQUEST, NOT_ACCEPTABLE
+from http.client import BAD_REQUEST, CONFLICT, GONE, NOT_ACCEPTABLE, NOT_FOUND, SERVICE_UNAVAILABLE
 from itertools import chain
 
 from django.contrib import messages
@@ -25,9 +24,9 @@ from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from django.core.signing import Signer
+from django.db import transaction
 from django.urls import reverse, reverse_lazy, resolve
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse
 from django.http.response import JsonResponse
 from django.shortcuts import redirect
 from django.utils.html import conditional_escape
@@ -35,11 +34,14 @@ from django.utils.timezone import now
 from django.views.decorators.http import require_http_methods
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView, View, DeleteView
 
-from .extras.helpers.analytics import MissionAnalytics
-from .extras.helpers.sorters import TestSortingHelper
-from .extras.utils import ReturnStatus, generate_report_or_attachments
+from .extras.helpers.analytics import MissionAnalytics, PortfolioAnalytics
+from .extras.helpers.artifacts import ReportArtifactCache
+from .extras.helpers.jobs import ReportJobRunner
+from .extras.helpers.locks import LockTimeout, ReportBuildSlots
+from .extras.helpers.sorters import TestSortingHelper, SortOrderConflict
+from .extras.utils import ReturnStatus
 from .models import Mission, TestDetail, SupportingData, DARTDynamicSettings, Host, BusinessArea, \
-    ClassificationLegend, Color
+    ClassificationLegend, Color, ReportJob, ReportRun
 
 logger = logging.getLogger(__name__)
 
@@ -190,7 +192,23 @@ class DeleteMissionView(DeleteView):
         return reverse('missions-list')
 
 
-class ReportMissionView(View):
+class ReportArtifactView(View):
+    """
+    Base for views serving a report or supporting data package straight away, building it if it isn't cached. They
+    only wait REPORT_BUILD_WAIT_TIMEOUT seconds for other builds; past that the client is asked to retry (or can
+    queue the build as a report job) instead of holding on to a web server worker.
+    """
+
+    @staticmethod
+    def busy_response():
+        retry_after = max(1, int(ReportBuildSlots.get_wait_timeout()))
+        response = HttpResponse("Reports are busy being generated; please try again in a moment.",
+                                status=SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(retry_after)
+        return response
+
+
+class ReportMissionView(ReportArtifactView):
 
     def get(self, request, *args, **kwargs):
 
@@ -198,16 +216,20 @@ class ReportMissionView(View):
 
         logger.debug('GET: ReportMissionView ({mission_id})'.format(mission_id=mission_id))
 
-        io_stream, name = generate_report_or_attachments(mission_id, zip_attachments=False)
+        try:
+            report_file, name = ReportArtifactCache.fetch(mission_id, zip_attachments=False,
+                                                          timeout=ReportBuildSlots.get_wait_timeout())
+        except LockTimeout:
+            return self.busy_response()
         docx_name = name + "_" + str(mission_id)
 
-        response= HttpResponse(io_stream.getvalue(), content_type='text/plain')
+        response = FileResponse(report_file, content_type='text/plain')
         response['Content-Disposition'] = 'attachment; filename={}_mission_report.docx'.format(docx_name)
         #response['Content-Disposition'] = 'attachment; filename={}_mission_report.zip'.format(mission_id)
         return response
 
 
-class ReportAttachmentsMissionView(View):
+class ReportAttachmentsMissionView(ReportArtifactView):
 
     def get(self, request, *args, **kwargs):
 
@@ -215,14 +237,100 @@ class ReportAttachmentsMissionView(View):
 
         logger.debug('GET: ReportAttachmentsMissionView ({mission_id})'.format(mission_id=mission_id))
 
-        io_stream, name = generate_report_or_attachments(mission_id, zip_attachments=True)
+        # A file when the package is cached, otherwise zip chunks streamed out as the package is built (the build
+        # doesn't wait on the download; see ReportArtifactCache.stream_attachments)
+        try:
+            zip_file, name = ReportArtifactCache.stream_attachments(mission_id,
+                                                                    timeout=ReportBuildSlots.get_wait_timeout())
+        except LockTimeout:
+            return self.busy_response()
         zip_name = name + "_" + str(mission_id)
 
-        response = HttpResponse(io_stream.getvalue(), content_type='application/octet-stream')
+        response = FileResponse(zip_file, content_type='application/octet-stream')
         response['Content-Disposition'] = 'attachment; filename={}_supporting_data.zip'.format(zip_name)
         return response
 
 
+class SubmitReportJobView(View):
+
+    def post(self, request, *args, **kwargs):
+        """ Queues a report or supporting data package build; accepts {"kind": "REPORT" | "ATTACHMENTS"} """
+
+        mission_id = kwargs.get('mission')
+
+        try:
+            data = json.loads(request.body) if len(request.body) > 0 else {}
+            kind = data.get('kind', ReportJob.KIND_REPORT)
+        except (ValueError, AttributeError):
+            return JsonResponse(ReturnStatus(False, 'Invalid json received').to_dict(), status=BAD_REQUEST)
+
+        if kind not in dict(ReportJob.KIND_OPTIONS):
+            return JsonResponse(ReturnStatus(False, 'Unknown job kind.').to_dict(), status=BAD_REQUEST)
+
+        if not Mission.objects.filter(pk=mission_id).exists():
+            return JsonResponse(ReturnStatus(False, 'Unable to locate mission.').to_dict(), status=NOT_FOUND)
+
+        logger.debug('POST: SubmitReportJobView ({mission_id}, {kind})'.format(mission_id=mission_id, kind=kind))
+
+        job = ReportJobRunner.submit(mission_id, kind, user=request.user)
+        return JsonResponse(ReturnStatus(message='Queued', data=ReportJobStatusView.job_to_dict(job)).to_dict())
+
+
+class ReportJobStatusView(View):
+
+    @staticmethod
+    def job_to_dict(job):
+        # A job whose process has gone away is shown as failed; it's marked as such by the next submission or worker
+        # run (see ReportJobRunner.recover_stale_jobs) rather than by the page polling it
+        stale = ReportJobRunner.is_stale(job)
+        return {
+            'id': job.pk,
+            'kind': job.kind,
+            'status': ReportJob.STATUS_FAILED if stale else job.status,
+            'phase': job.phase,
+            'progress_current': job.progress_current,
+            'progress_total': job.progress_total,
+            'images_embedded': job.images_embedded,
+            'message': ReportJobRunner.STALE_MESSAGE if stale else
+            job.message if job.status == ReportJob.STATUS_FAILED else '',
+            'status_url': reverse('mission-report-job', kwargs={'mission': job.mission_id, 'pk': job.pk}),
+            'download_url': reverse('mission-report-job-download', kwargs={'mission': job.mission_id, 'pk': job.pk})
+            if job.status == ReportJob.STATUS_COMPLETE else '',
+        }
+
+    def get(self, request, *args, **kwargs):
+        try:
+            job = ReportJob.objects.get(pk=kwargs.get('pk'), mission=kwargs.get('mission'))
+        except ReportJob.DoesNotExist:
+            return JsonResponse(ReturnStatus(False, 'No such report job.').to_dict(), status=NOT_FOUND)
+
+        data = self.job_to_dict(job)
+        return JsonResponse(ReturnStatus(message=dict(ReportJob.STATUS_OPTIONS)[data['status']], data=data).to_dict())
+
+
+class DownloadReportJobView(View):
+
+    def get(self, request, *args, **kwargs):
+        try:
+            job = ReportJob.objects.get(pk=kwargs.get('pk'), mission=kwargs.get('mission'))
+        except ReportJob.DoesNotExist:
+            return HttpResponse("Report job not found.", status=NOT_FOUND)
+
+        if job.status != ReportJob.STATUS_COMPLETE:
+            return HttpResponse("Report job has not completed.", status=CONFLICT)
+
+        logger.debug('GET: DownloadReportJobView ({job})'.format(job=job))
+
+        try:
+            output = open(job.output_path, 'rb')
+        except OSError:
+            logger.warning('Output of {job} is missing: {path}'.format(job=job, path=job.output_path))
+            return HttpResponse("Report job output is no longer available; please generate it again.", status=GONE)
+
+        return FileResponse(output, as_attachment=True, filename=job.output_name,
+                            content_type='application/octet-stream')
+
+
 class MissionStatsView(TemplateView):
     template_name = 'mission_stats_partial.html'
 
@@ -234,6 +342,54 @@ class MissionStatsView(TemplateView):
         return context
 
 
+class PortfolioView(TemplateView):
+    """ Analytics across every mission (see PortfolioAnalytics) """
+    template_name = 'portfolio.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(PortfolioView, self).get_context_data(**kwargs)
+
+        context['portfolio'] = PortfolioAnalytics.get_portfolio()
+
+        return context
+
+
+class PortfolioDataView(View):
+    """ The portfolio analytics as JSON; rates are fractions and dates ISO 8601 """
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(ReturnStatus(data=PortfolioAnalytics.get_portfolio()).to_dict())
+
+
+class ReportRunHistoryView(TemplateView):
+    """
+    The mission's recent report & data package runs with their phase timings; runs taking more than SLOW_RUN_FACTOR
+    times the usual (median) duration of the same kind of run are flagged.
+    """
+    template_name = 'report_run_history_partial.html'
+
+    SLOW_RUN_FACTOR = 2
+
+    def get_context_data(self, **kwargs):
+        context = super(ReportRunHistoryView, self).get_context_data(**kwargs)
+
+        runs = list(ReportRun.objects.filter(mission_id=self.kwargs['mission']).order_by('-started_at', '-id'))
+
+        usual_durations = {}
+        for kind, kind_name in ReportJob.KIND_OPTIONS:
+            durations = sorted(r.duration for r in runs if r.kind == kind and r.succeeded)
+            if len(durations) >= 3:
+                usual_durations[kind] = durations[len(durations) // 2]
+
+        for r in runs:
+            r.phases = r.get_phase_timings()
+            r.is_slow = r.kind in usual_durations and r.duration > usual_durations[r.kind] * self.SLOW_RUN_FACTOR
+            r.ms_per_test_case = r.duration * 1000 / r.test_cases if r.test_cases else None
+
+        context['runs'] = runs
+        return context
+
+
 class ListMissionTestsView(ListView):
     model = TestDetail
     template_name = 'mission_list_tests.html'
@@ -243,53 +399,112 @@ class ListMissionTestsView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super(ListMissionTestsView, self).get_context_data(**kwargs)
-        tests = self.get_queryset()
 
-        context['tests'] = tests
+        # Read before the tests, so the order's version shown is never newer than the order itself
         context['this_mission'] = Mission.objects.get(id=self.kwargs['mission'])
+        tests = self.get_queryset()
+
+        # Counted for every test case at once rather than one query per row
+        data_by_test = TestSortingHelper.get_mission_supporting_data(self.kwargs['mission'],
+                                                                     reportable_supporting_data_only=False)
+        for t in tests:
+            t.supporting_data = data_by_test.get(t.id, [])
 
-        context['server_timestamp'] = Signer().sign(time.time())
+        context['tests'] = tests
         return context
 
 
-class OrderMissionTestsView(View):
+class ReorderView(View):
+    """ Base for views which reorder test cases or supporting data, with optimistic concurrency """
+
+    @staticmethod
+    def get_order_version(data):
+        """ :return: The sort order version a posted reorder is based on, or None if it didn't say """
+        version = data.get('version')
+        return int(version) if version is not None else None
+
+    @staticmethod
+    def conflict_response(conflict, client_order, what):
+        """ 409 response to a reorder based on an out of date order, with the current order and what changed """
+        rs = ReturnStatus(False, 'The order of the {what} has been changed by someone else.'.format(what=what), data={
+            'version': conflict.version,
+            'order': conflict.order,
+            'delta': TestSortingHelper.get_order_delta(client_order, conflict.order),
+        })
+        return JsonResponse(rs.to_dict(), status=CONFLICT)
+
+
+class OrderMissionTestsView(ReorderView):
     def post(self, request, *args, **kwargs):
-        """ Accepts a posted JSON string to specify new test case sort order """
+        """
+        Accepts a posted JSON string to specify new test case sort order:
+        {"order": [test case ids], "version": the test_order_version the order is based on}
+        """
         mission_id = self.kwargs['mission']
-        new_order = []
 
         # Ensure the received value is just ints
         try:
             data = json.loads(request.body)
-            for i in data['order']:
-                new_order.append(int(i))
-        except ValueError:
+            new_order = [int(i) for i in data['order']]
+            version = self.get_order_version(data)
+        except (ValueError, TypeError, KeyError):
             logger.exception('POST: OrderMissionTestsView received non-ints')
-            raise  # Maybe do something else here one day
+            return JsonResponse(ReturnStatus(False, 'Invalid json received').to_dict(), status=BAD_REQUEST)
 
-        # A user with a stale Tests list may override a newer sort order inadvertently
-        # TODO: Add confirmation check if data['server_timestamp'] is older than the last update of the db field
+        # Test cases created since the page was rendered to this user aren't in the posted order; they keep their
+        # place at the tail end so they don't disappear. A user with a stale Tests list gets the current order back
+        # instead of overriding a newer one.
+        try:
+            version = TestSortingHelper.reorder_tests(mission_id, new_order, version)
+        except SortOrderConflict as conflict:
+            return self.conflict_response(conflict, new_order, 'test cases')
+
+        rs = ReturnStatus(message="Order Updated", data={'version': version})
+        return HttpResponse(rs.to_json())
+
+
+class MoveMissionTestView(ReorderView):
+    def post(self, request, *args, **kwargs):
+        """
+        Moves a test case to just after another one:
+        {"after": test case id, or null for the top, "version": the test_order_version the move is based on,
+         "order": optional list of the test case ids as the client now has them, used to describe any conflict}
+        """
+        mission_id = int(self.kwargs['mission'])
+
+        try:
+            data = json.loads(request.body)
+            after_id = data.get('after')
+            after_id = int(after_id) if after_id is not None else None
+            version = self.get_order_version(data)
+            client_order = [int(i) for i in data.get('order') or []]
+        except (ValueError, TypeError, AttributeError):
+            return JsonResponse(ReturnStatus(False, 'Invalid json received').to_dict(), status=BAD_REQUEST)
 
         try:
-            tests = TestDetail.objects.filter(mission=self.kwargs['mission'])
+            test = TestDetail.objects.get(pk=self.kwargs['pk'], mission=mission_id)
+            after_test = TestDetail.objects.get(pk=after_id, mission=mission_id) if after_id is not None else None
         except TestDetail.DoesNotExist:
-            tests = ()
-
-        # Update mission record with the new order
-        mission = Mission.objects.get(pk=mission_id)
-        current_order = json.loads(mission.testdetail_sort_order)
-
-        # Check to see if new test cases have been created since the page was rendered to this user
-        # if so, just append the missing test cases to the tail end so they don't disappear
-        if len(new_order) < len(current_order):
-            for i in current_order:
-                if i not in new_order:
-                    new_order.append(i)
-
-        mission.testdetail_sort_order = json.dumps(new_order)
-        mission.save(update_fields=['testdetail_sort_order'])
-        rs = ReturnStatus(message="Order Updated")
-        return HttpResponse(rs.to_json())
+            return JsonResponse(ReturnStatus(False, 'Test case not found in this mission.').to_dict(),
+                                status=NOT_FOUND)
+
+        if after_test is not None and after_test.pk == test.pk:
+            return JsonResponse(ReturnStatus(False, 'A test case can not follow itself.').to_dict(),
+                                status=BAD_REQUEST)
+
+        logger.debug('POST: MoveMissionTestView ({test} after {after})'.format(test=test.pk, after=after_id))
+
+        try:
+            version = TestSortingHelper.move_test(test, after_test, version)
+        except SortOrderConflict as conflict:
+            return self.conflict_response(conflict, client_order, 'test cases')
+
+        return JsonResponse(ReturnStatus(message='Moved', data={
+            'id': test.pk,
+            'after': after_id,
+            'sort_position': test.sort_position,
+            'version': version,
+        }).to_dict())
 
 
 class CloneMissionTestView(View):
@@ -308,8 +523,10 @@ class CloneMissionTestView(View):
         if test_case.mission.id != passed_mission_id:
             return HttpResponse("Test case not linked to specified mission.", status=400)
 
+        # Supporting data isn't cloned, so neither is its order; the clone goes to the end of the mission's list
         test_case.pk = None
         test_case.test_case_status = 'NEW'
+        test_case.supporting_data_sort_order = '[]'
         test_case.save()
 
         return HttpResponse(reverse_lazy('mission-test-edit',
@@ -450,6 +667,9 @@ class ListMissionTestsSupportingDataView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super(ListMissionTestsSupportingDataView, self).get_context_data(**kwargs)
+
+        # Read before the supporting data, so the order's version shown is never newer than the order itself
+        context['this_test'] = TestDetail.objects.get(id=self.kwargs['test_detail'])
         testdata = self.get_queryset()
         paginator = Paginator(testdata, 10)
         page = self.request.GET.get('page')
@@ -463,7 +683,6 @@ class ListMissionTestsSupportingDataView(ListView):
             show_data = paginator.page(paginator.num_pages)
         context['show_data'] = show_data
         context['this_mission'] = Mission.objects.get(id=self.kwargs['mission'])
-        context['this_test'] = TestDetail.objects.get(id=self.kwargs['test_detail'])
         return context
 
 
@@ -520,36 +739,33 @@ class DeleteMissionTestsSupportingDataView(DeleteView):
         return reverse('test-data-list', kwargs={'mission': self.kwargs['mission'], 'test_detail': self.kwargs['test_detail']})
 
 
-class OrderMissionTestsSupportingDataView(View):
+class OrderMissionTestsSupportingDataView(ReorderView):
     def post(self, request, *args, **kwargs):
-        """ Accepts a posted JSON string to specify new test case sort order """
-        mission_id = self.kwargs['mission']
+        """
+        Accepts a posted JSON string to specify new supporting data sort order:
+        {"order": [supporting data ids], "version": the supporting_data_order_version the order is based on}
+        """
         test_detail_id = self.kwargs['test_detail']
-        new_order = []
 
         # Ensure the received value is just ints
         try:
             data = json.loads(request.body)
-            for i in data['order']:
-                new_order.append(int(i))
-        except ValueError:
+            new_order = [int(i) for i in data['order']]
+            version = self.get_order_version(data)
+        except (ValueError, TypeError, KeyError):
             logger.exception('POST: OrderMissionTestsSupportingDataView received non-ints')
-            raise
-
-        # Update testdetail record with the new order
-        testdetail = TestDetail.objects.get(pk=test_detail_id)
-        current_order = json.loads(testdetail.supporting_data_sort_order)
-
-        # Check to see if new supporting data has been have been created since the page was rendered to this user
-        # if so, just append the missing data to the tail end so they don't disappear
-        if len(new_order) < len(current_order):
-            for i in current_order:
-                if i not in new_order:
-                    new_order.append(i)
-
-        testdetail.supporting_data_sort_order = json.dumps(new_order)
-        testdetail.save(update_fields=['supporting_data_sort_order'])
-        rs = ReturnStatus(message="Supporting Data Order Updated")
+            return JsonResponse(ReturnStatus(False, 'Invalid json received').to_dict(), status=BAD_REQUEST)
+
+        # Supporting data created since the page was rendered to this user is kept at the tail end so it doesn't
+        # disappear, and a reorder based on an out of date order gets the current order back
+        try:
+            version = TestSortingHelper.reorder_supporting_data(test_detail_id, new_order, version)
+        except TestDetail.DoesNotExist:
+            return JsonResponse(ReturnStatus(False, 'Test case not found.').to_dict(), status=NOT_FOUND)
+        except SortOrderConflict as conflict:
+            return self.conflict_response(conflict, new_order, 'supporting data')
+
+        rs = ReturnStatus(message="Supporting Data Order Updated", data={'version': version})
         return HttpResponse(rs.to_json())
 
 